@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+"""Compiled single step acting of a model/distribution pair."""
+from typing import List, Tuple, Union
+
+import numpy as np
+import tensorflow as tf
+
+from agent.policies import BasePolicyDistribution
+from utilities.model_utils import is_recurrent_model, reset_states_masked, get_recurrent_states
+from utilities.util import add_state_dims
+
+
+class ActStep:
+    """Compiled act step of a policy model and the distribution it predicts.
+
+    A single call takes a batch of states, runs the model and samples from the predicted distribution inside one
+    tf.function with a fixed input signature. This avoids the per call overhead of Keras' predict and eager operations
+    on tiny tensors, which otherwise dominates the time spent on every environment step."""
+
+    def __init__(self, model: tf.keras.Model, distribution: BasePolicyDistribution, with_value: bool = True,
+                 deterministic: bool = False):
+        """Compile the act step of a model.
+
+        Args:
+            model (tf.keras.Model):     a joint model whose last output is the value estimate, or a policy model
+            distribution:               the distribution whose parameters the model predicts
+            with_value (bool):          if True (default), the last model output is returned as value estimate,
+                                        otherwise the model has no value head and zeros are returned instead
+            deterministic (bool):       if True, choose the most likely action instead of sampling
+        """
+        self.model = model
+        self.distribution = distribution
+        self.with_value = with_value
+        self.deterministic = deterministic
+
+        self.is_recurrent = is_recurrent_model(model)
+        self.input_specs = [tf.TensorSpec(shape=i.shape, dtype=i.dtype) for i in model.inputs]
+
+        self._step = tf.function(self._act, input_signature=[self.input_specs])
+
+    def _act(self, states):
+        outputs = tf.nest.flatten(self.model(states, training=False))
+
+        if self.with_value:
+            parameters, value = outputs[:-1], tf.reshape(outputs[-1], [-1])
+        else:
+            parameters, value = outputs, None
+
+        # recurrent models predict for a sequence of length one
+        if self.is_recurrent:
+            parameters = [tf.squeeze(p, axis=1) for p in parameters]
+
+        if self.deterministic:
+            action = self.distribution.act_deterministic_in_graph(*parameters)
+            log_probability = tf.zeros(tf.shape(action)[:1])
+        else:
+            action, log_probability = self.distribution.act_in_graph(*parameters)
+
+        if value is None:
+            value = tf.zeros(tf.shape(action)[:1])
+
+        return action, log_probability, value
+
+    def __call__(self, states: Union[np.ndarray, Tuple]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Act on a batch of states (without time dimension).
+
+        Returns:
+            the actions, their log probabilities and the value estimates of the states, all batched
+        """
+        if self.is_recurrent:
+            states = add_state_dims(states, dims=1, axis=1)
+
+        states = list(states) if isinstance(states, tuple) else [states]
+        states = [np.asarray(s, dtype=spec.dtype.as_numpy_dtype) for s, spec in zip(states, self.input_specs)]
+
+        action, log_probability, value = self._step(states)
+
+        return action.numpy(), log_probability.numpy(), value.numpy()
+
+    def set_weights(self, weights):
+        """Set the weights of the underlying model."""
+        self.model.set_weights(weights)
+
+    def reset_states(self, mask: Union[list, np.ndarray] = None):
+        """Reset the states of the potentially recurrent model, only at the samples given by the mask if any."""
+        if mask is None:
+            self.model.reset_states()
+        else:
+            reset_states_masked(self.model, mask)
+
+    def get_states(self) -> List[np.ndarray]:
+        """Get copies of the states of the potentially recurrent model."""
+        return [state.numpy() for state in get_recurrent_states(self.model)]
+
+    def set_states(self, states: List[np.ndarray], mask: Union[list, np.ndarray] = None):
+        """Set the states of the potentially recurrent model, only at the samples given by the mask if any."""
+        for variable, state in zip(get_recurrent_states(self.model), states):
+            if mask is not None:
+                state = np.where(np.reshape(mask, (-1, 1)), state, variable.numpy())
+            variable.assign(state)
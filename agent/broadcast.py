@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""Distribution of model weights from the learner to its workers."""
+from collections import namedtuple
+from typing import List
+
+import numpy as np
+import ray
+import tensorflow as tf
+
+WeightPackage = namedtuple("WeightPackage", ["version", "reference", "shapes", "dtypes"])
+
+
+def flatten_weights(weights: List[np.ndarray], dtype=np.float32) -> np.ndarray:
+    """Concatenate a list of weight arrays into one flat contiguous array of the given dtype."""
+    flat = np.empty(sum(w.size for w in weights), dtype=dtype)
+
+    offset = 0
+    for w in weights:
+        flat[offset:offset + w.size] = w.ravel()
+        offset += w.size
+
+    return flat
+
+
+def unflatten_weights(flat: np.ndarray, shapes: List[tuple], dtypes: List[str]) -> List[np.ndarray]:
+    """Split a flat weight array back into arrays of the given shapes and dtypes. Arrays that already have the right
+    dtype are views into the flat array."""
+    weights, offset = [], 0
+    for shape, dtype in zip(shapes, dtypes):
+        size = int(np.prod(shape))
+        weights.append(flat[offset:offset + size].reshape(shape).astype(dtype, copy=False))
+        offset += size
+
+    return weights
+
+
+def unpack_weights(package: WeightPackage) -> List[np.ndarray]:
+    """Get the list of weight arrays from a package, fetching them from the object store if necessary."""
+    flat = package.reference if isinstance(package.reference, np.ndarray) else ray.get(package.reference)
+
+    return unflatten_weights(flat, package.shapes, package.dtypes)
+
+
+class WeightDistributor:
+    """Publishes the weights of a model once per version for any number of workers.
+
+    Instead of sending the list of weight arrays to every worker, which makes Ray serialize it again for each actor,
+    the weights are packed into one flat buffer that is put into the object store once. Workers receive a light
+    package holding the version and a reference to this buffer. Since the reference is nested in the package, Ray
+    does not resolve it on the call, s.t. workers that already hold the version never fetch the buffer."""
+
+    def __init__(self, dtype: str = "float32"):
+        """Initialize the distributor.
+
+        Args:
+            dtype (str):    the dtype of the broadcast buffer, 'float32' (default) or 'float16' to halve the
+                            transported size at the cost of precision in the workers
+        """
+        assert dtype in ["float32", "float16"], "Unknown broadcast dtype. Choose one of (float32, float16)."
+
+        self.dtype = dtype
+
+        self.package: WeightPackage = None
+
+    def publish(self, model: tf.keras.Model, version: int, use_object_store: bool = True) -> WeightPackage:
+        """Get the package of the model's weights at the given version, only packing them if the version is new.
+
+        Args:
+            model (tf.keras.Model):     the model whose weights are distributed
+            version (int):              the version of the weights, e.g. the number of updates the learner made
+            use_object_store (bool):    if False, the buffer is part of the package itself, e.g. for local workers
+        """
+        if self.package is not None and self.package.version == version:
+            return self.package
+
+        weights = model.get_weights()
+        flat = flatten_weights(weights, dtype=self.dtype)
+
+        self.package = WeightPackage(version=version,
+                                     reference=ray.put(flat) if use_object_store else flat,
+                                     shapes=[w.shape for w in weights],
+                                     dtypes=[w.dtype.str for w in weights])
+
+        return self.package
@@ -2,7 +2,7 @@
 """Core methods providing functionality to the agent."""
 import random
 from itertools import accumulate
-from typing import List
+from typing import List, Tuple
 
 import numpy as np
 import tensorflow as tf
@@ -64,7 +64,40 @@ def estimate_episode_advantages(rewards, values, gamma, lam):
     return lfilter([1], [1, float(-(gamma * lam))], deltas[::-1], axis=0)[::-1].astype(NP_FLOAT_PREC)
 
 
-@tf.function
+def estimate_batched_advantages(rewards: np.ndarray, values: np.ndarray, dones: np.ndarray, last_values: np.ndarray,
+                                gamma: float, lam: float) -> Tuple[np.ndarray, np.ndarray]:
+    """Generalized Advantage Estimation for the trajectories of several environments at once.
+
+    All environments are processed together in one backward pass over time, vectorized over the environments. Episodes
+    may end anywhere in the trajectories; the estimation restarts after every done flag.
+
+    :param rewards:             rewards of shape (T, N), where r[t, n] is the reward for taking a[t, n] in s[t, n]
+    :param values:              value estimations of shape (T, N) for the visited states
+    :param dones:               boolean flags of shape (T, N), true if s[t + 1, n] is the terminal state of an episode
+    :param last_values:         value estimations of shape (N,) for the states following the last visited states, used
+                                to bootstrap episodes truncated by the end of the trajectories
+    :param gamma:               a discount factor weighting the importance of future rewards
+    :param lam:                 GAE's lambda parameter compromising between bias and variance
+
+    :return:                    the advantages and returns, both of shape (T, N)
+    """
+    if not np.shape(rewards) == np.shape(values) == np.shape(dones):
+        raise ValueError("Rewards, values and dones must have the same shape.")
+
+    rewards, values = np.asarray(rewards, dtype=NP_FLOAT_PREC), np.asarray(values, dtype=NP_FLOAT_PREC)
+    not_dones = 1 - np.asarray(dones, dtype=NP_FLOAT_PREC)
+
+    # the TD errors of all steps can be computed at once, only their discounted accumulation runs backwards in time
+    next_values = np.concatenate([values[1:], np.asarray(last_values, dtype=NP_FLOAT_PREC)[None, ...]])
+    advantages = rewards + gamma * next_values * not_dones - values
+    decays = gamma * lam * not_dones
+
+    for t in reversed(range(len(rewards) - 1)):
+        advantages[t] += decays[t] * advantages[t + 1]
+
+    return advantages, advantages + values
+
+
 def extract_discrete_action_probabilities(predictions: tf.Tensor, actions: tf.Tensor) -> tf.Tensor:
     """Given a tensor of predictions with shape [batch_size, sequence, n_actions] or [batch_size, n_actions] and a 2D or
     1D tensor of actions with shape [batch_size, sequence_length] or [batch_size] extract the probabilities for the
@@ -72,18 +105,7 @@ def extract_discrete_action_probabilities(predictions: tf.Tensor, actions: tf.Te
     assert len(actions.shape) in [1, 2], "Actions should be a tensor of rank 1 or 2."
     assert len(predictions.shape) in [2, 3], "Predictions should be a tensor of rank 2 or 3."
 
-    if len(actions.shape) == 1:
-        indices = tf.concat([tf.reshape(tf.range(actions.shape[0]), [-1, 1]), tf.reshape(actions, [-1, 1])], axis=-1)
-        choices = tf.gather_nd(predictions, indices)
-    else:
-        batch_indices = tf.reshape(
-            tf.tile(tf.expand_dims(tf.range(actions.shape[0]), axis=-1), [1, actions.shape[1]]), [-1, 1])
-        sequence_indices = tf.reshape(
-            tf.tile(tf.expand_dims(tf.range(actions.shape[1]), axis=0), [1, actions.shape[0]]), [-1, 1])
-
-        indices = tf.concat((batch_indices, sequence_indices, tf.reshape(actions, [-1, 1])), axis=-1)
-
-        choices = tf.gather_nd(predictions, indices)
-        choices = tf.reshape(choices, actions.shape)
+    # the batch (and sequence) dimensions index the predictions alongside the actions, s.t. this also traces for
+    # batches of unknown size
+    return tf.gather(predictions, actions, batch_dims=len(actions.shape))
 
-    return choices
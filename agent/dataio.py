@@ -1,15 +1,22 @@
 #!/usr/bin/env python
 """Data reading and writing utilities for distributed learning."""
+import json
 import os
 import random
+import shutil
+import struct
+from typing import List, Dict, Callable
 
+import numpy as np
 import tensorflow as tf
 
 from utilities.const import STORAGE_DIR
 from utilities.datatypes import ExperienceBuffer, StatBundle, TimeSequenceExperienceBuffer
 
-if __name__ == "__main__":
-    pass
+SHARD_MAGIC = b"DRHSHARD"
+SHARD_ALIGNMENT = 64
+SHADOW_HAND_FEATURES = ("in_vision", "in_proprio", "in_touch", "in_goal")
+PARTIAL_SUFFIX = ".partial"
 
 
 def _float_feature(value):
@@ -24,35 +31,37 @@ def _bytes_feature(value):
     return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
 
 
-def serialize_flat_sample(s, a, ap, r, adv, v):
-    """Serialize a sample from a dataset."""
-    feature = {
-        "state": _bytes_feature(tf.io.serialize_tensor(s)),
-        "action": _bytes_feature(tf.io.serialize_tensor(a)),
-        "action_prob": _bytes_feature(tf.io.serialize_tensor(ap)),
-        "return": _bytes_feature(tf.io.serialize_tensor(r)),
-        "advantage": _bytes_feature(tf.io.serialize_tensor(adv)),
-        "value": _bytes_feature(tf.io.serialize_tensor(v))
-    }
+def _int64_list_feature(values):
+    """Returns an int64_list from a list of ints."""
+    return tf.train.Feature(int64_list=tf.train.Int64List(value=list(values)))
+
+
+def _raw_tensor_features(name: str, tensor) -> dict:
+    """Returns the features of a tensor stored as its raw bytes and its shape, which allows to decode whole batches of
+    examples at once with tf.io.decode_raw instead of parsing every tensor on its own."""
+    array = tensor.numpy()
+    return {name: _bytes_feature(array.tobytes()), f"{name}_shape": _int64_list_feature(array.shape)}
+
+
+def serialize_flat_sample(s, a, ap, r, adv, v, d=None):
+    """Serialize a sample from a dataset, with the done mask only for sequences of recurrent agents."""
+    feature = {}
+    for name, tensor in zip(["state", "action", "action_prob", "return", "advantage", "value", "done"],
+                            [s, a, ap, r, adv, v] + ([d] if d is not None else [])):
+        feature.update(_raw_tensor_features(name, tensor))
 
     # Create a Features message using tf.train.Example.
     example_proto = tf.train.Example(features=tf.train.Features(feature=feature))
     return example_proto.SerializeToString()
 
 
-def serialize_shadow_hand_sample(sv, sp, st, sg, a, ap, r, adv, v):
-    """Serialize a multi-input (shadow hand) sample from a dataset."""
-    feature = {
-        "in_vision": _bytes_feature(tf.io.serialize_tensor(sv)),
-        "in_proprio": _bytes_feature(tf.io.serialize_tensor(sp)),
-        "in_touch": _bytes_feature(tf.io.serialize_tensor(st)),
-        "in_goal": _bytes_feature(tf.io.serialize_tensor(sg)),
-        "action": _bytes_feature(tf.io.serialize_tensor(a)),
-        "action_prob": _bytes_feature(tf.io.serialize_tensor(ap)),
-        "return": _bytes_feature(tf.io.serialize_tensor(r)),
-        "advantage": _bytes_feature(tf.io.serialize_tensor(adv)),
-        "value": _bytes_feature(tf.io.serialize_tensor(v))
-    }
+def serialize_shadow_hand_sample(sv, sp, st, sg, a, ap, r, adv, v, d=None):
+    """Serialize a multi-input (shadow hand) sample from a dataset, with the done mask only for sequences of recurrent
+    agents."""
+    feature = {}
+    for name, tensor in zip(SHADOW_HAND_FEATURES + ("action", "action_prob", "return", "advantage", "value", "done"),
+                            [sv, sp, st, sg, a, ap, r, adv, v] + ([d] if d is not None else [])):
+        feature.update(_raw_tensor_features(name, tensor))
 
     # Create a Features message using tf.train.Example.
     example_proto = tf.train.Example(features=tf.train.Features(feature=feature))
@@ -68,97 +77,359 @@ def tf_serialize_example(sample):
         inputs = (sample["in_vision"], sample["in_proprio"], sample["in_touch"], sample["in_goal"])
         serializer = serialize_shadow_hand_sample
     inputs += (sample["action"], sample["action_prob"], sample["return"], sample["advantage"], sample["value"])
+    if "done" in sample:
+        inputs += (sample["done"],)
 
     tf_string = tf.py_function(serializer, inputs, tf.string)
     return tf.reshape(tf_string, ())
 
 
+def buffer_to_arrays(buffer: ExperienceBuffer, is_shadow_brain: bool) -> Dict[str, np.ndarray]:
+    """Get the content of an ExperienceBuffer as contiguous arrays, named by the features of the dataset."""
+    if is_shadow_brain:
+        arrays = dict(zip(SHADOW_HAND_FEATURES, buffer.states))
+    else:
+        arrays = {"state": buffer.states}
+
+    arrays.update({
+        "action": buffer.actions,
+        "action_prob": buffer.action_probabilities,
+        "return": buffer.returns,
+        "advantage": buffer.advantages,
+        "value": buffer.values,
+    })
+    if isinstance(buffer, TimeSequenceExperienceBuffer):
+        arrays["done"] = buffer.dones
+
+    return {feature: np.ascontiguousarray(array) for feature, array in arrays.items()}
+
+
 def make_dataset_and_stats(buffer: ExperienceBuffer, is_shadow_brain: bool):
     """Make dataset object and StatBundle from ExperienceBuffer."""
+    dataset = tf.data.Dataset.from_tensor_slices(buffer_to_arrays(buffer, is_shadow_brain))
+
+    return dataset, make_stats(buffer)
+
+
+def make_stats(buffer: ExperienceBuffer) -> StatBundle:
+    """Make the StatBundle describing the experience in an ExperienceBuffer."""
     completed_episodes = buffer.episodes_completed
     numb_processed_frames = buffer.capacity
 
-    # expand dims when constructing dataset to inject batch dimension
-    if is_shadow_brain:
-        dataset = tf.data.Dataset.from_tensor_slices({
-            "in_vision": buffer.states[0],
-            "in_proprio": buffer.states[1],
-            "in_touch": buffer.states[2],
-            "in_goal": buffer.states[3],
-            "action": buffer.actions,
-            "action_prob": buffer.action_probabilities,
-            "return": buffer.returns,
-            "advantage": buffer.advantages,
-            "value": buffer.advantages,
-        })
-    else:
-        dataset = tf.data.Dataset.from_tensor_slices({
-            "state": buffer.states,
-            "action": buffer.actions,
-            "action_prob": buffer.action_probabilities,
-            "return": buffer.returns,
-            "advantage": buffer.advantages,
-            "value": buffer.advantages,
-        })
-
     underflow = None
     if isinstance(buffer, TimeSequenceExperienceBuffer):
         underflow = round(1 - buffer.true_number_of_transitions / buffer.capacity, 2)
 
-    stats = StatBundle(
+    return StatBundle(
         completed_episodes,
         numb_processed_frames,
         buffer.episode_rewards,
         buffer.episode_lengths,
-        tbptt_underflow=underflow
+        tbptt_underflow=underflow,
+        worker_telemetry={}
     )
 
-    return dataset, stats
 
+def make_dataset_from_arrays(shards: List[Dict[str, np.ndarray]], shuffle: bool = True,
+                             chunk_size: int = 1024) -> tf.data.Dataset:
+    """Make a dataset from the experience arrays of several workers, as given by buffer_to_arrays.
+
+    Shards are sliced individually and concatenated, s.t. the (potentially zero-copy) arrays of the workers never
+    need to be merged into one large array first. The arrays are not copied into the dataset either, but read in
+    chunks of chunk_size samples while it is iterated, s.t. memory mapped shards are only loaded as far as needed."""
+    shards = list(shards)
+    if shuffle:
+        random.shuffle(shards)
+
+    dataset = _make_chunked_dataset(shards[0], chunk_size)
+    for shard in shards[1:]:
+        dataset = dataset.concatenate(_make_chunked_dataset(shard, chunk_size))
+
+    return dataset
+
+
+def _make_chunked_dataset(shard: Dict[str, np.ndarray], chunk_size: int) -> tf.data.Dataset:
+    """Make a dataset of the samples of a shard that reads the arrays chunk by chunk when it is iterated."""
+    names = list(shard.keys())
+
+    def read(start):
+        return [np.asarray(shard[name][start:start + chunk_size]) for name in names]
+
+    def load_chunk(start):
+        fields = tf.numpy_function(read, [start], [tf.as_dtype(shard[name].dtype) for name in names])
+        for field, name in zip(fields, names):
+            field.set_shape((None,) + shard[name].shape[1:])
+
+        return dict(zip(names, fields))
+
+    return tf.data.Dataset.range(0, len(shard[names[0]]), chunk_size).map(load_chunk).unbatch()
+
+
+def _align(position: int) -> int:
+    """Round a byte position up to the next multiple of the shard alignment."""
+    return -(-position // SHARD_ALIGNMENT) * SHARD_ALIGNMENT
+
+
+def write_columnar_shard(path: str, arrays: Dict[str, np.ndarray]):
+    """Write experience arrays, as given by buffer_to_arrays, into one columnar shard file.
+
+    The file starts with a magic number, the length of a JSON header and the header itself, which holds the dtype,
+    shape and offset of every field. After it each field follows as one contiguous array, aligned to SHARD_ALIGNMENT
+    bytes, s.t. the fields can be memory mapped by the reader without any parsing."""
+    fields, offset = {}, 0
+    for name, array in arrays.items():
+        fields[name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+        offset = _align(offset + array.nbytes)
+    header = json.dumps(fields).encode("utf-8")
+    data_start = _align(len(SHARD_MAGIC) + 8 + len(header))
+
+    with open(path + PARTIAL_SUFFIX, "wb") as f:
+        f.write(SHARD_MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + fields[name]["offset"])
+            np.ascontiguousarray(array).tofile(f)
+    commit_shard(path)
+
+
+def read_columnar_shard(path: str) -> Dict[str, np.ndarray]:
+    """Read the fields of a columnar shard file as read-only memory mapped arrays."""
+    with open(path, "rb") as f:
+        if f.read(len(SHARD_MAGIC)) != SHARD_MAGIC:
+            raise ValueError(f"{path} is not a columnar experience shard.")
+        header_length, = struct.unpack("<Q", f.read(8))
+        fields = json.loads(f.read(header_length).decode("utf-8"))
+    data_start = _align(len(SHARD_MAGIC) + 8 + header_length)
+
+    return {name: np.memmap(path, dtype=np.dtype(spec["dtype"]), mode="r", offset=data_start + spec["offset"],
+                            shape=tuple(spec["shape"]))
+            for name, spec in fields.items()}
+
+
+def read_columnar_dataset_from_storage(shuffle: bool = True, cycle: int = None,
+                                       directory: str = STORAGE_DIR) -> tf.data.Dataset:
+    """Read all columnar shards in the storage directory, or only those of the given cycle, into a dataset. Shards are
+    sliced as whole arrays, there is no per sample parsing."""
+    return make_dataset_from_arrays([read_columnar_shard(file) for file in list_cycle_files(cycle, directory)],
+                                    shuffle=shuffle)
+
+
+class MemmapExperienceStore:
+    """Experience store backed by memory mapped .npy files, one per field and shard, in a storage folder of the run.
+
+    Workers allocate the arrays of their buffers directly in the store (see ExperienceBuffer.new), s.t. experience is
+    written to the files step by step instead of accumulating in the worker's memory. The learner maps the same files
+    read-only and gathers every minibatch by its indices. Neither side ever holds a whole cycle in memory, which keeps
+    their resident memory independent of the horizon and the number of workers."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def cycle_directory(self, cycle: int) -> str:
+        """Get the folder holding the shards of a cycle."""
+        return os.path.join(self.directory, f"cycle_{cycle}")
+
+    def shard_directory(self, cycle: int, worker_id: int) -> str:
+        """Get the folder holding the files of a worker's shard."""
+        return os.path.join(self.cycle_directory(cycle), f"worker_{worker_id}")
 
-def read_dataset_from_storage(dtype_actions: tf.dtypes.DType, is_shadow_hand: bool, shuffle: bool = True):
-    """Read all files in storage into a tf record dataset without actually loading everything into memory."""
-    feature_description = {
-        "action": tf.io.FixedLenFeature([], tf.string),
-        "action_prob": tf.io.FixedLenFeature([], tf.string),
-        "return": tf.io.FixedLenFeature([], tf.string),
-        "advantage": tf.io.FixedLenFeature([], tf.string),
-        "value": tf.io.FixedLenFeature([], tf.string)
-    }
+    def allocator(self, cycle: int, worker_id: int) -> Callable[[str, tuple, type], np.ndarray]:
+        """Get a function allocating the named arrays of a buffer as memory mapped files in the shard of a worker. The
+        shard is only visible to the learner once it is committed."""
+        shard_directory = self.shard_directory(cycle, worker_id) + PARTIAL_SUFFIX
+        os.makedirs(shard_directory, exist_ok=True)
+
+        def allocate(name: str, shape: tuple, dtype) -> np.ndarray:
+            return np.lib.format.open_memmap(os.path.join(shard_directory, f"{name}.npy"), mode="w+", dtype=dtype,
+                                             shape=shape)
+
+        return allocate
+
+    def commit(self, cycle: int, worker_id: int):
+        """Atomically publish the shard a worker finished writing. Its mapped arrays stay valid."""
+        commit_shard(self.shard_directory(cycle, worker_id))
+
+    def read_shards(self, cycle: int, is_shadow_hand: bool) -> List[Dict[str, np.ndarray]]:
+        """Map the committed shards of a cycle read-only, named by the features of the dataset."""
+        shards = []
+        for shard_name in sorted(os.listdir(self.cycle_directory(cycle))):
+            if shard_name.endswith(PARTIAL_SUFFIX):
+                continue
+
+            shard_directory = os.path.join(self.cycle_directory(cycle), shard_name)
+
+            shard = {}
+            for file_name in sorted(os.listdir(shard_directory)):
+                name = os.path.splitext(file_name)[0]
+                if is_shadow_hand and name.startswith("state_"):
+                    name = SHADOW_HAND_FEATURES[int(name.split("_")[1])]
+                shard[name] = np.load(os.path.join(shard_directory, file_name), mmap_mode="r")
+            shards.append(shard)
+
+        return shards
+
+    def make_batched_dataset(self, cycle: int, batch_size: int, is_shadow_hand: bool,
+                             shuffle: bool = True) -> tf.data.Dataset:
+        """Make a dataset of minibatches of a cycle's experience, where only the indices of the samples are kept in
+        memory and every minibatch is gathered from the mapped shards when it is needed. The samples are reshuffled
+        in every iteration over the dataset."""
+        shards = self.read_shards(cycle, is_shadow_hand)
+        names = list(shards[0].keys())
+        offsets = np.cumsum([0] + [len(shard["advantage"]) for shard in shards])
+
+        def gather(indices):
+            # sorted indices read the files front to back, the order within a minibatch does not matter
+            indices = np.sort(indices)
+            owners = np.searchsorted(offsets, indices, side="right") - 1
+            selections = [(shard, indices[owners == i] - offsets[i]) for i, shard in enumerate(shards)
+                          if np.any(owners == i)]
+
+            return [np.concatenate([shard[name][rows] for shard, rows in selections]) for name in names]
+
+        def load_batch(indices):
+            fields = tf.numpy_function(gather, [indices], [tf.as_dtype(shards[0][name].dtype) for name in names])
+            for field, name in zip(fields, names):
+                field.set_shape((None,) + shards[0][name].shape[1:])
+
+            return dict(zip(names, fields))
+
+        indices = tf.data.Dataset.range(offsets[-1])
+        if shuffle:
+            indices = indices.shuffle(offsets[-1], reshuffle_each_iteration=True)
+
+        return indices.batch(batch_size, drop_remainder=True).map(load_batch).prefetch(1)
+
+    def delete_cycle(self, cycle: int):
+        """Delete the shards of a cycle."""
+        shutil.rmtree(self.cycle_directory(cycle), ignore_errors=True)
+
+
+def commit_shard(path: str):
+    """Atomically move a shard (file or folder) that was written under its partial name to its final path, s.t. readers
+    never see incomplete shards."""
+    os.replace(path + PARTIAL_SUFFIX, path)
+
+
+def get_cycle_file_name(cycle: int, worker_id: int, extension: str = "tfrecord", directory: str = STORAGE_DIR) -> str:
+    """Get the path of the file storing the experience a worker collected in a cycle."""
+    return os.path.join(directory, f"data_{cycle}_{worker_id}.{extension}")
+
+
+def list_cycle_files(cycle: int = None, directory: str = STORAGE_DIR):
+    """List the paths of all committed experience files in a storage directory, or only of those belonging to the given
+    cycle."""
+    return [os.path.join(directory, name) for name in os.listdir(directory)
+            if (cycle is None or name.startswith(f"data_{cycle}_")) and not name.endswith(PARTIAL_SUFFIX)]
+
+
+def delete_cycle_from_storage(cycle: int, directory: str = STORAGE_DIR):
+    """Delete the experience files of the given cycle from a storage directory, including partially written ones."""
+    for name in os.listdir(directory):
+        if name.startswith(f"data_{cycle}_"):
+            os.remove(os.path.join(directory, name))
+
+
+def read_dataset_from_storage(dtype_actions: tf.dtypes.DType, is_shadow_hand: bool, shuffle: bool = True,
+                              cycle: int = None, dtype_vision: tf.dtypes.DType = tf.float32,
+                              parse_batch_size: int = 64, directory: str = STORAGE_DIR,
+                              is_recurrent: bool = False) -> tf.data.Dataset:
+    """Read all files in storage, or only those of the given cycle, into a tf record dataset. The first input of multi
+    input states is stored in the given dtype, e.g. uint8 frames. Sequences of recurrent agents also hold a done mask.
+
+    Files are read interleaved and in parallel. Examples are parsed in batches with one vectorized decoding per
+    feature. The parsed samples are cached in memory, s.t. only the first pass over the dataset reads and parses the
+    files, while every further epoch iterates the cache."""
+    dtypes = {"action": dtype_actions, "action_prob": tf.float32, "return": tf.float32, "advantage": tf.float32,
+              "value": tf.float32}
+    if is_recurrent:
+        dtypes["done"] = tf.float32
 
     # add states
     if not is_shadow_hand:
-        feature_description["state"] = tf.io.FixedLenFeature([], tf.string)
+        dtypes["state"] = tf.float32
     else:
-        feature_description.update({
-            "in_vision": tf.io.FixedLenFeature([], tf.string),
-            "in_proprio": tf.io.FixedLenFeature([], tf.string),
-            "in_touch": tf.io.FixedLenFeature([], tf.string),
-            "in_goal": tf.io.FixedLenFeature([], tf.string),
-        })
-
-    def _parse_function(example_proto):
-        # Parse the input `tf.Example` proto using the dictionary above.
-        parsed = tf.io.parse_single_example(example_proto, feature_description)
-        if not is_shadow_hand:
-            parsed["state"] = tf.io.parse_tensor(parsed["state"], out_type=tf.float32)
-        else:
-            parsed["in_vision"] = tf.io.parse_tensor(parsed["in_vision"], out_type=tf.float32)
-            parsed["in_proprio"] = tf.io.parse_tensor(parsed["in_proprio"], out_type=tf.float32)
-            parsed["in_touch"] = tf.io.parse_tensor(parsed["in_touch"], out_type=tf.float32)
-            parsed["in_goal"] = tf.io.parse_tensor(parsed["in_goal"], out_type=tf.float32)
-        parsed["action"] = tf.io.parse_tensor(parsed["action"], out_type=dtype_actions)
-        parsed["action_prob"] = tf.io.parse_tensor(parsed["action_prob"], out_type=tf.float32)
-        parsed["return"] = tf.io.parse_tensor(parsed["return"], out_type=tf.float32)
-        parsed["advantage"] = tf.io.parse_tensor(parsed["advantage"], out_type=tf.float32)
-        parsed["value"] = tf.io.parse_tensor(parsed["value"], out_type=tf.float32)
-
-        return parsed
-
-    files = [os.path.join(STORAGE_DIR, name) for name in os.listdir(STORAGE_DIR)]
+        dtypes.update({"in_vision": dtype_vision, "in_proprio": tf.float32, "in_touch": tf.float32,
+                       "in_goal": tf.float32})
+
+    feature_description = {}
+    for name in dtypes.keys():
+        feature_description[name] = tf.io.FixedLenFeature([], tf.string)
+        feature_description[f"{name}_shape"] = tf.io.VarLenFeature(tf.int64)
+
+    def _parse_batch(example_protos):
+        parsed = tf.io.parse_example(example_protos, feature_description)
+
+        # all samples of a field have the same shape, hence the whole batch is decoded at once
+        batch = {}
+        for name, dtype in dtypes.items():
+            shape = tf.sparse.to_dense(parsed[f"{name}_shape"])[0]
+            batch[name] = tf.reshape(tf.io.decode_raw(parsed[name], dtype),
+                                     tf.concat([tf.constant([-1], dtype=tf.int64), shape], axis=0))
+
+        return batch
+
+    files = list_cycle_files(cycle, directory)
     if shuffle:
         random.shuffle(files)
-    serialized_dataset = tf.data.TFRecordDataset(files)
-    serialized_dataset = serialized_dataset.map(_parse_function)
 
-    return serialized_dataset
+    serialized_dataset = tf.data.Dataset.from_tensor_slices(files).interleave(
+        tf.data.TFRecordDataset, cycle_length=max(1, len(files)), num_parallel_calls=tf.data.experimental.AUTOTUNE)
+
+    return (serialized_dataset
+            .batch(parse_batch_size)
+            .map(_parse_batch, num_parallel_calls=tf.data.experimental.AUTOTUNE)
+            .unbatch()
+            .cache())
+
+
+if __name__ == "__main__":
+    import time
+
+    from utilities.const import VISION_WH
+
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+
+    def benchmark(name: str, arrays: Dict[str, np.ndarray], is_shadow_hand: bool, batch_size: int = 64):
+        n = len(arrays["action"])
+
+        # current path: serialize every sample into a tf.train.Example and parse it back
+        start = time.time()
+        dataset = tf.data.Dataset.from_tensor_slices(arrays).map(tf_serialize_example)
+        tf.data.experimental.TFRecordWriter(get_cycle_file_name(-1, 0)).write(dataset)
+        tfrecord_write = time.time() - start
+
+        start = time.time()
+        for _ in read_dataset_from_storage(tf.float32, is_shadow_hand, cycle=-1).batch(batch_size):
+            pass
+        tfrecord_read = time.time() - start
+        delete_cycle_from_storage(-1)
+
+        # columnar path
+        start = time.time()
+        write_columnar_shard(get_cycle_file_name(-1, 0, "shard"), arrays)
+        columnar_write = time.time() - start
+
+        start = time.time()
+        for _ in read_columnar_dataset_from_storage(cycle=-1).batch(batch_size):
+            pass
+        columnar_read = time.time() - start
+        delete_cycle_from_storage(-1)
+
+        print(f"{name} ({n} samples)\n"
+              f"\ttfrecord: write {n / tfrecord_write:.0f} fps, read {n / tfrecord_read:.0f} fps\n"
+              f"\tcolumnar: write {n / columnar_write:.0f} fps, read {n / columnar_read:.0f} fps")
+
+    def transition_fields(n: int) -> Dict[str, np.ndarray]:
+        return {"action": np.random.randn(n, 20).astype(np.float32),
+                "action_prob": np.random.randn(n).astype(np.float32),
+                "return": np.random.randn(n).astype(np.float32),
+                "advantage": np.random.randn(n).astype(np.float32),
+                "value": np.random.randn(n).astype(np.float32)}
+
+    benchmark("flat", {"state": np.random.randn(8192, 48).astype(np.float32), **transition_fields(8192)}, False)
+    benchmark("shadow hand", {"in_vision": np.random.randint(0, 256, (256, VISION_WH, VISION_WH, 3), dtype=np.uint8),
+                              "in_proprio": np.random.randn(256, 48).astype(np.float32),
+                              "in_touch": np.random.randn(256, 92).astype(np.float32),
+                              "in_goal": np.random.randn(256, 15).astype(np.float32),
+                              **transition_fields(256)}, True)
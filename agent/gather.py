@@ -1,26 +1,28 @@
 #!/usr/bin/env python
 """Functions for gathering experience and communicating it to the main thread."""
-import os
 import time
-from inspect import getfullargspec as fargs
-from typing import Tuple, Any
+from typing import Tuple, Any, Union
 
 import numpy as np
+import psutil
 import ray
 import tensorflow as tf
 from gym.spaces import Box
 
 import models
 from agent import policies
-from agent.core import estimate_episode_advantages
-from agent.dataio import tf_serialize_example, make_dataset_and_stats
+from agent.acting import ActStep
+from agent.broadcast import WeightPackage, unpack_weights
+from agent.inference import NumpyActStep, export_model
+from agent.core import estimate_batched_advantages
+from agent.dataio import tf_serialize_example, make_dataset_and_stats, get_cycle_file_name, buffer_to_arrays, \
+    make_stats, write_columnar_shard, commit_shard, MemmapExperienceStore, PARTIAL_SUFFIX
 from environments import *
-from models import build_rnn_models, GaussianPolicyDistribution
-from utilities.const import STORAGE_DIR, DETERMINISTIC
+from utilities.const import DETERMINISTIC, STORAGE_DIR
 from utilities.datatypes import ExperienceBuffer, TimeSequenceExperienceBuffer
-from utilities.model_utils import is_recurrent_model
-from utilities.util import parse_state, add_state_dims, flatten, env_extract_dims
-from utilities.wrappers import CombiWrapper, RewardNormalizationWrapper, StateNormalizationWrapper, BaseWrapper
+from utilities.model_utils import is_recurrent_model, requires_batch_size
+from utilities.util import parse_state, add_state_dims, merge_into_batch
+from utilities.wrappers import BaseWrapper
 
 
 class Gatherer:
@@ -28,151 +30,261 @@ class Gatherer:
     joint: tf.keras.Model
     policy: tf.keras.Model
 
-    def __init__(self, model_builder_name: str, distribution_name: str, env_name: str, worker_id: int):
-        model_builder = getattr(models, model_builder_name)
+    def __init__(self, model_builder_name: str, distribution_name: str, env_name: str, worker_id: int,
+                 n_envs: int = 1, model_spec: dict = None, persistent_episodes: bool = False,
+                 action_repeat: int = 1):
+        """Set up the environments and the acting model of the worker.
 
-        self.id = worker_id
+        If a model specification (see agent.inference.export_model) is given, the worker acts with a pure numpy
+        executor of the specified model instead of building the Keras model. No tensorflow operations run while
+        acting then, but the worker still imports tensorflow through this module, the distributions and the
+        utilities it shares with the learner, and the tfrecord transport writes its shards with tensorflow.
+
+        With persistent episodes, the environments, their running episodes and the recurrent states are kept between
+        collections, s.t. every collection continues where the last one stopped.
+
+        With an action repeat above 1, every action is held for that many simulator steps of the environment."""
+        self.model_builder = getattr(models, model_builder_name)
 
-        # setup persistent tools
-        self.env = gym.make(env_name)
+        self.id = worker_id
+        self.env_name = env_name
+        self.n_envs = n_envs
+        self.uses_numpy_inference = model_spec is not None
+        self.persistent_episodes = persistent_episodes
+        self.action_repeat = action_repeat
+        self.episode_carry = None
+
+        # setup persistent tools; the environment copies are stepped in lockstep and share one batched model
+        self.envs = [make_environment(env_name, action_repeat) for _ in range(self.n_envs)]
+        self.env = self.envs[0]
         self.distribution = getattr(policies, distribution_name)(self.env)
-        self.policy, _, self.joint = model_builder(
-            self.env, self.distribution, **({"bs": 1} if "bs" in fargs(model_builder).args else {}))
+
+        # acting on the joint model; the act step for evaluation is built on demand
+        if self.uses_numpy_inference:
+            self.policy, self.joint = None, None
+            self.act_step = NumpyActStep(model_spec, self.distribution)
+            self.is_recurrent = self.act_step.is_recurrent
+        else:
+            self.policy, _, self.joint = self.model_builder(
+                self.env, self.distribution,
+                **({"bs": self.n_envs} if requires_batch_size(self.model_builder) else {}))
+            self.act_step = ActStep(self.joint, self.distribution)
+            self.is_recurrent = is_recurrent_model(self.joint)
+        self.evaluation_act_step = None
+        self.evaluation_env = None
+        self.weights_version = None
 
         # some attributes for adaptive behaviour
-        self.is_recurrent = is_recurrent_model(self.joint)
         self.is_continuous = isinstance(self.env.action_space, Box)
         self.is_shadow_brain = "ShadowHand" in env_name
 
-    def update_weights(self, weights):
-        """Update the weights of this worker."""
-        self.joint.set_weights(weights)
+    def update_weights(self, package: WeightPackage) -> bool:
+        """Update the weights of this worker from a published package, unless it already holds the package's version.
+
+        Returns:
+            True if the weights were loaded, False if they were already up to date
+        """
+        if self.weights_version is not None and self.weights_version == package.version:
+            return False
+
+        self.act_step.set_weights(unpack_weights(package))
+        self.weights_version = package.version
+
+        return True
+
+    def _get_evaluation_act_step(self) -> Union[ActStep, NumpyActStep]:
+        """Get an act step of a policy model that acts on a single environment with the current weights."""
+        if self.uses_numpy_inference:
+            # numpy models have no fixed batch size, but a separate executor keeps the collection states untouched
+            if self.evaluation_act_step is None:
+                self.evaluation_act_step = NumpyActStep(self.act_step.model.spec, self.distribution)
+            self.evaluation_act_step.set_weights(self.act_step.model.get_weights())
+
+            return self.evaluation_act_step
 
-    def collect(self, horizon: int, discount: float, lam: float, subseq_length: int, preprocessor_serialized: dict):
-        """Collect a batch shard of experience for a given number of timesteps."""
+        if self.evaluation_act_step is None:
+            if not self.is_recurrent or (self.n_envs == 1 and not self.persistent_episodes):
+                policy = self.policy
+            else:
+                # stateful recurrent models are bound to their batch size, evaluation runs a single environment though;
+                # persistent episodes also need the states of the collection model to stay untouched
+                policy, _, _ = self.model_builder(self.env, self.distribution, bs=1)
+
+            self.evaluation_act_step = ActStep(policy, self.distribution, with_value=False)
+
+        if self.evaluation_act_step.model is not self.policy:
+            self.evaluation_act_step.model.set_weights(self.policy.get_weights())
+
+        return self.evaluation_act_step
+
+    def collect(self, horizon: int, discount: float, lam: float, subseq_length: int, preprocessor_serialized: dict,
+                cycle: int = 0, transport: str = "tfrecord", storage_directory: str = STORAGE_DIR):
+        """Collect a batch shard of experience for a given number of timesteps and hand it over to the learner.
+
+        The horizon is the total number of timesteps of this worker and is split evenly between its environments.
+
+        With the "tfrecord" transport the shard is written to a file of serialized samples as part of the given cycle,
+        the "columnar" transport writes it as one contiguous array per field instead (see write_columnar_shard). With
+        the "object_store" transport it is returned as a dictionary of contiguous arrays, which Ray places in its
+        shared memory object store from where the learner can read them without copying. With the "memmap" transport
+        the buffer itself is allocated in a memory mapped store and the experience is written to its files while
+        collecting. Files go into the given storage directory and are committed atomically once complete, s.t. the
+        learner never reads a partial shard.
+
+        Returns:
+            the StatBundle of the shard, the merged preprocessor and the experience arrays (None unless "object_store")
+        """
 
         # import here to avoid pickling errors
         import tensorflow as tfl
 
-        # build new environment for each collector to make multiprocessing possible
-        if DETERMINISTIC:
-            self.env.seed(1)
+        collection_start = time.time()
 
-        preprocessor = BaseWrapper.from_serialization(preprocessor_serialized)
+        assert horizon % self.n_envs == 0, "Horizon needs to be divisible by the number of environments per worker."
+        env_horizon = horizon // self.n_envs
+
+        # every environment gets its own preprocessor to not mix up running returns between episodes
+        preprocessors = [BaseWrapper.from_serialization(preprocessor_serialized) for _ in range(self.n_envs)]
+
+        if self.episode_carry is None:
+            # build new environment for each collector to make multiprocessing possible
+            if DETERMINISTIC:
+                for env in self.envs:
+                    env.seed(1)
 
-        # reset states of potentially recurrent net
-        self.joint.reset_states()
+            # reset states of potentially recurrent net
+            self.act_step.reset_states()
+        else:
+            # continue the running episodes under the new statistics of the preprocessors
+            for preprocessor, previous_preprocessor in zip(preprocessors, self.episode_carry["preprocessors"]):
+                preprocessor.carry_episode_state(previous_preprocessor)
 
         # buffer storing the experience and stats
+        store = MemmapExperienceStore(storage_directory) if transport == "memmap" else None
+        allocate = store.allocator(cycle, self.id) if transport == "memmap" else None
         if self.is_recurrent:
-            assert horizon % subseq_length == 0, "Subsequence length would require cutting of part of the observations."
+            assert env_horizon % subseq_length == 0, \
+                "Subsequence length would require cutting of part of the observations."
             buffer: TimeSequenceExperienceBuffer = TimeSequenceExperienceBuffer.new(env=self.env,
                                                                                     size=horizon // subseq_length,
                                                                                     seq_len=subseq_length,
                                                                                     is_continuous=self.is_continuous,
-                                                                                    is_multi_feature=self.is_shadow_brain)
+                                                                                    is_multi_feature=self.is_shadow_brain,
+                                                                                    n_slots=self.n_envs,
+                                                                                    allocate=allocate)
+        else:
+            buffer: ExperienceBuffer = ExperienceBuffer.new(env=self.env,
+                                                            size=horizon,
+                                                            is_continuous=self.is_continuous,
+                                                            is_multi_feature=self.is_shadow_brain,
+                                                            n_slots=self.n_envs,
+                                                            allocate=allocate)
+
+        # go for it; all trackers are kept per environment slot
+        slots = range(self.n_envs)
+        t, current_subseq_length = [0] * self.n_envs, [0] * self.n_envs
+        # rewards and done flags are indexed by the step in the block of the environment slot in the buffer
+        rewards = np.zeros((self.n_envs, env_horizon), dtype=np.float32)
+        dones = np.zeros((self.n_envs, env_horizon), dtype=bool)
+        bootstrap_values = [None] * self.n_envs
+        if self.episode_carry is None:
+            current_episode_return, episode_steps = [0] * self.n_envs, [1] * self.n_envs
+            current_states = [preprocessors[k].modulate((parse_state(self.envs[k].reset()), None, None, None))[0]
+                              for k in slots]
         else:
-            buffer: ExperienceBuffer = ExperienceBuffer.new_empty(self.is_continuous, self.is_shadow_brain)
-
-        # go for it
-        t, current_episode_return, episode_steps, current_subseq_length = 0, 0, 1, 0
-        states, rewards, actions, action_probabilities, values, advantages = [], [], [], [], [], []
-        episode_endpoints = []
-        state = preprocessor.modulate((parse_state(self.env.reset()), None, None, None))[0]
-        while t < horizon:
-            current_subseq_length += 1
-
-            # based on the given state, predict action distribution and state value; need flatten due to tf eager bug
-            policy_out = flatten(
-                self.joint.predict(add_state_dims(parse_state(state), dims=2 if self.is_recurrent else 1)))
-            a_distr, value = policy_out[:-1], policy_out[-1]
-            states.append(state)
-            values.append(np.squeeze(value))
-
-            # from the action distribution sample an action and remember both the action and its probability
-            action, action_probability = self.distribution.act(*a_distr)
-
-            action = action if not DETERMINISTIC else np.zeros(action.shape)
-            actions.append(action)
-            action_probabilities.append(action_probability)  # should probably ensure that no probability is ever 0
-
-            # make a step based on the chosen action and collect the reward for this state
-            observation, reward, done, _ = self.env.step(np.atleast_1d(action) if self.is_continuous else action)
-            current_episode_return += reward  # true reward for stats
-
-            observation, reward, done, _ = preprocessor.modulate((parse_state(observation), reward, done, None))
-            rewards.append(reward)
-
-            # if recurrent, at a subsequence breakpoint/episode end stack the observations and buffer them
-            if self.is_recurrent and (current_subseq_length == subseq_length or done):
-                buffer.push_seq_to_buffer(states, actions, action_probabilities, values[-current_subseq_length:])
-
-                # clear the buffered information
-                states, actions, action_probabilities = [], [], []
-                current_subseq_length = 0
-
-            # depending on whether the state is terminal, choose the next state
-            if done:
-                episode_endpoints.append(t)
-
-                # calculate advantages for the finished episode, where the last value is 0 since it refers to the
-                # terminal state that we just observed
-                episode_advantages = estimate_episode_advantages(rewards[-episode_steps:],
-                                                                 values[-episode_steps:] + [0],
-                                                                 discount, lam)
-                episode_returns = episode_advantages + values[-episode_steps:]
-
-                if not self.is_recurrent:
-                    advantages.append(episode_advantages)
+            current_episode_return, episode_steps, current_states = (self.episode_carry[key] for key in
+                                                                     ["returns", "steps", "states"])
+        while any(v is None for v in bootstrap_values):
+            # environments that exhausted their horizon only predict their bootstrap value, their recurrent states need
+            # to stay at the end of the horizon s.t. a continuing collection steps from there
+            exhausted = np.array([t[k] >= env_horizon for k in slots])
+            previous_states = self.act_step.get_states() if self.is_recurrent and np.any(exhausted) else None
+
+            # based on the given states, sample actions and predict state values of all environments in one
+            # batched forward pass
+            batch_actions, batch_action_probabilities, batch_values = self.act_step(merge_into_batch(current_states))
+            if previous_states is not None:
+                self.act_step.set_states(previous_states, mask=exhausted)
+
+            finished_episodes = np.zeros(self.n_envs, dtype=bool)
+            for k in slots:
+                if t[k] >= env_horizon:
+                    # the environment exhausted its horizon, the value of its last non-visited state is the bootstrap
+                    # for the advantage estimation of its last visited state
+                    if bootstrap_values[k] is None:
+                        bootstrap_values[k] = batch_values[k]
+                    continue
+
+                current_subseq_length[k] += 1
+
+                # remember both the sampled action and its probability, written in place into the buffer
+                action, action_probability = batch_actions[k], batch_action_probabilities[k]
+
+                action = action if not DETERMINISTIC else np.zeros(action.shape)
+                buffer.push(current_states[k], action, action_probability, batch_values[k], slot=k)
+
+                # make a step based on the chosen action and collect the reward for this state
+                observation, reward, done, _ = self.envs[k].step(np.atleast_1d(action) if self.is_continuous
+                                                                 else action)
+                current_episode_return[k] += reward  # true reward for stats
+
+                observation, reward, done, _ = preprocessors[k].modulate((parse_state(observation), reward, done,
+                                                                          None))
+                rewards[k, t[k]] = reward
+
+                # if recurrent, at a subsequence breakpoint/episode end the next steps go into a new subsequence
+                if self.is_recurrent and (current_subseq_length[k] == subseq_length or done):
+                    buffer.end_sequence(slot=k, done=done)
+                    current_subseq_length[k] = 0
+
+                # depending on whether the state is terminal, choose the next state
+                if done:
+                    # the value of the terminal state that we just observed is 0, advantages are estimated later
+                    dones[k, t[k]] = True
+
+                    if self.is_recurrent:
+                        # skip as many steps as are missing to fill the subsequence; the padding is empty and done
+                        skip = subseq_length - (t[k] % subseq_length) - 1
+                        dones[k, t[k]:t[k] + skip + 1] = True
+                        t[k] += skip
+
+                    # reset environment to receive next episodes initial state
+                    current_states[k] = preprocessors[k].modulate((parse_state(self.envs[k].reset()), None, None,
+                                                                   None))[0]
+                    finished_episodes[k] = True
+
+                    # update/reset some statistics and trackers
+                    buffer.episode_lengths.append(episode_steps[k])
+                    buffer.episode_rewards.append(current_episode_return[k])
+                    buffer.episodes_completed += 1
+                    episode_steps[k] = 1
+                    current_episode_return[k] = 0
                 else:
-                    # skip as many steps as are missing to fill the subsequence, then push adv ant ret to buffer
-                    t += subseq_length - (t % subseq_length) - 1
-                    buffer.push_adv_ret_to_buffer(episode_advantages, episode_returns)
-
-                # reset environment to receive next episodes initial state
-                state = preprocessor.modulate((parse_state(self.env.reset()), None, None, None))[0]
-                self.joint.reset_states()
-
-                # update/reset some statistics and trackers
-                buffer.episode_lengths.append(episode_steps)
-                buffer.episode_rewards.append(current_episode_return)
-                buffer.episodes_completed += 1
-                episode_steps = 1
-                current_episode_return = 0
-            else:
-                state = observation
-                episode_steps += 1
+                    current_states[k] = observation
+                    episode_steps[k] += 1
 
-            t += 1
+                t[k] += 1
 
-        self.env.close()
+            # reset the recurrent states of those environments that started a new episode
+            if self.is_recurrent and np.any(finished_episodes):
+                self.act_step.reset_states(mask=finished_episodes)
 
-        # get last non-visited state's value to incorporate it into the advantage estimation of last visited state
-        values.append(np.squeeze(self.joint.predict(add_state_dims(state, dims=2 if self.is_recurrent else 1))[-1]))
-
-        # if there was at least one step in the environment after the last episode end, calculate advantages for them
-        if episode_steps > 1:
-            leftover_advantages = estimate_episode_advantages(rewards[-episode_steps + 1:], values[-episode_steps:],
-                                                              discount, lam)
-            if not self.is_recurrent:
-                advantages.append(leftover_advantages)
-            else:
-                leftover_returns = leftover_advantages + values[-len(leftover_advantages) - 1:-1]
-                buffer.push_adv_ret_to_buffer(leftover_advantages, leftover_returns)
-
-        # if not recurrent, fill the buffer with everything we gathered
-        if not self.is_recurrent:
-            values = np.array(values, dtype="float32")
-
-            # write to the buffer
-            advantages = np.hstack(advantages).astype("float32")
-            returns = advantages + values[:-1]
-            buffer.fill(np.array(states, dtype="float32"),
-                        np.array(actions, dtype="float32" if self.is_continuous else "int32"),
-                        np.array(action_probabilities, dtype="float32"),
-                        advantages,
-                        returns,
-                        values[:-1])
+        if self.persistent_episodes:
+            # the states after the horizon were only used for bootstrapping, the next collection starts in them
+            self.episode_carry = dict(returns=current_episode_return, steps=episode_steps, states=current_states,
+                                      preprocessors=preprocessors)
+        else:
+            for env in self.envs:
+                env.close()
+
+        # estimate advantages and returns of all environments in one pass over the horizon, where episodes that are
+        # still running get bootstrapped by the value of their next state
+        advantages, returns = estimate_batched_advantages(rewards.T,
+                                                          buffer.values.reshape(self.n_envs, env_horizon).T,
+                                                          dones.T,
+                                                          np.array(bootstrap_values),
+                                                          discount, lam)
+        buffer.set_advantages_and_returns(advantages.T, returns.T)
 
         # normalize advantages
         buffer.normalize_advantages()
@@ -180,32 +292,77 @@ class Gatherer:
         if self.is_recurrent:
             buffer.inject_batch_dimension()
 
-        # convert buffer to dataset and save it to tf record
-        dataset, stats = make_dataset_and_stats(buffer, is_shadow_brain=self.is_shadow_brain)
-        dataset = dataset.map(tf_serialize_example)
+        if transport == "object_store":
+            # returned arrays end up in the object store, no serialization into tf records needed
+            stats, experience = make_stats(buffer), buffer_to_arrays(buffer, is_shadow_brain=self.is_shadow_brain)
+        elif transport == "columnar":
+            write_columnar_shard(get_cycle_file_name(cycle, self.id, "shard", storage_directory),
+                                 buffer_to_arrays(buffer, is_shadow_brain=self.is_shadow_brain))
+            stats, experience = make_stats(buffer), None
+        elif transport == "memmap":
+            # the experience already is in the files of the store, all buffer operations were in place
+            stats, experience = make_stats(buffer), None
+            store.commit(cycle, self.id)
+        else:
+            # convert buffer to dataset and save it to tf record
+            dataset, stats = make_dataset_and_stats(buffer, is_shadow_brain=self.is_shadow_brain)
+            dataset = dataset.map(tf_serialize_example)
+
+            file_name = get_cycle_file_name(cycle, self.id, directory=storage_directory)
+            writer = tfl.data.experimental.TFRecordWriter(file_name + PARTIAL_SUFFIX)
+            writer.write(dataset)
+            commit_shard(file_name)
+            experience = None
+
+        # merge the preprocessors of all environments
+        preprocessor = BaseWrapper.from_branches(preprocessors,
+                                                 origin=BaseWrapper.from_serialization(preprocessor_serialized))
+
+        # record the throughput and memory of this worker to make imbalances and leaks visible
+        stats = stats._replace(worker_telemetry={self.id: {"frames": stats.numb_processed_frames,
+                                                           "seconds": time.time() - collection_start,
+                                                           **self.memory_usage()}})
+
+        return stats, preprocessor, experience
 
-        writer = tfl.data.experimental.TFRecordWriter(f"{STORAGE_DIR}/data_{self.id}.tfrecord")
-        writer.write(dataset)
+    @staticmethod
+    def memory_usage() -> dict:
+        """Get the resident memory of this worker's process and, if available, the statistics of TensorFlow's GPU
+        allocator, both in MB."""
+        usage = {"rss": psutil.Process().memory_info().rss / 2 ** 20, "tf_memory": None}
 
-        return stats, preprocessor
+        try:
+            usage["tf_memory"] = {k: v / 2 ** 20 for k, v in tf.config.experimental.get_memory_info("GPU:0").items()}
+        except (AttributeError, ValueError):
+            # allocator statistics are not available in older tensorflow versions or without a GPU
+            pass
+
+        return usage
 
     def evaluate(self, preprocessor_serialized: dict) -> Tuple[int, int, Any]:
         """Evaluate one episode of the given environment following the given policy. Remote implementation."""
         preprocessor = BaseWrapper.from_serialization(preprocessor_serialized)
 
+        act_step = self._get_evaluation_act_step()
+
         # reset policy states as it might be recurrent
-        self.policy.reset_states()
+        act_step.reset_states()
+
+        # with persistent episodes the collecting environment is in the middle of an episode
+        if self.evaluation_env is None:
+            self.evaluation_env = (make_environment(self.env_name, self.action_repeat) if self.persistent_episodes
+                                   else self.env)
+        env = self.evaluation_env
 
         done = False
-        state = preprocessor.modulate((parse_state(self.env.reset()), None, None, None), update=False)[0]
+        state = preprocessor.modulate((parse_state(env.reset()), None, None, None), update=False)[0]
         cumulative_reward = 0
         steps = 0
         while not done:
-            probabilities = flatten(
-                self.policy.predict(add_state_dims(parse_state(state), dims=2 if self.is_recurrent else 1)))
+            actions, _, _ = act_step(add_state_dims(parse_state(state), dims=1))
 
-            action, _ = self.distribution.act(*probabilities)
-            observation, reward, done, _ = self.env.step(action)
+            action = actions[0]
+            observation, reward, done, _ = env.step(action)
             cumulative_reward += reward
             observation, reward, done, _ = preprocessor.modulate((parse_state(observation), reward, done, None),
                                                                  update=False)
@@ -213,8 +370,7 @@ class Gatherer:
             state = observation
             steps += 1
 
-        eps_class = self.env.unwrapped.current_target_finger if hasattr(self.env.unwrapped,
-                                                                        "current_target_finger") else None
+        eps_class = env.unwrapped.current_target_finger if hasattr(env.unwrapped, "current_target_finger") else None
 
         return steps, cumulative_reward, eps_class
 
@@ -223,34 +379,3 @@ class Gatherer:
 class RemoteGatherer(Gatherer):
     pass
 
-
-if __name__ == "__main__":
-    """Performance Measuring."""
-
-    RUN_DEBUG = False
-
-    os.chdir("../")
-    os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
-    os.environ['CUDA_VISIBLE_DEVICES'] = '-1'  # need to deactivate GPU in Debugger mode!
-    tf.config.experimental_run_functions_eagerly(RUN_DEBUG)
-
-    env_n = "HalfCheetah-v2"
-    environment = gym.make(env_n)
-    distro = GaussianPolicyDistribution(environment)
-    builder = build_rnn_models
-    sd, ad = env_extract_dims(environment)
-    wrapper = CombiWrapper((StateNormalizationWrapper(sd), RewardNormalizationWrapper()))
-
-    ray.init()
-    t = time.time()
-    actors = [Gatherer.remote(builder.__name__, distro.__class__.__name__, env_n, i) for i in range(1)]
-
-    for _ in range(100):
-        it = time.time()
-        outs_ffn = ray.get([actor.collect.remote(2048, 0.99, 0.95, 16, wrapper.serialize(), False) for actor in actors])
-        print(f"Gathering Time: {time.time() - it}")
-
-    print(f"Program Runtime: {time.time() - t}")
-
-    # remote function, 8 workers, 2048 horizon: Program Runtime: 24.98351287841797
-    # remote function, 1 worker, 2048 horizon: Program Runtime: 10.563997030258179
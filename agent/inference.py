@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+"""Framework-free inference of exported models, allowing rollout workers to act without building Keras graphs."""
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+from agent.policies import BasePolicyDistribution
+from utilities.model_utils import is_recurrent_model
+from utilities.util import add_state_dims
+
+ACTIVATIONS = {
+    "linear": lambda x: x,
+    "tanh": np.tanh,
+    "relu": lambda x: np.maximum(x, 0),
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "hard_sigmoid": lambda x: np.clip(0.2 * x + 0.5, 0, 1),
+    "softplus": lambda x: np.logaddexp(x, 0),
+    "softmax": lambda x: np.exp(x - np.max(x, axis=-1, keepdims=True)) / np.sum(
+        np.exp(x - np.max(x, axis=-1, keepdims=True)), axis=-1, keepdims=True),
+}
+
+OPERATIONS = {
+    "LogSoftmax": lambda x: x - np.max(x, axis=-1, keepdims=True) - np.log(
+        np.sum(np.exp(x - np.max(x, axis=-1, keepdims=True)), axis=-1, keepdims=True)),
+    "Add": np.add,
+    "AddV2": np.add,
+    "Sub": np.subtract,
+    "Mul": np.multiply,
+    "RealDiv": np.divide,
+}
+
+# configuration entries of leaf layers that are needed to execute them
+LAYER_CONFIG_KEYS = {
+    "Dense": ["activation", "use_bias"],
+    "Activation": ["activation"],
+    "ReLU": ["max_value", "negative_slope", "threshold"],
+    "SimpleRNN": ["units", "activation", "use_bias", "stateful", "return_sequences", "return_state"],
+    "GRU": ["units", "activation", "recurrent_activation", "use_bias", "reset_after", "stateful", "return_sequences",
+            "return_state"],
+    "LSTM": ["units", "activation", "recurrent_activation", "use_bias", "stateful", "return_sequences",
+             "return_state"],
+    "Conv2D": ["strides", "padding", "activation", "use_bias", "dilation_rate"],
+    "MaxPooling2D": ["pool_size", "strides", "padding"],
+    "Flatten": [],
+    "Concatenate": ["axis"],
+    "Masking": ["mask_value"],
+    "StdevLayer": [],
+    "ImageNormalization": [],
+    "InputLayer": [],
+}
+
+
+# EXPORT
+
+def export_model(model) -> dict:
+    """Export a Keras model into a flat specification of its layers, which the NumpyModel can execute.
+
+    The specification only holds python primitives. Weights are not part of it but referenced by their index in
+    model.get_weights(), s.t. the same weight lists that are shared with Keras workers can be used."""
+    weight_index = {id(w): i for i, w in enumerate(model.weights)}
+
+    spec = _export_network(model, weight_index)
+    spec["is_recurrent"] = is_recurrent_model(model)
+    spec["n_weights"] = len(model.weights)
+
+    return spec
+
+
+def _export_network(network, weight_index: dict) -> dict:
+    config = network.get_config()
+
+    layers = []
+    for layer_config in config["layers"]:
+        layer_spec = _export_layer(network.get_layer(layer_config["name"]), weight_index)
+        layer_spec["inbound_nodes"] = [[list(entry[:3]) for entry in node] for node in layer_config["inbound_nodes"]]
+        layers.append(layer_spec)
+
+    return dict(layers=layers,
+                inputs=[list(entry[:3]) for entry in config["input_layers"]],
+                outputs=[list(entry[:3]) for entry in config["output_layers"]])
+
+
+def _export_layer(layer, weight_index: dict) -> dict:
+    class_name = layer.__class__.__name__
+    layer_spec = dict(class_name=class_name, name=layer.name)
+
+    if class_name == "Sequential":
+        raise NotImplementedError("Numpy inference only supports functional models.")
+    elif hasattr(layer, "layers") and hasattr(layer, "get_layer"):
+        layer_spec["class_name"] = "Model"
+        layer_spec["model"] = _export_network(layer, weight_index)
+    elif class_name == "TimeDistributed":
+        layer_spec["layer"] = _export_layer(layer.layer, weight_index)
+    elif class_name == "TensorFlowOpLayer":
+        layer_config = layer.get_config()
+        layer_spec["op"] = layer_config["node_def"]["op"]
+        layer_spec["constants"] = {int(i): np.asarray(c).tolist() for i, c in layer_config["constants"].items()}
+
+        if layer_spec["op"] not in OPERATIONS:
+            raise NotImplementedError(f"Numpy inference does not support the operation {layer_spec['op']}.")
+    elif class_name in LAYER_CONFIG_KEYS:
+        layer_config = layer.get_config()
+        layer_spec["config"] = {k: layer_config[k] for k in LAYER_CONFIG_KEYS[class_name]}
+        layer_spec["weights"] = [weight_index[id(w)] for w in layer.weights]
+
+        activations = [layer_spec["config"].get(a) for a in ["activation", "recurrent_activation"]]
+        if any(a is not None and a not in ACTIVATIONS for a in activations):
+            raise NotImplementedError(f"Numpy inference does not support the activations {activations}.")
+    else:
+        raise NotImplementedError(f"Numpy inference does not support layers of type {class_name}.")
+
+    return layer_spec
+
+
+# EXECUTION
+
+class NumpyModel:
+    """Pure NumPy executor of an exported model.
+
+    Recurrent layers that are stateful keep their hidden states between calls, just like their Keras counterpart."""
+
+    def __init__(self, spec: dict, weights: List[np.ndarray] = None):
+        self.spec = spec
+        self.weights = None
+        self.states = {}
+
+        if weights is not None:
+            self.set_weights(weights)
+
+    @property
+    def is_recurrent(self) -> bool:
+        """Indicate whether the model contains recurrent layers."""
+        return self.spec["is_recurrent"]
+
+    def set_weights(self, weights: List[np.ndarray]):
+        """Set the weights, given in the order of the original model's get_weights()."""
+        assert len(weights) == self.spec["n_weights"], "Number of weights does not match the exported model."
+        self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+
+    def get_weights(self) -> List[np.ndarray]:
+        """Get the weights in the order of the original model's get_weights()."""
+        return self.weights
+
+    def reset_states(self, mask: Union[List, np.ndarray] = None):
+        """Reset the hidden states of stateful recurrent layers, only at the samples given by the mask if any."""
+        if mask is None:
+            self.states = {}
+            return
+
+        mask = np.asarray(mask, dtype=bool)
+        for states in self.states.values():
+            for state in states:
+                state[mask] = 0
+
+    def get_states(self) -> Dict[str, List[np.ndarray]]:
+        """Get copies of the hidden states of stateful recurrent layers."""
+        return {path: [state.copy() for state in states] for path, states in self.states.items()}
+
+    def set_states(self, states: Dict[str, List[np.ndarray]], mask: Union[List, np.ndarray] = None):
+        """Set the hidden states of stateful recurrent layers, only at the samples given by the mask if any."""
+        if mask is None:
+            self.states = {path: [state.copy() for state in layer_states] for path, layer_states in states.items()}
+            return
+
+        mask = np.asarray(mask, dtype=bool)
+        for path, layer_states in states.items():
+            current_states = self.states.setdefault(path, [np.zeros_like(state) for state in layer_states])
+            for current_state, state in zip(current_states, layer_states):
+                current_state[mask] = state[mask]
+
+    def __call__(self, inputs: Union[np.ndarray, List[np.ndarray]]) -> List[np.ndarray]:
+        """Run the model on the given (list of) inputs and return the flat list of its outputs."""
+        assert self.weights is not None, "Weights need to be set before running the model."
+        inputs = inputs if isinstance(inputs, (list, tuple)) else [inputs]
+
+        # images stay uint8 until they are normalized by the model
+        inputs = [np.asarray(x) if np.asarray(x).dtype == np.uint8 else np.asarray(x, dtype=np.float32) for x in inputs]
+        outputs = self._run_network(self.spec, [(x, None) for x in inputs], "")
+        return [output for output, _ in outputs]
+
+    def _run_network(self, spec: dict, inputs: List[Tuple], path: str) -> List[Tuple]:
+        computed = {}
+        for (name, node_index, _), x in zip(spec["inputs"], inputs):
+            computed[(name, node_index)] = [x]
+
+        for layer in spec["layers"]:
+            if layer["class_name"] == "InputLayer":
+                continue
+
+            for node_index, node in enumerate(layer["inbound_nodes"]):
+                node_inputs = [computed[(name, ni)][ti] for name, ni, ti in node]
+                computed[(layer["name"], node_index)] = self._run_layer(layer, node_inputs,
+                                                                        f"{path}/{layer['name']}")
+
+        return [computed[(name, ni)][ti] for name, ni, ti in spec["outputs"]]
+
+    def _run_layer(self, layer: dict, inputs: List[Tuple], path: str) -> List[Tuple]:
+        """Run a layer on a list of (tensor, mask) tuples, returning a list of (tensor, mask) tuples."""
+        class_name = layer["class_name"]
+        config = layer.get("config", {})
+        weights = [self.weights[i] for i in layer.get("weights", [])]
+        x, mask = inputs[0]
+
+        if class_name == "Model":
+            return self._run_network(layer["model"], inputs, path)
+        elif class_name == "TimeDistributed":
+            batch, time = x.shape[:2]
+            outputs = self._run_layer(layer["layer"], [(np.reshape(x, (batch * time,) + x.shape[2:]), None)], path)
+            return [(np.reshape(o, (batch, time) + o.shape[1:]), mask) for o, _ in outputs]
+        elif class_name == "TensorFlowOpLayer":
+            arguments = [i[0] for i in inputs]
+            for position, constant in sorted(layer["constants"].items()):
+                arguments.insert(position, np.asarray(constant, dtype=np.float32))
+            return [(OPERATIONS[layer["op"]](*arguments), mask)]
+        elif class_name == "Dense":
+            x = np.matmul(x, weights[0]) + (weights[1] if config["use_bias"] else 0)
+            return [(ACTIVATIONS[config["activation"]](x), mask)]
+        elif class_name == "Activation":
+            return [(ACTIVATIONS[config["activation"]](x), mask)]
+        elif class_name == "ReLU":
+            x = np.where(x >= config["threshold"], x, config["negative_slope"] * (x - config["threshold"]))
+            return [(x if config["max_value"] is None else np.minimum(x, config["max_value"]), mask)]
+        elif class_name == "StdevLayer":
+            return [(np.matmul(np.ones_like(x), weights[0]), mask)]
+        elif class_name == "ImageNormalization":
+            return [(x.astype(np.float32) / 255., mask)]
+        elif class_name == "Masking":
+            return [(x, np.any(x != config["mask_value"], axis=-1))]
+        elif class_name == "Concatenate":
+            masks = [m for _, m in inputs if m is not None]
+            return [(np.concatenate([i[0] for i in inputs], axis=config["axis"]),
+                     np.all(masks, axis=0) if len(masks) > 0 else None)]
+        elif class_name == "Flatten":
+            return [(np.reshape(x, (x.shape[0], -1)), None)]
+        elif class_name == "Conv2D":
+            return [(self._conv2d(x, config, weights), None)]
+        elif class_name == "MaxPooling2D":
+            windows = _extract_windows(_pad_same(x, config["pool_size"], config["strides"], -np.inf)
+                                       if config["padding"] == "same" else x, config["pool_size"], config["strides"])
+            return [(np.max(windows, axis=(3, 4)), None)]
+        elif class_name in ["SimpleRNN", "GRU", "LSTM"]:
+            return self._run_recurrent(class_name, x, mask, config, weights, path)
+
+        raise NotImplementedError(f"Numpy inference does not support layers of type {class_name}.")
+
+    @staticmethod
+    def _conv2d(x: np.ndarray, config: dict, weights: List[np.ndarray]) -> np.ndarray:
+        assert tuple(config["dilation_rate"]) == (1, 1), "Numpy inference does not support dilated convolutions."
+        kernel = weights[0]
+
+        if config["padding"] == "same":
+            x = _pad_same(x, kernel.shape[:2], config["strides"], 0.)
+
+        x = np.tensordot(_extract_windows(x, kernel.shape[:2], config["strides"]), kernel, axes=([3, 4, 5], [0, 1, 2]))
+        if config["use_bias"]:
+            x = x + weights[1]
+
+        return ACTIVATIONS[config["activation"]](x)
+
+    def _run_recurrent(self, class_name: str, x: np.ndarray, mask: np.ndarray, config: dict,
+                       weights: List[np.ndarray], path: str) -> List[Tuple]:
+        batch, time = x.shape[:2]
+        units = config["units"]
+        n_states = 2 if class_name == "LSTM" else 1
+
+        kernel, recurrent_kernel = weights[:2]
+        bias = weights[2] if config["use_bias"] else np.zeros((2, 3 * units) if config.get("reset_after") else
+                                                              kernel.shape[-1:], dtype=np.float32)
+        activation = ACTIVATIONS[config["activation"]]
+        recurrent_activation = ACTIVATIONS.get(config.get("recurrent_activation"))
+
+        states = self.states.get(path) if config["stateful"] else None
+        if states is None or states[0].shape[0] != batch:
+            states = [np.zeros((batch, units), dtype=np.float32) for _ in range(n_states)]
+
+        outputs = []
+        output = np.zeros((batch, units), dtype=np.float32)
+        for t in range(time):
+            x_t = x[:, t]
+            if class_name == "SimpleRNN":
+                new_states = [activation(np.matmul(x_t, kernel) + bias + np.matmul(states[0], recurrent_kernel))]
+            elif class_name == "GRU":
+                new_states = [self._gru_step(x_t, states[0], kernel, recurrent_kernel, bias, units, activation,
+                                             recurrent_activation, config["reset_after"])]
+            else:
+                z = np.matmul(x_t, kernel) + np.matmul(states[0], recurrent_kernel) + bias
+                i, f, c, o = np.split(z, 4, axis=-1)
+                c = recurrent_activation(f) * states[1] + recurrent_activation(i) * activation(c)
+                new_states = [recurrent_activation(o) * activation(c), c]
+
+            # masked timesteps carry over both the previous states and the previous output
+            if mask is not None:
+                step_mask = mask[:, t:t + 1]
+                new_states = [np.where(step_mask, n, s) for n, s in zip(new_states, states)]
+                output = np.where(step_mask, new_states[0], output)
+            else:
+                output = new_states[0]
+
+            states = new_states
+            outputs.append(output)
+
+        if config["stateful"]:
+            self.states[path] = states
+
+        result = [(np.stack(outputs, axis=1), mask) if config["return_sequences"] else (output, None)]
+        if config["return_state"]:
+            result += [(s, None) for s in states]
+
+        return result
+
+    @staticmethod
+    def _gru_step(x_t, h, kernel, recurrent_kernel, bias, units, activation, recurrent_activation, reset_after):
+        if reset_after:
+            x_z, x_r, x_h = np.split(np.matmul(x_t, kernel) + bias[0], 3, axis=-1)
+            h_z, h_r, h_h = np.split(np.matmul(h, recurrent_kernel) + bias[1], 3, axis=-1)
+            z = recurrent_activation(x_z + h_z)
+            r = recurrent_activation(x_r + h_r)
+            hh = activation(x_h + r * h_h)
+        else:
+            x_z, x_r, x_h = np.split(np.matmul(x_t, kernel) + bias, 3, axis=-1)
+            z = recurrent_activation(x_z + np.matmul(h, recurrent_kernel[:, :units]))
+            r = recurrent_activation(x_r + np.matmul(h, recurrent_kernel[:, units:2 * units]))
+            hh = activation(x_h + np.matmul(r * h, recurrent_kernel[:, 2 * units:]))
+
+        return z * h + (1 - z) * hh
+
+
+def _pad_same(x: np.ndarray, window: Tuple[int, int], strides: Tuple[int, int], value: float) -> np.ndarray:
+    """Pad images (B, H, W, C) like tensorflow's 'same' padding does."""
+    paddings = [(0, 0)]
+    for size, k, s in zip(x.shape[1:3], window, strides):
+        total = max((-(-size // s) - 1) * s + k - size, 0)
+        paddings.append((total // 2, total - total // 2))
+
+    return np.pad(x, paddings + [(0, 0)], mode="constant", constant_values=value)
+
+
+def _extract_windows(x: np.ndarray, window: Tuple[int, int], strides: Tuple[int, int]) -> np.ndarray:
+    """View images (B, H, W, C) as strided windows of shape (B, H_out, W_out, window_h, window_w, C)."""
+    batch, height, width, channels = x.shape
+    out_height = (height - window[0]) // strides[0] + 1
+    out_width = (width - window[1]) // strides[1] + 1
+    sb, sh, sw, sc = x.strides
+
+    return as_strided(x, shape=(batch, out_height, out_width, window[0], window[1], channels),
+                      strides=(sb, sh * strides[0], sw * strides[1], sh, sw, sc), writeable=False)
+
+
+class NumpyActStep:
+    """NumPy counterpart of the compiled ActStep, acting with an exported model."""
+
+    def __init__(self, spec: dict, distribution: BasePolicyDistribution, with_value: bool = True):
+        self.model = NumpyModel(spec)
+        self.distribution = distribution
+        self.with_value = with_value
+        self.is_recurrent = self.model.is_recurrent
+
+    def __call__(self, states: Union[np.ndarray, Tuple]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Act on a batch of states (without time dimension).
+
+        Returns:
+            the actions, their log probabilities and the value estimates of the states, all batched
+        """
+        if self.is_recurrent:
+            states = add_state_dims(states, dims=1, axis=1)
+
+        outputs = self.model(list(states) if isinstance(states, tuple) else [states])
+
+        if self.with_value:
+            parameters, value = outputs[:-1], np.reshape(outputs[-1], [-1])
+        else:
+            parameters, value = outputs, None
+
+        # recurrent models predict for a sequence of length one
+        if self.is_recurrent:
+            parameters = [np.squeeze(p, axis=1) for p in parameters]
+
+        action, log_probability = self.distribution.act_numpy(*parameters)
+
+        if value is None:
+            value = np.zeros(len(log_probability), dtype=np.float32)
+
+        return action, log_probability, value
+
+    def set_weights(self, weights: List[np.ndarray]):
+        """Set the weights of the underlying model."""
+        self.model.set_weights(weights)
+
+    def reset_states(self, mask: Union[List, np.ndarray] = None):
+        """Reset the states of the potentially recurrent model, only at the samples given by the mask if any."""
+        self.model.reset_states(mask)
+
+    def get_states(self) -> Dict[str, List[np.ndarray]]:
+        """Get copies of the states of the potentially recurrent model."""
+        return self.model.get_states()
+
+    def set_states(self, states: Dict[str, List[np.ndarray]], mask: Union[List, np.ndarray] = None):
+        """Set the states of the potentially recurrent model, only at the samples given by the mask if any."""
+        self.model.set_states(states, mask)
@@ -3,6 +3,14 @@
 import tensorflow as tf
 
 
+class ImageNormalization(tf.keras.layers.Layer):
+    """Layer converting uint8 images into float32 values in [0, 1], s.t. frames can be kept as uint8 everywhere outside
+    of the model."""
+
+    def call(self, inputs, **kwargs):
+        return tf.cast(inputs, tf.float32) / 255.
+
+
 class StdevLayer(tf.keras.layers.Layer):
     """Layer carrying parameters to be directly optimized, serving as standard deviations in continuous gaussian
     policies."""
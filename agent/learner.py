@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+"""Replicas of the learner for data-parallel optimization across processes and nodes."""
+from typing import Dict, List, Tuple
+
+import gym
+import numpy as np
+import ray
+import tensorflow as tf
+
+import models
+from agent import policies
+from agent.broadcast import WeightPackage, flatten_weights, unflatten_weights, unpack_weights
+from utilities.model_utils import reset_states_masked_in_graph
+
+
+def shard_experience(data: Dict[str, np.ndarray], n_shards: int, batch_size: int,
+                     shuffle: bool = True) -> Tuple[List[Dict[str, np.ndarray]], int]:
+    """Split the experience of a cycle into one shard per replica, s.t. every minibatch of batch_size samples consists
+    of batch_size / n_shards consecutive samples of every shard. Samples that do not fill a minibatch are dropped.
+
+    Without shuffling, the i-th minibatch holds the i-th batch_size samples of the data, which keeps the sequences of
+    recurrent models in the order in which the single process learner sees them.
+
+    Returns:
+        the shards and the number of minibatches
+    """
+    n_samples = len(next(iter(data.values())))
+    n_batches = n_samples // batch_size
+
+    order = np.random.permutation(n_samples) if shuffle else np.arange(n_samples)
+    order = order[:n_batches * batch_size].reshape(n_batches, n_shards, batch_size // n_shards)
+
+    return [{k: v[order[:, i].ravel()] for k, v in data.items()} for i in range(n_shards)], n_batches
+
+
+def clip_by_global_norm(flat_gradients: np.ndarray, clip_norm: float) -> np.ndarray:
+    """Clip a flat array of gradients like tf.clip_by_global_norm clips the list of arrays it was made of."""
+    global_norm = np.sqrt(np.sum(np.square(flat_gradients, dtype=np.float64)))
+
+    return flat_gradients * float(clip_norm / max(global_norm, clip_norm))
+
+
+class LearnerReplica:
+    """Copy of the learner that computes the gradients on its shard of the experience.
+
+    Every replica holds an agent with the learner's hyperparameters, whose models are built for the replica's share of
+    the minibatch. For every minibatch, the replicas compute the gradients of their samples' losses, normalized by the
+    sample counts of the whole minibatch, s.t. the sum of the replicas' gradients is the gradient of the minibatch.
+    Replicas never apply gradients. The learner sums and clips them and applies them with the only optimizer, whose
+    moments and iterations thus need no synchronization, and sends its updated weights along with the next request."""
+
+    def __init__(self, model_builder_name: str, distribution_name: str, env_name: str, agent_options: dict,
+                 batch_size: int):
+        """Set up the replica's agent.
+
+        Args:
+            agent_options (dict):   the hyperparameters of the learner's agent, given as keyword arguments to it
+            batch_size (int):       the replica's share of every minibatch
+        """
+        from agent.ppo import PPOAgent  # the agent makes its replicas
+
+        environment = gym.make(env_name)
+        self.agent = PPOAgent(getattr(models, model_builder_name), environment,
+                              distribution=getattr(policies, distribution_name)(environment), _make_dirs=False,
+                              **agent_options)
+        self.agent._rebuild_models(batch_size)
+
+        self.batch_size = batch_size
+        self.shard, self.order = None, None
+
+        variables = self.agent.joint.trainable_variables
+        self.shapes = [tuple(v.shape.as_list()) for v in variables]
+        self.dtypes = [v.dtype.as_numpy_dtype for v in variables]
+
+        # compiled through a lambda, since ray wraps the methods of actors in signatures tf.function cannot bind
+        self._compute_step = tf.function(lambda weights, batch, normalizers: self._compute(weights, batch, normalizers))
+
+    def _compute(self, weights, batch, normalizers):
+        for variable, weight in zip(self.agent.joint.trainable_variables, weights):
+            variable.assign(weight)
+
+        gradients, entropy, policy_loss, value_loss, _, kl = self.agent._loss_gradients(batch, normalizers)
+
+        # the kl is a mean over the replica's unmasked steps, weighted by their share of the whole minibatch
+        valid_samples = tf.reduce_sum(tf.cast(tf.not_equal(batch["action_prob"], 0), tf.float32)) \
+            if self.agent.is_recurrent else tf.cast(tf.size(batch["advantage"]), tf.float32)
+        kl = kl * valid_samples / normalizers[0]
+
+        if self.agent.is_recurrent:
+            reset_states_masked_in_graph(self.agent.joint, tf.reduce_any(batch["done"] > 0, axis=-1))
+
+        return gradients, tf.stack([entropy, policy_loss, value_loss, kl])
+
+    def set_weights(self, package: WeightPackage):
+        """Set the weights of the replica's models from a package published by the learner."""
+        self.agent.joint.set_weights(unpack_weights(package))
+
+    def get_weights(self) -> List[np.ndarray]:
+        """Get the weights of the replica's models."""
+        return self.agent.joint.get_weights()
+
+    def load_shard(self, shard: Dict[str, np.ndarray]):
+        """Hold a new shard of experience, replacing the previous one."""
+        self.shard = shard
+        self.order = np.arange(len(shard["advantage"]))
+
+    def start_epoch(self):
+        """Reshuffle the shard for a new epoch, unless the model is recurrent and needs the sequences in order."""
+        if not self.agent.is_recurrent:
+            self.order = np.random.permutation(len(self.shard["advantage"]))
+
+    def compute_gradients(self, flat_weights: np.ndarray, batch_index: int, subsequence: int,
+                          normalizers: Tuple[float, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Compute the gradients on the replica's share of a minibatch at the given trainable weights of the learner.
+        For recurrent models, the share is one subsequence of the sequences, and the states continue from the previous
+        subsequence.
+
+        Args:
+            flat_weights (np.ndarray):  the learner's current trainable weights, flattened
+            batch_index (int):          the index of the minibatch in the current epoch
+            subsequence (int):          the index of the subsequence for recurrent models, ignored otherwise
+            normalizers (tuple):        the number of unmasked and of all samples in the whole (sub-)minibatch
+
+        Returns:
+            the flat gradients, and the entropy, policy loss, value loss and approximate KL divergence as shares of
+            those of the minibatch
+        """
+        rows = self.order[batch_index * self.batch_size:(batch_index + 1) * self.batch_size]
+        batch = {k: v[rows] for k, v in self.shard.items()}
+        if self.agent.is_recurrent:
+            if subsequence == 0:
+                self.agent.joint.reset_states()
+            batch = {k: v[:, subsequence] for k, v in batch.items()}
+
+        weights = [tf.constant(w) for w in unflatten_weights(flat_weights, self.shapes, self.dtypes)]
+        gradients, statistics = self._compute_step(weights, batch, tuple(tf.constant(n, tf.float32)
+                                                                         for n in normalizers))
+
+        return flatten_weights([g.numpy() for g in gradients]), statistics.numpy()
+
+
+@ray.remote
+class RemoteLearnerReplica(LearnerReplica):
+    pass
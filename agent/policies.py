@@ -8,6 +8,7 @@ from typing import Union, Tuple
 import gym
 import numpy as np
 import tensorflow as tf
+from scipy.special import gammaln
 
 from agent.layers import StdevLayer
 from utilities.const import EPSILON
@@ -51,6 +52,31 @@ class BasePolicyDistribution(abc.ABC):
 
         pass
 
+    @abc.abstractmethod
+    def act_in_graph(self, *args) -> Tuple[tf.Tensor, tf.Tensor]:
+        """Sample actions for a batch of distribution parameters and return them alongside their log probabilities.
+        Only uses tensorflow operations, s.t. it can be part of a compiled graph.
+
+        Input Shapes: (B, A) per parameter
+        Output Shapes: (B, A) or (B,) for discrete actions, and (B,)
+        """
+        pass
+
+    @abc.abstractmethod
+    def act_deterministic_in_graph(self, *args) -> tf.Tensor:
+        """Choose the most likely actions for a batch of distribution parameters inside a compiled graph."""
+        pass
+
+    @abc.abstractmethod
+    def act_numpy(self, *args) -> Tuple[np.ndarray, np.ndarray]:
+        """Sample actions for a batch of distribution parameters and return them alongside their log probabilities.
+        Only uses numpy, s.t. it can be used without any tensorflow runtime.
+
+        Input Shapes: (B, A) per parameter
+        Output Shapes: (B, A) or (B,) for discrete actions, and (B,)
+        """
+        pass
+
     @abc.abstractmethod
     def sample(self, *args, **kwargs):
         """Sample an action from the distribution."""
@@ -75,11 +101,15 @@ class BasePolicyDistribution(abc.ABC):
         """Calculate the entropy of the distribution based on log parameters."""
         pass
 
-    @tf.function
-    def approximate_kl_divergence(self, log_pa: tf.Tensor, log_pb: tf.Tensor):
+    def approximate_kl_divergence(self, log_pa: tf.Tensor, log_pb: tf.Tensor, mask: tf.Tensor = None):
         """Approximate KL-divergence between distributions a and b where some sample has probability pa in a
-        and pb in b, based on log probabilities."""
-        return .5 * tf.reduce_mean(tf.square(log_pa - log_pb))
+        and pb in b, based on log probabilities. If a boolean mask is given, only the samples it marks are averaged."""
+        squared_difference = tf.square(log_pa - log_pb)
+        if mask is None:
+            return .5 * tf.reduce_mean(squared_difference)
+
+        return .5 * tf.math.divide_no_nan(tf.reduce_sum(tf.where(mask, squared_difference, 0)),
+                                          tf.reduce_sum(tf.cast(mask, tf.float32)))
 
     @abc.abstractmethod
     def build_action_head(self, n_actions: int, input_shape: tuple, batch_size: Union[int, None]):
@@ -109,6 +139,23 @@ class CategoricalPolicyDistribution(BasePolicyDistribution):
         action = self.sample(log_probabilities)
         return action, tf.squeeze(log_probabilities)[action]
 
+    def act_in_graph(self, log_probabilities: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+        """Sample a batch of actions from a batch of log pmfs, alongside the actions' log probabilities."""
+        actions = tf.squeeze(tf.random.categorical(log_probabilities, 1), axis=-1)
+        return actions, tf.gather(log_probabilities, actions, batch_dims=1)
+
+    def act_deterministic_in_graph(self, log_probabilities: tf.Tensor) -> tf.Tensor:
+        """Choose the most probable action for every pmf in the batch."""
+        return tf.argmax(log_probabilities, axis=-1)
+
+    def act_numpy(self, log_probabilities: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Sample a batch of actions from a batch of log pmfs by inverting their cdfs."""
+        cdfs = np.cumsum(np.exp(log_probabilities), axis=-1)
+        thresholds = np.random.random((len(cdfs), 1)) * cdfs[:, -1:]
+        actions = np.minimum(np.sum(cdfs < thresholds, axis=-1), cdfs.shape[-1] - 1)
+
+        return actions, np.take_along_axis(log_probabilities, actions[:, None], axis=-1)[:, 0]
+
     def sample(self, log_probabilities):
         """Sample an action from the distribution."""
         assert isinstance(log_probabilities, tf.Tensor) or isinstance(log_probabilities, np.ndarray), \
@@ -134,17 +181,14 @@ class CategoricalPolicyDistribution(BasePolicyDistribution):
         """Not implemented"""
         raise NotImplementedError("A categorical distribution has no pdf.")
 
-    @tf.function
     def _entropy_from_pmf(self, pmf: tf.Tensor):
         """Calculate entropy of a categorical distribution from raw pmf."""
         return - tf.reduce_sum(tf.math.log(pmf) * pmf, axis=-1)
 
-    @tf.function
     def _entropy_from_log_pmf(self, pmf: tf.Tensor):
         """Calculate entropy of a categorical distribution, where the pmf is given as log probabilities."""
         return - tf.reduce_sum(tf.exp(pmf) * pmf, axis=-1)
 
-    @tf.function
     def entropy(self, pmf: tf.Tensor):
         """Calculate entropy of a categorical distribution, where the pmf is given as log probabilities."""
         return - self._entropy_from_log_pmf(pmf)
@@ -200,6 +244,25 @@ class GaussianPolicyDistribution(BaseContinuousPolicyDistribution):
 
         return tf.reshape(actions, [-1]).numpy(), tf.squeeze(probabilities).numpy()
 
+    def act_in_graph(self, means: tf.Tensor, log_stdevs: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+        """Sample a batch of actions by reparameterizing standard normal noise, alongside their log probabilities."""
+        actions = means + tf.exp(log_stdevs) * tf.random.normal(tf.shape(means))
+        return actions, self.log_probability(actions, means, log_stdevs)
+
+    def act_deterministic_in_graph(self, means: tf.Tensor, log_stdevs: tf.Tensor) -> tf.Tensor:
+        """The most likely action of a gaussian is its mean."""
+        return means
+
+    def act_numpy(self, means: np.ndarray, log_stdevs: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Sample a batch of actions, alongside their log probabilities as calculated by log_probability."""
+        stdevs = np.exp(log_stdevs)
+        actions = (means + stdevs * np.random.standard_normal(means.shape)).astype(np.float32)
+        log_likelihoods = (- np.sum(log_stdevs, axis=-1)
+                           - np.log(2 * np.pi)
+                           - (0.5 * np.sum(np.square((actions - means) / stdevs), axis=-1)))
+
+        return actions, log_likelihoods.astype(np.float32)
+
     def sample(self, means: tf.Tensor, log_stdevs: tf.Tensor):
         """Sample from the Gaussian distribution."""
         action = tf.random.normal(means.shape, means, tf.exp(log_stdevs))
@@ -212,7 +275,6 @@ class GaussianPolicyDistribution(BaseContinuousPolicyDistribution):
         pdf = (tf.exp(-(tf.pow(samples_transformed, 2) / 2)) / tf.sqrt(2 * math.pi)) / stdevs
         return tf.math.reduce_prod(pdf, axis=-1)
 
-    @tf.function
     def log_probability(self, samples: tf.Tensor, means: tf.Tensor, log_stdevs: tf.Tensor):
         """Calculate log probability density for a given batch of potentially joint Gaussian PDF.
 
@@ -228,7 +290,6 @@ class GaussianPolicyDistribution(BaseContinuousPolicyDistribution):
 
         return log_likelihoods
 
-    @tf.function
     def _entropy_from_params(self, stdevs: tf.Tensor):
         """Calculate the joint entropy of Gaussian random variables described by their standard deviations.
 
@@ -240,7 +301,6 @@ class GaussianPolicyDistribution(BaseContinuousPolicyDistribution):
         entropy = .5 * tf.math.log(2 * math.pi * math.e * tf.pow(stdevs, 2))
         return tf.reduce_sum(entropy, axis=-1)
 
-    @tf.function
     def _entropy_from_log_params(self, log_stdevs: tf.Tensor):
         """Calculate the joint entropy of Gaussian random variables described by their log standard deviations.
 
@@ -252,7 +312,6 @@ class GaussianPolicyDistribution(BaseContinuousPolicyDistribution):
         entropy = .5 * (tf.math.log(math.pi * 2) + (tf.multiply(2.0, log_stdevs) + 1.0))
         return tf.reduce_sum(entropy, axis=-1)
 
-    @tf.function
     def _approx_entropy_from_log(self, log_stdevs: tf.Tensor):
         """Calculate the joint entropy of Gaussian random variables described by their log standard deviations, but in
         an approximation. Essentially this removes any unnecessary scaling calculations and only leaves the bare
@@ -265,7 +324,6 @@ class GaussianPolicyDistribution(BaseContinuousPolicyDistribution):
         """
         return tf.reduce_sum(log_stdevs, axis=-1)
 
-    @tf.function
     def entropy(self, params: tf.Tensor):
         """Calculate the joint entropy of Gaussian random variables described by their log standard deviations.
 
@@ -332,6 +390,31 @@ class BetaPolicyDistribution(BaseContinuousPolicyDistribution):
 
         return actions
 
+    def act_in_graph(self, alphas: tf.Tensor, betas: tf.Tensor) -> Tuple[tf.Tensor, tf.Tensor]:
+        """Sample a batch of actions as ratio of gamma variates, alongside their log probabilities."""
+        x = tf.random.gamma([], alphas)
+        y = tf.random.gamma([], betas)
+
+        # we need to prevent 0 and 1 as actions, otherwise log in probability calculation can fuck up
+        samples = tf.clip_by_value(x / (x + y), EPSILON, 1 - EPSILON)
+        actions = self._scale_sample_to_action_range(samples)
+
+        return actions, self.log_probability(actions, alphas, betas)
+
+    def act_deterministic_in_graph(self, alphas: tf.Tensor, betas: tf.Tensor) -> tf.Tensor:
+        """Compute the modes of a batch of beta distributions as actions."""
+        return self._scale_sample_to_action_range((alphas - 1) / (alphas + betas - 2))
+
+    def act_numpy(self, alphas: np.ndarray, betas: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Sample a batch of actions, alongside their log probabilities as calculated by log_probability."""
+        samples = np.clip(np.random.beta(alphas, betas), EPSILON, 1 - EPSILON)
+        actions = (samples * self.action_mm_diff + self.action_min_values).astype(np.float32)
+
+        log_pdf = (np.log(samples) * (alphas - 1.) + np.log(1. - samples) * (betas - 1.)
+                   - gammaln(alphas) - gammaln(betas) + gammaln(alphas + betas))
+
+        return actions, np.sum(log_pdf, axis=-1).astype(np.float32)
+
     def sample(self, alphas: tf.Tensor, betas: tf.Tensor):
         """Sample from the Beta distribution."""
         actions = np.random.beta(alphas, betas).astype("float32")
@@ -344,11 +427,9 @@ class BetaPolicyDistribution(BaseContinuousPolicyDistribution):
 
         return actions
 
-    @tf.function
     def _scale_sample_to_action_range(self, sample) -> tf.Tensor:
         return tf.add(tf.multiply(sample, self.action_mm_diff), self.action_min_values)
 
-    @tf.function
     def _scale_sample_to_distribution_range(self, sample) -> tf.Tensor:
         # clipping just to, you know, be sure
         return tf.clip_by_value(tf.divide(tf.subtract(sample, self.action_min_values), self.action_mm_diff), EPSILON, 1 - EPSILON)
@@ -364,7 +445,6 @@ class BetaPolicyDistribution(BaseContinuousPolicyDistribution):
 
         return tf.math.reduce_prod(top / bab, axis=-1)
 
-    @tf.function
     def log_probability(self, samples: tf.Tensor, alphas: tf.Tensor, betas: tf.Tensor):
         """Log probability utilizing the fact that tensorflow directly returns log of gamma function.
 
@@ -381,12 +461,10 @@ class BetaPolicyDistribution(BaseContinuousPolicyDistribution):
 
         return tf.math.reduce_sum(log_pdf, axis=-1)
 
-    @tf.function
     def entropy(self, params: Tuple[tf.Tensor, tf.Tensor]):
         """Entropy of the beta distribution."""
         return self._entropy_from_params(params)
 
-    @tf.function
     def _entropy_from_params(self, params: Tuple[tf.Tensor, tf.Tensor]):
         """Entropy of the beta distribution"""
         alphas, betas = params
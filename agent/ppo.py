@@ -22,16 +22,23 @@ from tqdm import tqdm
 import models
 from agent import policies
 from agent.core import extract_discrete_action_probabilities
-from agent.dataio import read_dataset_from_storage
+from agent.broadcast import WeightDistributor, WeightPackage, flatten_weights, unflatten_weights
+from agent.dataio import read_dataset_from_storage, delete_cycle_from_storage, make_dataset_from_arrays, \
+    read_columnar_dataset_from_storage, MemmapExperienceStore, SHADOW_HAND_FEATURES
 from agent.gather import Gatherer, RemoteGatherer
+from agent.inference import export_model
+from agent.learner import RemoteLearnerReplica, shard_experience, clip_by_global_norm
 from agent.policies import BasePolicyDistribution, CategoricalPolicyDistribution, GaussianPolicyDistribution
+from environments import supports_action_repeat
 from utilities import const
 from utilities.const import COLORS, BASE_SAVE_PATH, PRETRAINED_COMPONENTS_PATH
-from utilities.const import MIN_STAT_EPS, RESET_EVERY
-from utilities.datatypes import condense_stats, StatBundle
-from utilities.model_utils import is_recurrent_model, get_layer_names, get_component, reset_states_masked, \
-    requires_batch_size
-from utilities.util import flat_print, env_extract_dims, add_state_dims, merge_into_batch, detect_finished_episodes
+from utilities.const import MIN_STAT_EPS, RESET_EVERY, STORAGE_DIR
+from utilities.datatypes import condense_stats, StatBundle, worker_throughputs, worker_memory_usages
+from utilities.model_utils import is_recurrent_model, get_layer_names, get_component, \
+    reset_states_masked_in_graph, requires_batch_size, compute_precision, get_recurrent_states, \
+    reset_variables_masked_in_graph, create_optimizer_slots, tensorflow_version
+from utilities.statistics import mean_confidence_interval_width
+from utilities.util import flat_print, env_extract_dims, add_state_dims, merge_into_batch, env_extract_state_dtypes
 from utilities.wrappers import BaseWrapper, CombiWrapper, SkipWrapper, BaseRunningMeanWrapper
 
 
@@ -52,7 +59,12 @@ class PPOAgent:
                  discount: float = 0.99, lam: float = 0.95, clip: float = 0.2, c_entropy: float = 0.01,
                  c_value: float = 0.5, gradient_clipping: float = None, clip_values: bool = True,
                  tbptt_length: int = 16, lr_schedule: str = None, distribution: BasePolicyDistribution = None,
-                 preprocessor=None, _make_dirs=True, debug: bool = False, pretrained_components: list = None):
+                 preprocessor=None, _make_dirs=True, debug: bool = False, pretrained_components: list = None,
+                 envs_per_worker: int = 1, inference: str = "keras", experience_transport: str = "columnar",
+                 weight_broadcast_dtype: str = "float32", frame_budget: int = None, straggler_policy: str = "keep",
+                 memory_threshold: float = None, persistent_episodes: bool = False, action_repeat: int = 1,
+                 learner: str = "dataset", precision: str = "float32", xla: bool = False,
+                 gradient_accumulation: int = 1, target_kl: float = None, learner_replicas: int = 1):
         """ Initialize the PPOAgent with given hyperparameters. Policy and value network will be freshly initialized.
 
         Args:
@@ -61,10 +73,49 @@ class PPOAgent:
             environment (gym.Env): the environment in which the agent will learn 
             horizon (int): the number of timesteps each worker collects 
             workers (int): the number of workers
+            envs_per_worker (int): the number of environments each worker steps in lockstep, splitting its horizon
+            inference (str): how workers run the model, either 'keras' (default) or 'numpy', where the latter acts
+                with a pure numpy executor of the exported joint model and avoids building Keras models in workers;
+                the workers still import tensorflow through the modules they share with the learner
+            experience_transport (str): how workers hand their experience to the learner, either 'columnar' (default)
+                files in the storage directory holding one contiguous array per field, 'tfrecord' files of serialized
+                samples, 'object_store', where the arrays are passed through Ray's shared memory object store
+                without serialization, or 'memmap', where workers write into memory mapped files of the run's storage
+                folder from which the learner gathers minibatches, for experience too large to be held in memory
+            weight_broadcast_dtype (str): dtype in which weights are broadcast to the workers, 'float32' (default) or
+                'float16' to halve the transported size
+            frame_budget (int): if given, the total number of frames collected per cycle; workers then repeatedly
+                collect chunks of horizon steps, whichever worker is free first, until the budget is reached; requires
+                the object_store experience transport
+            straggler_policy (str): what happens to chunks still being collected when the frame budget is reached,
+                either 'keep' (default) to wait for and use them or 'discard' to drop them and move on immediately
+            memory_threshold (float): if given, workers whose resident memory exceeds this many MB are replaced after
+                their collection, instead of recreating all workers every RESET_EVERY cycles
+            persistent_episodes (bool): if True, workers keep their environments, running episodes and recurrent
+                states between collections instead of starting fresh episodes in every cycle; the running episodes
+                live in the workers' environments and cannot be handed over, hence workers are then not recreated
+                every RESET_EVERY cycles, and workers replaced for exceeding the memory threshold start fresh episodes
+            action_repeat (int): number of simulator steps the workers' environments hold every action for, only
+                supported by the ShadowHand environments; horizons and frame budgets count decisions, not sim steps
+            learner (str): how the model is optimized on a cycle's experience, either 'dataset' (default), iterating
+                minibatches of the dataset from python, or 'resident', which loads the experience into tensors once and
+                runs all epochs of randomly permuted minibatches in one compiled loop; only for non-recurrent models
+            precision (str): compute precision of the learner's models, 'float32' (default) or 'bfloat16', where layers
+                compute in bfloat16 while weights, losses and gradients stay float32; workers always act in float32
+            xla (bool): if True, the learner step (forward pass, losses, gradient clipping and Adam update) is
+                compiled with XLA; requires tensorflow 2.1 or newer, a non-recurrent model and the dataset learner, as
+                XLA recompiles recurrent layers in every step and cannot compile the resident learner's loop
+            gradient_accumulation (int): number of micro-batches every minibatch is split into, whose gradients are
+                accumulated before a single update; trades memory for speed without changing the effective batch size
+            learner_replicas (int): if above 1, the optimization is data-parallel over this many remote replicas of
+                the learner, each computing the gradients on its shard of every minibatch; the summed gradients are
+                clipped and applied by the agent alone, which sends its weights to the replicas with every request
             learning_rate (float): the learning rate of the Adam optimizer
             discount (float): discount factor for future rewards during collection
             lam (float): lambda parameter of the generalized advantage estimation
             clip (float): clipping range for both policy and value loss
+            target_kl (float): if given, the remaining epochs of a cycle are skipped once the mean approximate KL
+                divergence between the behavior policy and the current policy exceeds this in an epoch
             c_entropy (float): coefficient for entropy in the combined loss
             c_value (float): coefficient fot value in the combined loss
             gradient_clipping (float): max norm for the gradient clipping, set None to deactivate (default)
@@ -79,6 +130,22 @@ class PPOAgent:
 
         # checkups
         assert lr_schedule is None or isinstance(lr_schedule, str)
+        assert inference in ["keras", "numpy"], "Unknown inference type. Choose one of (keras, numpy)."
+        assert experience_transport in ["columnar", "tfrecord", "object_store", "memmap"], \
+            "Unknown experience transport. Choose one of (columnar, tfrecord, object_store, memmap)."
+        assert frame_budget is None or experience_transport == "object_store", \
+            "A frame budget requires the object_store experience transport."
+        assert straggler_policy in ["keep", "discard"], "Unknown straggler policy. Choose one of (keep, discard)."
+        assert learner in ["dataset", "resident"], "Unknown learner. Choose one of (dataset, resident)."
+        assert gradient_accumulation >= 1, "Gradient accumulation needs at least one micro-batch."
+        assert learner_replicas >= 1, "The learner needs at least one replica."
+        assert learner_replicas == 1 or (learner == "dataset" and gradient_accumulation == 1), \
+            "Data-parallel learning works with neither the resident learner nor gradient accumulation."
+        assert action_repeat == 1 or supports_action_repeat(environment.unwrapped.spec.id), \
+            "Action repetition is only supported by the ShadowHand environments."
+        assert not xla or tensorflow_version() >= (2, 1), \
+            f"Compiling the learner with XLA requires tensorflow 2.1 or newer, found {tf.__version__}."
+        assert not xla or learner == "dataset", "XLA compilation does not support the resident learner."
 
         # environment info
         self.env = environment
@@ -97,9 +164,26 @@ class PPOAgent:
         # hyperparameters
         self.horizon = horizon
         self.n_workers = workers
+        self.envs_per_worker = envs_per_worker
+        self.inference = inference
+        self.experience_transport = experience_transport
+        self.weight_broadcast_dtype = weight_broadcast_dtype
+        self.weight_distributor = WeightDistributor(dtype=weight_broadcast_dtype)
+        self.frame_budget = frame_budget
+        self.straggler_policy = straggler_policy
+        self.memory_threshold = memory_threshold
+        self.persistent_episodes = persistent_episodes
+        self.action_repeat = action_repeat
+        self.learner = learner
+        self.precision = precision
+        self.xla = xla
+        self.gradient_accumulation = gradient_accumulation
+        self.learner_replicas = learner_replicas
+        self._replicas, self._replica_batch_size = [], None
         self.discount = discount
         self.learning_rate = learning_rate
         self.clip = clip
+        self.target_kl = target_kl
         self.c_entropy = tf.constant(c_entropy, dtype=tf.float32)
         self.c_value = tf.constant(c_value, dtype=tf.float32)
         self.lam = lam
@@ -128,8 +212,9 @@ class PPOAgent:
         assert self.continuous_control == self.distribution.is_continuous, "Invalid distribution for environment."
         self.model_builder = model_builder
         self.builder_function_name = model_builder.__name__
-        self.policy, self.value, self.joint = model_builder(self.env, self.distribution,
-                                                            **({"bs": 1} if requires_batch_size(model_builder) else {}))
+        with compute_precision(precision):
+            self.policy, self.value, self.joint = model_builder(
+                self.env, self.distribution, **({"bs": 1} if requires_batch_size(model_builder) else {}))
 
         if pretrained_components is not None:
             print("Loading pretrained components:")
@@ -154,6 +239,10 @@ class PPOAgent:
         self.is_recurrent = is_recurrent_model(self.policy)
         if not self.is_recurrent:
             self.tbptt_length = 1
+        assert not (self.is_recurrent and self.learner == "resident"), \
+            "The resident learner requires a non-recurrent model."
+        assert not (self.is_recurrent and self.xla), "XLA compilation requires a non-recurrent model."
+        self._compile_learner()
 
         # passing one sample, which for some reason prevents cuDNN init error
         if isinstance(self.env.observation_space, Dict) and "observation" in self.env.observation_space.sample():
@@ -165,6 +254,8 @@ class PPOAgent:
         self.current_fps = 0
         self.gathering_fps = 0
         self.optimization_fps = 0
+        self.cold_optimization_fps = 0
+        self.warm_optimization_fps = 0
         self.device = "CPU:0"
         self.model_export_dir = "storage/saved_models/exports/"
         self.agent_id = round(time.time())
@@ -173,11 +264,6 @@ class PPOAgent:
             os.makedirs(self.model_export_dir, exist_ok=True)
             os.makedirs(self.agent_directory, exist_ok=True)
 
-        if os.path.isdir("storage/experience"):
-            # TODO loading a currently training agent will potentially delete its storage
-            # shutil.rmtree("storage/experience/")
-            pass
-        os.makedirs("storage/experience/", exist_ok=True)
 
         # statistics
         self.total_frames_seen = 0
@@ -190,11 +276,18 @@ class PPOAgent:
         self.cycle_length_std_history = []
         self.cycle_stat_n_history = []
         self.entropy_history = []
+        self.epoch_duration_history = []
         self.policy_loss_history = []
         self.value_loss_history = []
+        self.kl_history = []
+        self.epochs_history = []
         self.time_dicts = []
         self.cycle_timings = []
         self.underflow_history = []
+        self.policy_lag_history = []
+        self.worker_throughput_history = []
+        self.worker_memory_history = []
+        self.recycled_workers_history = []
 
         self.preprocessor_stat_history = {
             w.__class__.__name__: {"mean": [w.simplified_mean()], "stdev": [w.simplified_stdev()]}
@@ -208,7 +301,8 @@ class PPOAgent:
         """Set GPU usage mode."""
         self.device = "GPU:0" if activated else "CPU:0"
 
-    def policy_loss(self, action_prob: tf.Tensor, old_action_prob: tf.Tensor, advantage: tf.Tensor) -> tf.Tensor:
+    def policy_loss(self, action_prob: tf.Tensor, old_action_prob: tf.Tensor, advantage: tf.Tensor,
+                    normalizer: tf.Tensor = None) -> tf.Tensor:
         """Actor's clipped objective as given in the PPO paper. Original objective is to be maximized
         (as given in the paper), but this is the negated objective to be minimized! In the recurrent version
         a mask is calculated based on 0 values in the old_action_prob tensor. This mask is then applied in the mean
@@ -218,6 +312,8 @@ class PPOAgent:
           action_prob (tf.Tensor): the probability of the action for the state under the current policy
           old_action_prob (tf.Tensor): the probability of the action taken given by the old policy during the episode
           advantage (tf.Tensor): the advantage that taking the action gives over the estimated state value
+          normalizer (tf.Tensor): if given, the summed loss is divided by this instead of the number of (unmasked)
+            samples, e.g. the sample count of a whole minibatch when this is only a micro-batch of it
 
         Returns:
           the value of the objective function
@@ -232,13 +328,16 @@ class PPOAgent:
         if self.is_recurrent:
             # build and apply a mask over the probabilities (recurrent)
             mask = tf.not_equal(old_action_prob, 0)
-            clipped_masked = tf.where(mask, clipped, 0)
-            return tf.reduce_sum(clipped_masked) / tf.reduce_sum(tf.cast(mask, tf.float32))
-        else:
+            clipped = tf.where(mask, clipped, 0)
+            if normalizer is None:
+                normalizer = tf.reduce_sum(tf.cast(mask, tf.float32))
+        elif normalizer is None:
             return tf.reduce_mean(clipped)
 
+        return tf.reduce_sum(clipped) / normalizer
+
     def value_loss(self, value_predictions: tf.Tensor, old_values: tf.Tensor, returns: tf.Tensor,
-                   old_action_prob: tf.Tensor, clip: bool = True) -> tf.Tensor:
+                   old_action_prob: tf.Tensor, clip: bool = True, normalizer: tf.Tensor = None) -> tf.Tensor:
         """Loss of the critic network as squared error between the prediction and the sampled future return. In the
         recurrent case a mask is calculated based on 0 values in the old_action_prob tensor. This mask is then applied
         in the mean operation of the loss.
@@ -249,6 +348,8 @@ class PPOAgent:
           returns (tf.Tensor): discounted return estimation
           old_action_prob (tf.Tensor): probabilities from old policy, used to determine mask
           clip (object): (Default value = True) value loss can be clipped by same range as policy loss
+          normalizer (tf.Tensor): if given, the summed error is divided by this instead of the number of (unmasked)
+            samples
 
         Returns:
           squared error between prediction and return
@@ -264,12 +365,15 @@ class PPOAgent:
         if self.is_recurrent:
             # build and apply a mask over the old values (recurrent)
             mask = tf.not_equal(old_action_prob, 0)
-            error_masked = tf.where(mask, error, 0)  # masking with tf.where because inf * 0 = nan...
-            return (tf.reduce_sum(error_masked) / tf.reduce_sum(tf.cast(mask, tf.float32))) * 0.5
-        else:
+            error = tf.where(mask, error, 0)  # masking with tf.where because inf * 0 = nan...
+            if normalizer is None:
+                normalizer = tf.reduce_sum(tf.cast(mask, tf.float32))
+        elif normalizer is None:
             return tf.reduce_mean(error) * 0.5
 
-    def entropy_bonus(self, policy_output: tf.Tensor) -> tf.Tensor:
+        return (tf.reduce_sum(error) / normalizer) * 0.5
+
+    def entropy_bonus(self, policy_output: tf.Tensor, normalizer: tf.Tensor = None) -> tf.Tensor:
         """Entropy of policy output acting as regularization by preventing dominance of one action. The higher the
         entropy, the less probability mass lies on a single action, which would hinder exploration. We hence reduce
         the loss by the (scaled by c_entropy) entropy to encourage a certain degree of exploration.
@@ -277,15 +381,21 @@ class PPOAgent:
         Args:
           policy_output (tf.Tensor): a tensor containing (batches of) probabilities for actions in the case of discrete
             actions or (batches of) means and standard deviations for continuous control.
+          normalizer (tf.Tensor): if given, the summed entropy is divided by this instead of the number of samples
 
         Returns:
           entropy bonus
         """
-        return tf.reduce_mean(self.distribution.entropy(policy_output))
+        entropy = self.distribution.entropy(policy_output)
+        if normalizer is None:
+            return tf.reduce_mean(entropy)
+
+        return tf.reduce_sum(entropy) / normalizer
 
     def drill(self, n: int, epochs: int, batch_size: int, monitor=None, export: bool = False, save_every: int = 0,
               separate_eval: bool = False, stop_early: bool = True, ray_is_initialized: bool = False, save_best=True,
-              parallel=True, radical_evaluation=False, redis_auth: Tuple[str, str] = None) -> "PPOAgent":
+              parallel=True, radical_evaluation=False, redis_auth: Tuple[str, str] = None,
+              pipelined: bool = False, evaluation_ci_width: float = None) -> "PPOAgent":
         """Start a training loop of the agent.
         
         Runs **n** cycles of experience gathering and optimization based on the gathered experience.
@@ -308,23 +418,30 @@ class PPOAgent:
 
             redis_auth: tuple of redis head ip address and password; if None (default), ray is initialized on the
                 current default node
+            pipelined (bool): if true, workers already collect the next cycle with the current weights while the
+                learner optimizes on the current cycle; the resulting policy lag is recorded in policy_lag_history
+            evaluation_ci_width (float): if given, separate evaluations stop early once the 95% confidence interval
+                of the mean reward is narrower than this
 
         Returns:
             self
         """
         assert self.horizon * self.n_workers >= batch_size, "Batch Size is larger than the number of transitions."
-        if self.is_recurrent and batch_size > self.n_workers:
+        assert self.horizon % self.envs_per_worker == 0, "Horizon is not divisible by the environments per worker."
+        n_chunks = self.n_workers if self.frame_budget is None else max(1, self.frame_budget // self.horizon)
+        n_independent_sequences = n_chunks * self.envs_per_worker
+        if self.is_recurrent and batch_size > n_independent_sequences:
             logging.warning(
                 f"Batchsize is larger than possible with the available number of independent sequences for "
-                f"Truncated BPTT. Setting batchsize to {self.n_workers}, which means {self.n_workers * self.tbptt_length} "
-                f"transitions per batch.")
-            batch_size = self.n_workers
+                f"Truncated BPTT. Setting batchsize to {n_independent_sequences}, which means "
+                f"{n_independent_sequences * self.tbptt_length} transitions per batch.")
+            batch_size = n_independent_sequences
+        assert batch_size % self.gradient_accumulation == 0, \
+            "Batch size is not divisible by the number of micro-batches for gradient accumulation."
+        assert batch_size % self.learner_replicas == 0, "Batch size is not divisible by the number of learner replicas."
 
-        # rebuild model with desired batch size
-        weights = self.joint.get_weights()
-        self.policy, self.value, self.joint = self.model_builder(self.env, self.distribution, **(
-            {"bs": batch_size} if requires_batch_size(self.model_builder) else {}))
-        self.joint.set_weights(weights)
+        # rebuild model with desired batch size, which for gradient accumulation is the size of the micro-batches
+        self._rebuild_models(batch_size // self.gradient_accumulation)
 
         if parallel:
             if not ray_is_initialized:
@@ -338,18 +455,23 @@ class PPOAgent:
         print(f"Training on {len(ray.nodes())} nodes: {ray.nodes()}")
         print(f"Using {available_cpus} CPUs.")
 
+        if pipelined and not parallel:
+            logging.warning("Pipelining requires parallel workers. Running the drill without pipelining.")
+            pipelined = False
+        if pipelined and self.frame_budget is not None:
+            logging.warning("Pipelining is not supported with a frame budget. Running the drill without pipelining.")
+            pipelined = False
+
+        if self.learner_replicas > 1:
+            self._make_learner_replicas(batch_size)
+            print(f"Optimizing data-parallel on {self.learner_replicas} learner replicas.")
         workers = self._make_workers(parallel, verbose=True)
 
         cycle_start = None
+        pending_collection, collection_start, collection_version, optimization_end = None, None, None, None
+        straggling_chunks = {}
         full_drill_start_time = time.time()
         for self.iteration in range(self.iteration, n):
-
-            # every tenth iteration reconstruct workers to prevent tensorflow memory leakage
-            if self.iteration % RESET_EVERY == 0:
-                flat_print("Recreating Workers...")
-                del workers
-                workers = self._make_workers(parallel)
-
             time_dict = OrderedDict()
             subprocess_start = time.time()
 
@@ -363,37 +485,57 @@ class PPOAgent:
                 self.joint.save(f"{self.model_export_dir}/{name_key}/model")
                 model_representation = f"{self.model_export_dir}/{name_key}/"
 
-            if parallel:
-                # distribute the current policy to the workers
-                [actor.update_weights.remote(self.joint.get_weights()) for actor in workers]
+            if self.frame_budget is not None:
+                # chunks still running on recreated workers will never arrive
+                recreated_workers = self._recreate_workers_if_due(workers, parallel)
+                if recreated_workers is not workers:
+                    workers, straggling_chunks = recreated_workers, {}
 
-                # create processes and execute them
-                split_stats, split_preprocessors = zip(*ray.get(
-                    [actor.collect.remote(self.horizon, self.discount, self.lam, self.tbptt_length,
-                                          self.preprocessor.serialize()) for actor in workers]))
+                collection_start, collection_version = time.time(), self.optimizer.iterations.numpy().item()
+                results, straggling_chunks = self._collect_with_budget(workers, parallel, straggling_chunks)
             else:
-                # distribute the current policy to the workers
-                [actor.update_weights(self.joint.get_weights()) for actor in workers]
+                # unless the collection of this cycle was already started during the last optimization, start it now
+                if pending_collection is None:
+                    workers = self._recreate_workers_if_due(workers, parallel)
+                    collection_start, collection_version = time.time(), self.optimizer.iterations.numpy().item()
+                    pending_collection = self._launch_collection(workers, parallel, cycle=self.iteration)
 
-                # create processes and execute them
-                split_stats, split_preprocessors = zip(
-                    *[actor.collect(self.horizon, self.discount, self.lam, self.tbptt_length,
-                                    self.preprocessor.serialize()) for actor in workers])
+                results = ray.get(pending_collection) if parallel else pending_collection
 
-            stats = condense_stats(split_stats)
+            split_stats, split_preprocessors, split_experience = zip(*results)
+            collection_end = time.time()
+            pending_collection, results = None, None
 
-            # accumulate preprocessors TODO super unelegant, this should be inside the wrapper
-            old_ns = [w.n for w in self.preprocessor]
-            old_n = self.preprocessor.n
-            self.preprocessor = BaseWrapper.from_collection(split_preprocessors)
-            for i, p in enumerate(self.preprocessor):
-                p.correct_sample_size((self.n_workers - 1) * old_ns[i])  # adjust for overcounting
-            if isinstance(self.preprocessor, CombiWrapper):
-                self.preprocessor.n = np.copy(self.preprocessor.n) - (self.n_workers - 1) * old_n
+            # the policy lag is the number of updates the learner made since the collecting policy's weights
+            self.policy_lag_history.append(self.optimizer.iterations.numpy().item() - collection_version)
+            if optimization_end is not None and collection_start < optimization_end:
+                time_dict["overlap"] = min(collection_end, optimization_end) - collection_start
 
-            # read the dataset from storage
-            dataset = read_dataset_from_storage(dtype_actions=tf.float32 if self.continuous_control else tf.int32,
-                                                is_shadow_hand=isinstance(self.state_dim, tuple))
+            stats = condense_stats(split_stats)
+
+            # accumulate preprocessors
+            self.preprocessor = BaseWrapper.from_branches(split_preprocessors, origin=self.preprocessor)
+
+            # build the dataset from the arrays in the object store or read it from storage
+            if self.experience_transport == "object_store":
+                dataset = make_dataset_from_arrays(split_experience)
+            elif self.experience_transport == "columnar":
+                dataset = read_columnar_dataset_from_storage(cycle=self.iteration,
+                                                             directory=self.experience_directory)
+            elif self.experience_transport == "memmap":
+                dataset = self.experience_store.make_batched_dataset(self.iteration, batch_size,
+                                                                     is_shadow_hand=isinstance(self.state_dim, tuple),
+                                                                     shuffle=not self.is_recurrent)
+            else:
+                is_shadow_hand = isinstance(self.state_dim, tuple)
+                dataset = read_dataset_from_storage(dtype_actions=tf.float32 if self.continuous_control else tf.int32,
+                                                    is_shadow_hand=is_shadow_hand,
+                                                    cycle=self.iteration,
+                                                    directory=self.experience_directory,
+                                                    is_recurrent=self.is_recurrent,
+                                                    dtype_vision=tf.as_dtype(env_extract_state_dtypes(self.env)[0])
+                                                    if is_shadow_hand else tf.float32)
+            del split_experience
 
             time_dict["gathering"] = time.time() - subprocess_start
             subprocess_start = time.time()
@@ -404,6 +546,18 @@ class PPOAgent:
 
             # process some stats from actors
             self.underflow_history.append(stats.tbptt_underflow)
+            self.worker_throughput_history.append({str(worker_id): round(fps, 2) for worker_id, fps
+                                                   in worker_throughputs(stats.worker_telemetry).items()})
+            self.worker_memory_history.append({str(worker_id): round(rss, 2) for worker_id, rss
+                                               in worker_memory_usages(stats.worker_telemetry).items()})
+
+            # replace workers whose memory grew too large, their successors start up while the others keep working
+            recycled_workers = []
+            if self.memory_threshold is not None and parallel:
+                recycled_workers = self._recycle_workers(workers, stats.worker_telemetry)
+                straggling_chunks = {future: worker_index for future, worker_index in straggling_chunks.items()
+                                     if worker_index not in recycled_workers}
+            self.recycled_workers_history.append(recycled_workers)
 
             # make seperate evaluation if necessary and wanted
             stats_with_evaluation = stats
@@ -411,7 +565,8 @@ class PPOAgent:
                 if radical_evaluation or stats.numb_completed_episodes < MIN_STAT_EPS:
                     flat_print("Evaluating...")
                     n_evaluations = MIN_STAT_EPS if radical_evaluation else MIN_STAT_EPS - stats.numb_completed_episodes
-                    evaluation_stats, _ = self.evaluate(n_evaluations, ray_already_initialized=True, workers=workers)
+                    evaluation_stats, _ = self.evaluate(n_evaluations, ray_already_initialized=True, workers=workers,
+                                                        ci_width=evaluation_ci_width)
 
                     if radical_evaluation:
                         stats_with_evaluation = evaluation_stats
@@ -454,6 +609,7 @@ class PPOAgent:
             if self.env.spec.reward_threshold is not None and stop_early:
                 if np.all(np.greater_equal(self.cycle_reward_history[-5:], self.env.spec.reward_threshold)):
                     print("\rAll catch a breath, we stop the drill early due to the formidable result!")
+                    self._delete_experience(self.iteration)
                     break
 
             if cycle_start is not None:
@@ -461,11 +617,19 @@ class PPOAgent:
             self.report(total_iterations=n)
             cycle_start = time.time()
 
+            # when pipelining, let the workers collect the next cycle with the current weights while optimizing
+            if pipelined and self.iteration + 1 < n:
+                workers = self._recreate_workers_if_due(workers, parallel, cycle=self.iteration + 1)
+                collection_start, collection_version = time.time(), self.optimizer.iterations.numpy().item()
+                pending_collection = self._launch_collection(workers, parallel, cycle=self.iteration + 1)
+
             # OPTIMIZE
             flat_print("Optimizing...")
-            self.optimize_model(dataset, epochs, batch_size)
+            self.optimize_model(dataset, epochs, batch_size, is_batched=self.experience_transport == "memmap")
+            self._delete_experience(self.iteration)
 
-            time_dict["optimizing"] = time.time() - subprocess_start
+            optimization_end = time.time()
+            time_dict["optimizing"] = optimization_end - subprocess_start
 
             flat_print("Finalizing...")
             self.total_frames_seen += stats.numb_processed_frames
@@ -485,51 +649,318 @@ class PPOAgent:
                 self.save_agent_state()
 
             # calculate processing speed in fps
-            self.current_fps = stats.numb_processed_frames / (sum([v for v in time_dict.values() if v is not None]))
+            self.current_fps = stats.numb_processed_frames / (
+                sum([v for k, v in time_dict.items() if v is not None and k != "overlap"]))
             self.gathering_fps = (stats.numb_processed_frames // min(self.n_workers, available_cpus)) / (
-                time_dict["gathering"])
-            self.optimization_fps = (stats.numb_processed_frames * epochs) / (time_dict["optimizing"])
+                collection_end - collection_start)
+            self.optimization_fps = (stats.numb_processed_frames * self.epochs_history[-1]) / (time_dict["optimizing"])
+
+            # the first epoch reads the data from its source, all further ones iterate the cached dataset
+            epoch_durations = self.epoch_duration_history[-1]
+            self.cold_optimization_fps = stats.numb_processed_frames / epoch_durations[0]
+            self.warm_optimization_fps = (stats.numb_processed_frames / statistics.mean(epoch_durations[1:])
+                                          if len(epoch_durations) > 1 else self.cold_optimization_fps)
             self.time_dicts.append(time_dict)
 
+        # all consumed shards are deleted already, only remove this run's folder and anything a crash left behind
+        shutil.rmtree(self.experience_directory, ignore_errors=True)
+
+        # dropping the handles terminates the replicas
+        self._replicas, self._replica_batch_size = [], None
+
         print(f"Drill finished after {round(time.time() - full_drill_start_time, 2)}.")
 
         return self
 
-    def _make_workers(self, parallel, verbose=False):
+    def _recreate_workers_if_due(self, workers: list, parallel: bool, cycle: int = None) -> list:
+        """Every RESET_EVERY cycles reconstruct Keras workers to prevent tensorflow memory leakage, unless workers are
+        recycled based on their memory usage or keep their running episodes between cycles."""
+        cycle = self.iteration if cycle is None else cycle
+        if self.inference == "keras" and self.memory_threshold is None and not self.persistent_episodes \
+                and cycle % RESET_EVERY == 0:
+            flat_print("Recreating Workers...")
+            del workers
+            workers = self._make_workers(parallel)
+
+        return workers
+
+    def _launch_collection(self, workers: list, parallel: bool, cycle: int) -> list:
+        """Distribute the current policy to the workers and let them collect experience for the given cycle.
+
+        Returns futures of the workers' results if parallel, otherwise the results themselves."""
+        package = self._publish_weights(parallel)
+
         if parallel:
-            available_cpus = ray.cluster_resources()['CPU']
+            [actor.update_weights.remote(package) for actor in workers]
+            return [actor.collect.remote(self.horizon, self.discount, self.lam, self.tbptt_length,
+                                         self.preprocessor.serialize(), cycle, self.experience_transport,
+                                         self.experience_directory) for actor in workers]
+        else:
+            [actor.update_weights(package) for actor in workers]
+            return [actor.collect(self.horizon, self.discount, self.lam, self.tbptt_length,
+                                  self.preprocessor.serialize(), cycle, self.experience_transport,
+                                  self.experience_directory) for actor in workers]
+
+    @property
+    def experience_directory(self) -> str:
+        """This agent's folder of the storage directory, s.t. several trainings on one host never read each other's
+        experience."""
+        directory = os.path.join(STORAGE_DIR, str(self.agent_id))
+        os.makedirs(directory, exist_ok=True)
+
+        return directory
+
+    @property
+    def experience_store(self) -> MemmapExperienceStore:
+        """The memory mapped experience store in this agent's folder of the storage directory."""
+        return MemmapExperienceStore(self.experience_directory)
+
+    def _delete_experience(self, cycle: int):
+        """Delete the experience collected in the given cycle from storage."""
+        if self.experience_transport == "memmap":
+            self.experience_store.delete_cycle(cycle)
+        else:
+            delete_cycle_from_storage(cycle, self.experience_directory)
 
-            # set up the persistent workers
-            worker_options: dict = {}
-            if self.n_workers == 1:
-                # worker_options["num_gpus"] = 1
-                worker_options["num_cpus"] = available_cpus
-            elif self.n_workers < available_cpus:
-                worker_options["num_cpus"] = available_cpus // self.n_workers
+    def _collect_with_budget(self, workers: list, parallel: bool, straggling_chunks: dict) -> Tuple[list, dict]:
+        """Let the workers collect chunks of horizon steps until the frame budget of the cycle is reached.
+
+        Every worker that delivers a chunk gets the next one right away, s.t. fast workers contribute more chunks than
+        slow ones and nobody waits for the slowest worker. Once the budget is reached, the chunks still being
+        collected are handled according to the straggler policy.
 
-            workers = [RemoteGatherer.options(**worker_options).remote(self.builder_function_name,
-                                                                       self.distribution.__class__.__name__,
-                                                                       self.env_name, i) for i in range(self.n_workers)]
+        Args:
+            workers (list): the workers
+            parallel (bool): whether the workers are remote actors
+            straggling_chunks (dict): futures of discarded chunks from earlier cycles, mapped to the index of their
+                worker; such a worker only gets a new chunk after finishing the discarded one
 
-            if verbose:
-                print(f"{self.n_workers} workers each using {worker_options}")
+        Returns:
+            the results of the collected chunks and the futures of the chunks that are discarded but still running
+        """
+        package = self._publish_weights(parallel)
+        preprocessor_serialized = self.preprocessor.serialize()
+
+        if not parallel:
+            results, frames = [], 0
+            while frames < self.frame_budget:
+                worker = workers[len(results) % len(workers)]
+                worker.update_weights(package)
+                results.append(worker.collect(self.horizon, self.discount, self.lam, self.tbptt_length,
+                                              preprocessor_serialized, self.iteration, self.experience_transport,
+                                              self.experience_directory))
+                frames += results[-1][0].numb_processed_frames
+
+            return results, {}
+
+        def dispatch(worker_index: int):
+            workers[worker_index].update_weights.remote(package)
+            return workers[worker_index].collect.remote(self.horizon, self.discount, self.lam, self.tbptt_length,
+                                                        preprocessor_serialized, self.iteration,
+                                                        self.experience_transport, self.experience_directory)
+
+        # running chunks map to their worker and whether they count towards this cycle
+        running = {future: (worker_index, False) for future, worker_index in straggling_chunks.items()}
+        busy_workers = set(straggling_chunks.values())
+        running.update({dispatch(i): (i, True) for i in range(len(workers)) if i not in busy_workers})
+
+        results, frames = [], 0
+        while frames < self.frame_budget:
+            [finished], _ = ray.wait(list(running.keys()), num_returns=1)
+            worker_index, counts = running.pop(finished)
+
+            if counts:
+                results.append(ray.get(finished))
+                frames += results[-1][0].numb_processed_frames
+
+            if frames < self.frame_budget:
+                running[dispatch(worker_index)] = (worker_index, True)
+
+        # the budget is reached, chunks of this cycle that are still running belong to stragglers
+        current_chunks = [future for future, (_, counts) in running.items() if counts]
+        if self.straggler_policy == "keep":
+            results.extend(ray.get(current_chunks))
+            straggling_chunks = {future: worker_index for future, (worker_index, counts) in running.items()
+                                 if not counts}
         else:
-            workers = [Gatherer(self.builder_function_name,
-                                self.distribution.__class__.__name__,
-                                self.env_name, i) for i in range(self.n_workers)]
+            straggling_chunks = {future: worker_index for future, (worker_index, _) in running.items()}
+
+        return results, straggling_chunks
+
+    def _publish_weights(self, parallel: bool) -> WeightPackage:
+        """Publish the current weights for the workers, versioned by the number of updates the optimizer made."""
+        return self.weight_distributor.publish(self.joint, version=self.optimizer.iterations.numpy().item(),
+                                               use_object_store=parallel)
+
+    def _recycle_workers(self, workers: list, telemetry: dict) -> List[int]:
+        """Replace the remote workers whose resident memory exceeds the memory threshold by fresh ones.
+
+        The replacements are constructed in the background; a replaced worker is only shut down once its pending
+        tasks are done and its handle is released. Returns the IDs of the replaced workers."""
+        recycled = [worker_id for worker_id, rss in worker_memory_usages(telemetry).items()
+                    if rss > self.memory_threshold and worker_id < len(workers)]
+
+        for worker_id in recycled:
+            workers[worker_id] = self._make_worker(worker_id, parallel=True)
+
+        return recycled
+
+    def _worker_options(self) -> dict:
+        """Get the resource options of remote workers, splitting the CPUs that learner replicas leave between them."""
+        available_cpus = ray.cluster_resources()['CPU'] - len(self._replicas)
+
+        worker_options: dict = {}
+        if self.n_workers == 1:
+            # worker_options["num_gpus"] = 1
+            worker_options["num_cpus"] = available_cpus
+        elif self.n_workers < available_cpus:
+            worker_options["num_cpus"] = available_cpus // self.n_workers
+
+        return worker_options
+
+    def _make_worker(self, worker_id: int, parallel: bool, worker_options: dict = None, model_spec: dict = None):
+        """Make a single (remote if parallel) worker with the given ID."""
+        if model_spec is None and self.inference == "numpy":
+            model_spec = export_model(self.joint)
+
+        if parallel:
+            return RemoteGatherer.options(**(self._worker_options() if worker_options is None else worker_options)
+                                          ).remote(self.builder_function_name,
+                                                   self.distribution.__class__.__name__,
+                                                   self.env_name, worker_id,
+                                                   n_envs=self.envs_per_worker,
+                                                   model_spec=model_spec,
+                                                   persistent_episodes=self.persistent_episodes,
+                                                   action_repeat=self.action_repeat)
+
+        return Gatherer(self.builder_function_name,
+                        self.distribution.__class__.__name__,
+                        self.env_name, worker_id, n_envs=self.envs_per_worker, model_spec=model_spec,
+                        persistent_episodes=self.persistent_episodes, action_repeat=self.action_repeat)
 
-            if verbose:
+    def _make_workers(self, parallel, verbose=False):
+        model_spec = export_model(self.joint) if self.inference == "numpy" else None
+
+        # set up the persistent workers
+        worker_options = self._worker_options() if parallel else None
+        workers = [self._make_worker(i, parallel, worker_options, model_spec) for i in range(self.n_workers)]
+
+        if verbose:
+            if parallel:
+                print(f"{self.n_workers} workers each using {worker_options} and {self.envs_per_worker} environments")
+            else:
                 print(f"{self.n_workers} sequential workers initialized.")
 
         return workers
 
-    @tf.function
-    def _learn_on_batch(self, batch):
-        # optimize policy and value network simultaneously
+    def _make_learner_replicas(self, batch_size: int):
+        """Make the remote replicas of the learner for data-parallel optimization with the given batch size, each
+        claiming one CPU and computing on its share of every minibatch."""
+        agent_options = dict(horizon=self.horizon, workers=self.n_workers, learning_rate=self.learning_rate,
+                             discount=self.discount, lam=self.lam, clip=self.clip,
+                             c_entropy=self.c_entropy.numpy().item(), c_value=self.c_value.numpy().item(),
+                             clip_values=self.clip_values, tbptt_length=self.tbptt_length,
+                             lr_schedule=self.lr_schedule_type, precision=self.precision, xla=self.xla)
+
+        self._replicas = [RemoteLearnerReplica.options(num_cpus=1).remote(self.builder_function_name,
+                                                                          self.distribution.__class__.__name__,
+                                                                          self.env_name, agent_options,
+                                                                          batch_size // self.learner_replicas)
+                          for _ in range(self.learner_replicas)]
+        self._replica_batch_size = batch_size
+
+    def _rebuild_models(self, batch_size: int):
+        """Rebuild the models for the given batch size, keeping their weights, and compile the learner for them."""
+        weights = self.joint.get_weights()
+        with compute_precision(self.precision):
+            self.policy, self.value, self.joint = self.model_builder(self.env, self.distribution, **(
+                {"bs": batch_size} if requires_batch_size(self.model_builder) else {}))
+        self.joint.set_weights(weights)
+        self._compile_learner()
+
+    def _batch_signature(self, n_leading: int) -> dict:
+        """Get the specs of the fields of a batch of experience, with n_leading dimensions of unknown size before the
+        dimensions of a single step."""
+        leading = (None,) * n_leading
+        if isinstance(self.state_dim, tuple):
+            signature = {name: tf.TensorSpec(leading + tuple(shape), tf.as_dtype(dtype)) for name, shape, dtype
+                         in zip(SHADOW_HAND_FEATURES, self.state_dim, env_extract_state_dtypes(self.env))}
+        else:
+            signature = {"state": tf.TensorSpec(leading + (self.state_dim,), tf.float32)}
+
+        if self.continuous_control:
+            signature["action"] = tf.TensorSpec(leading + (self.n_actions,), tf.float32)
+        else:
+            signature["action"] = tf.TensorSpec(leading, tf.int32)
+        for name in ["action_prob", "return", "advantage", "value"] + (["done"] if self.is_recurrent else []):
+            signature[name] = tf.TensorSpec(leading, tf.float32)
+
+        return signature
+
+    def _compile_learner(self):
+        """Compile the learner's functions for the current models, with input signatures pinning the shapes of the
+        experience s.t. they are traced only once. If xla is on, the learner step is compiled with XLA. The loss terms
+        of the policy distributions are plain functions traced into the step, since XLA recompiles a step that calls
+        other compiled functions on its variables in every call. For the same reason, the loops over subsequences and
+        resident minibatches trace the step's python function instead of calling the compiled step.
+
+        Every trace is counted in trace_counts, where any count above one is a retrace. The optimizer's slots for the
+        models are created beforehand, as creating them in the first call would trace the step twice. For gradient
+        accumulation on recurrent models, the states of all sequences of a minibatch are kept in a stash, from which
+        every micro-batch takes its slice."""
+        self.trace_counts = {}
+        create_optimizer_slots(self.optimizer, self.joint.trainable_variables)
+
+        self._state_stash = []
+        if self.is_recurrent and self.gradient_accumulation > 1:
+            self._state_stash = [tf.Variable(tf.zeros((self.gradient_accumulation * state.shape[0],) + state.shape[1:],
+                                                      dtype=state.dtype), trainable=False)
+                                 for state in get_recurrent_states(self.joint)]
+
+        def counting_traces(name, function):
+            def traced(*args):
+                self.trace_counts[name] = self.trace_counts.get(name, 0) + 1
+                return function(*args)
+
+            return traced
+
+        step_leading_dims = 2 if self.is_recurrent else 1
+        self._learn_step = tf.function(counting_traces("step", self._learn_on_batch),
+                                       input_signature=[self._batch_signature(step_leading_dims)],
+                                       **({"experimental_compile": True} if self.xla else {}))
+
+        self._learn_sequences_step = tf.function(counting_traces("sequences", self._learn_on_sequences),
+                                                 input_signature=[self._batch_signature(3)])
+        self._learn_resident_step = tf.function(counting_traces("resident", self._learn_resident),
+                                                input_signature=[self._batch_signature(1),
+                                                                 tf.TensorSpec([], tf.int32),
+                                                                 tf.TensorSpec([], tf.int32)])
+        self._apply_step = tf.function(counting_traces("apply", self._apply_gradients),
+                                       input_signature=[[tf.TensorSpec(v.shape, v.dtype)
+                                                         for v in self.joint.trainable_variables]])
+
+    def _loss_gradients(self, batch, normalizers: Tuple[tf.Tensor, tf.Tensor] = None):
+        """Compute the gradients of the joint model's total loss on a batch, without applying them.
+
+        Args:
+            batch: the batch of experience
+            normalizers: if given, the number of unmasked and of all samples by which the summed losses are divided
+                instead of taking their means, s.t. the losses of micro-batches add up to the loss of their minibatch
+
+        Returns:
+            the gradients, the entropy, policy loss and value loss, the policy output and the approximate KL
+            divergence from the behavior policy
+        """
+        valid_samples, all_samples = (None, None) if normalizers is None else normalizers
+
         with tf.GradientTape() as tape:
             state_batch = batch["state"] if "state" in batch else (batch["in_vision"], batch["in_proprio"],
                                                                    batch["in_touch"], batch["in_goal"])
             policy_output, value_output = self.joint(state_batch, training=True)
+
+            # losses are always computed in float32, even if the model computes in lower precision
+            policy_output = tf.nest.map_structure(lambda t: tf.cast(t, tf.float32), policy_output)
+            value_output = tf.cast(value_output, tf.float32)
             old_values = batch["value"]
 
             if self.continuous_control:
@@ -541,16 +972,77 @@ class PPOAgent:
 
             # calculate the clipped loss
             policy_loss = self.policy_loss(action_prob=action_probabilities, old_action_prob=batch["action_prob"],
-                                           advantage=batch["advantage"])
+                                           advantage=batch["advantage"], normalizer=valid_samples)
             value_loss = self.value_loss(value_predictions=tf.squeeze(value_output, axis=-1), old_values=old_values,
                                          returns=batch["return"], old_action_prob=batch["action_prob"],
-                                         clip=self.clip_values)
-            entropy = self.entropy_bonus(policy_output)
+                                         clip=self.clip_values, normalizer=valid_samples)
+            entropy = self.entropy_bonus(policy_output, normalizer=all_samples)
             total_loss = policy_loss + tf.multiply(self.c_value, value_loss) - tf.multiply(self.c_entropy, entropy)
 
         # calculate the gradient of the joint model based on total loss
         gradients = tape.gradient(total_loss, self.joint.trainable_variables)
 
+        # how far the policy moved from the one that collected the experience, over the unmasked steps
+        kl = self.distribution.approximate_kl_divergence(
+            batch["action_prob"], action_probabilities,
+            mask=tf.not_equal(batch["action_prob"], 0) if self.is_recurrent else None)
+
+        return gradients, entropy, policy_loss, value_loss, policy_output, kl
+
+    def _accumulate_gradients(self, batch):
+        """Compute the gradients on a batch as the sum of the gradients of its micro-batches. Every micro-batch loss
+        is normalized by the sample counts of the whole batch, s.t. the sums equal the gradients and losses of the
+        batch computed at once. Recurrent micro-batches run on their slice of the state stash.
+
+        Returns:
+            the gradients, the entropy, policy loss and value loss, the policy output and the approximate KL
+            divergence from the behavior policy
+        """
+        n_micro = self.gradient_accumulation
+        all_samples = tf.cast(tf.size(batch["advantage"]), tf.float32)
+        valid_samples = tf.reduce_sum(tf.cast(tf.not_equal(batch["action_prob"], 0), tf.float32)) \
+            if self.is_recurrent else all_samples
+
+        splits = {k: tf.split(v, n_micro, axis=0) for k, v in batch.items()}
+        states = get_recurrent_states(self.joint)
+
+        gradients, entropy, policy_loss, value_loss, policy_outputs, kl = None, 0., 0., 0., [], 0.
+        for i in range(n_micro):
+            for state, stash in zip(states, self._state_stash):
+                state.assign(stash[i * state.shape[0]:(i + 1) * state.shape[0]])
+
+            micro_batch = {k: v[i] for k, v in splits.items()}
+            micro_gradients, micro_entropy, micro_policy_loss, micro_value_loss, micro_policy_output, micro_kl = \
+                self._loss_gradients(micro_batch, (valid_samples, all_samples))
+
+            for state, stash in zip(states, self._state_stash):
+                stash[i * state.shape[0]:(i + 1) * state.shape[0]].assign(state)
+
+            gradients = micro_gradients if gradients is None else [g + m for g, m in zip(gradients, micro_gradients)]
+            entropy += micro_entropy
+            policy_loss += micro_policy_loss
+            value_loss += micro_value_loss
+            policy_outputs.append(micro_policy_output)
+
+            # the KL is a mean over the micro-batch's unmasked steps, weighted by their share of the whole batch
+            micro_valid_samples = tf.reduce_sum(tf.cast(tf.not_equal(micro_batch["action_prob"], 0), tf.float32)) \
+                if self.is_recurrent else tf.cast(tf.size(micro_batch["advantage"]), tf.float32)
+            kl += micro_kl * micro_valid_samples / valid_samples
+
+        policy_output = tf.nest.map_structure(lambda *t: tf.concat(t, axis=0), *policy_outputs)
+
+        return gradients, entropy, policy_loss, value_loss, policy_output, kl
+
+    def _apply_gradients(self, gradients):
+        self.optimizer.apply_gradients(zip(gradients, self.joint.trainable_variables))
+
+    def _learn_on_batch(self, batch):
+        # optimize policy and value network simultaneously, accumulating the gradients of micro-batches if requested
+        if self.gradient_accumulation > 1:
+            gradients, entropy, policy_loss, value_loss, policy_output, kl = self._accumulate_gradients(batch)
+        else:
+            gradients, entropy, policy_loss, value_loss, policy_output, kl = self._loss_gradients(batch)
+
         # clip gradients to avoid gradient explosion and stabilize learning
         if self.gradient_clipping is not None:
             gradients, _ = tf.clip_by_global_norm(gradients, self.gradient_clipping)
@@ -560,6 +1052,7 @@ class PPOAgent:
 
         info = {
             "policy_output": policy_output,
+            "kl": kl,
             # "actions": batch["action"],
             # "action_probabilities": action_probabilities,
             # "old_action_probabilities": batch["action_prob"],
@@ -569,7 +1062,79 @@ class PPOAgent:
 
         return tf.reduce_mean(entropy), tf.reduce_mean(policy_loss), tf.reduce_mean(value_loss), info
 
-    def optimize_model(self, dataset: tf.data.Dataset, epochs: int, batch_size: int) -> None:
+    def _learn_on_sequences(self, batch):
+        """Truncated back propagation through time over all subsequences of a batch of shape (BATCH_SIZE,
+        N_SUBSEQUENCES, SUBSEQUENCE_LENGTH, ...) in one graph. After every subsequence the recurrent states of the
+        samples whose episode ended in it are reset, as given by the done mask. With gradient accumulation, the states
+        live in the state stash between the subsequences and are reset there.
+
+        Returns:
+            the mean entropy, policy loss, value loss and approximate KL divergence over the subsequences
+        """
+        n_subsequences = tf.shape(batch["advantage"])[1]
+        for stash in self._state_stash:
+            stash.assign(tf.zeros_like(stash))
+
+        ent_sum, pi_loss_sum, v_loss_sum, kl_sum = tf.constant(0.), tf.constant(0.), tf.constant(0.), tf.constant(0.)
+        for i in tf.range(n_subsequences):
+            ent, pi_loss, v_loss, info = self._learn_on_batch({k: v[:, i] for k, v in batch.items()})
+
+            ent_sum += ent
+            pi_loss_sum += pi_loss
+            v_loss_sum += v_loss
+            kl_sum += info["kl"]
+
+            done = tf.reduce_any(batch["done"][:, i] > 0, axis=-1)
+            if self._state_stash:
+                reset_variables_masked_in_graph(self._state_stash, done)
+            else:
+                reset_states_masked_in_graph(self.joint, done)
+
+        n = tf.cast(n_subsequences, tf.float32)
+        return ent_sum / n, pi_loss_sum / n, v_loss_sum / n, kl_sum / n
+
+    def _learn_resident(self, data: dict, epochs: tf.Tensor, batch_size: tf.Tensor):
+        """Run all epochs on experience resident in tensors, each a random permutation of the samples split into
+        minibatches, without returning to python in between. Once the mean approximate KL divergence of an epoch
+        exceeds the target KL, the remaining epochs are skipped.
+
+        Returns:
+            the mean entropy, policy loss, value loss and approximate KL divergence of every epoch that was run
+        """
+        n_samples = tf.shape(data["advantage"])[0]
+        n_batches = n_samples // batch_size
+        entropies = tf.TensorArray(tf.float32, size=0, dynamic_size=True)
+        policy_losses = tf.TensorArray(tf.float32, size=0, dynamic_size=True)
+        value_losses = tf.TensorArray(tf.float32, size=0, dynamic_size=True)
+        kls = tf.TensorArray(tf.float32, size=0, dynamic_size=True)
+
+        for epoch in tf.range(epochs):
+            permutation = tf.random.shuffle(tf.range(n_samples))
+
+            ent_sum, pi_loss_sum, v_loss_sum, kl_sum = tf.constant(0.), tf.constant(0.), tf.constant(0.), \
+                tf.constant(0.)
+            for i in tf.range(n_batches):
+                indices = permutation[i * batch_size:(i + 1) * batch_size]
+                ent, pi_loss, v_loss, info = self._learn_on_batch({k: tf.gather(v, indices) for k, v in data.items()})
+
+                ent_sum += ent
+                pi_loss_sum += pi_loss
+                v_loss_sum += v_loss
+                kl_sum += info["kl"]
+
+            n = tf.cast(n_batches, tf.float32)
+            entropies = entropies.write(epoch, ent_sum / n)
+            policy_losses = policy_losses.write(epoch, pi_loss_sum / n)
+            value_losses = value_losses.write(epoch, v_loss_sum / n)
+            kls = kls.write(epoch, kl_sum / n)
+
+            if self.target_kl is not None:
+                if kl_sum / n > self.target_kl:
+                    break
+
+        return entropies.stack(), policy_losses.stack(), value_losses.stack(), kls.stack()
+
+    def optimize_model(self, dataset: tf.data.Dataset, epochs: int, batch_size: int, is_batched: bool = False) -> None:
         """Optimize the agent's policy and value network based on a given dataset.
         
         Since data processing is apparently not possible with tensorflow data sets on a GPU, we will only let the GPU
@@ -579,49 +1144,57 @@ class PPOAgent:
         gathering we need to transfer all Tensors from CPU to GPU, no matter whether the dataset is stored on GPU or
         not. Even more so this applies with running simulations on the cluster.
 
+        If the agent has a target KL, the remaining epochs are skipped once the mean approximate KL divergence between
+        the behavior policy and the current policy exceeds it in an epoch.
+
         Args:
             dataset (tf.data.Dataset): tensorflow dataset containing s, a, p(a), r and A as components per data point
-            epochs (int): number of epochs to train on this dataset
+            epochs (int): (maximal) number of epochs to train on this dataset
             batch_size (int): batch size with which the dataset is sampled
+            is_batched (bool): if True, the dataset already yields shuffled minibatches
 
         Returns:
             None
         """
+        if self.learner == "resident":
+            return self._optimize_model_resident(dataset, epochs, batch_size, is_batched)
+        if self.learner_replicas > 1:
+            return self._optimize_model_data_parallel(dataset, epochs, batch_size, is_batched)
+
         progressbar = tqdm(total=epochs * ((self.horizon * self.n_workers / self.tbptt_length) / batch_size),
                            leave=False, desc="Optimizing", disable=True)
-        policy_loss_history, value_loss_history, entropy_history = [], [], []
-        for epoch in range(epochs):
-            # for each epoch, dataset first should be shuffled to break correlation
+        policy_loss_history, value_loss_history, entropy_history, kl_history, epoch_durations = [], [], [], [], []
+
+        # for each epoch, dataset first should be shuffled to break correlation, then divided into batches; the next
+        # batches are prepared while the current one is learned on
+        batched_dataset = dataset
+        if not is_batched:
             if not self.is_recurrent:
-                dataset = dataset.shuffle(10000, reshuffle_each_iteration=True)
+                batched_dataset = batched_dataset.shuffle(10000, reshuffle_each_iteration=True)
+            batched_dataset = batched_dataset.batch(batch_size, drop_remainder=True)
+        batched_dataset = batched_dataset.prefetch(tf.data.experimental.AUTOTUNE)
 
-            # then divide into batches
-            batched_dataset = dataset.batch(batch_size, drop_remainder=True)
+        for epoch in range(epochs):
+            epoch_start = time.time()
 
-            policy_epoch_losses, value_epoch_losses, entropies = [], [], []
+            policy_epoch_losses, value_epoch_losses, entropies, kls = [], [], [], []
             for b in batched_dataset:
                 # use the dataset to optimize the model
                 with tf.device(self.device):
                     if not self.is_recurrent:
-                        ent, pi_loss, v_loss, info = self._learn_on_batch(b)
+                        ent, pi_loss, v_loss, info = self._learn_step(b)
+                        kl = info["kl"]
                         progressbar.update(1)
                     else:
                         # truncated back propagation through time
                         # batch shape: (BATCH_SIZE, N_SUBSEQUENCES, SUBSEQUENCE_LENGTH, *STATE_DIMS)
-                        split_batch = {k: tf.split(v, v.shape[1], axis=1) for k, v in b.items()}
-                        for i in range(len(split_batch["advantage"])):
-                            # extract subsequence and squeeze away the N_SUBSEQUENCES dimension
-                            partial_batch = {k: tf.squeeze(v[i], axis=1) for k, v in split_batch.items()}
-                            ent, pi_loss, v_loss, info = self._learn_on_batch(partial_batch)
-                            progressbar.update(1)
-
-                            # make partial RNN state resets
-                            reset_mask = detect_finished_episodes(partial_batch["action_prob"])
-                            reset_states_masked(self.joint, reset_mask)
+                        ent, pi_loss, v_loss, kl = self._learn_sequences_step(b)
+                        progressbar.update(b["advantage"].shape[1])
 
                 entropies.append(ent)
                 policy_epoch_losses.append(pi_loss)
                 value_epoch_losses.append(v_loss)
+                kls.append(kl)
 
                 # for grad in info["gradients"]:
                 #     found = False
@@ -636,26 +1209,148 @@ class PPOAgent:
                 self.joint.reset_states()
 
             # remember some statistics
+            epoch_durations.append(time.time() - epoch_start)
             policy_loss_history.append(tf.reduce_mean(policy_epoch_losses).numpy().item())
             value_loss_history.append(tf.reduce_mean(value_epoch_losses).numpy().item())
             entropy_history.append(tf.reduce_mean(entropies).numpy().item())
+            kl_history.append(tf.reduce_mean(kls).numpy().item())
+
+            # stop before the policy moves too far from the one that collected the experience
+            if self.target_kl is not None and kl_history[-1] > self.target_kl:
+                break
 
         # store statistics in agent history
         self.policy_loss_history.append(statistics.mean(policy_loss_history))
         self.value_loss_history.append(statistics.mean(value_loss_history))
         self.entropy_history.append(statistics.mean(entropy_history))
+        self.kl_history.append(kl_history[-1])
+        self.epochs_history.append(len(epoch_durations))
+        self.epoch_duration_history.append(epoch_durations)
 
         progressbar.close()
 
+    def _optimize_model_resident(self, dataset: tf.data.Dataset, epochs: int, batch_size: int,
+                                 is_batched: bool = False) -> None:
+        """Optimize the model like optimize_model, but with the experience loaded into tensors once, s.t. minibatches
+        are gathered from full random permutations inside one compiled loop over all epochs."""
+        with tf.device(self.device):
+            data = self._materialize_experience(dataset, is_batched)
+
+            start = time.time()
+            entropies, policy_losses, value_losses, kls = [t.numpy() for t in self._learn_resident_step(
+                data, tf.constant(epochs), tf.constant(batch_size))]
+
+        # the epochs run inside one graph, only their mean duration is known
+        epochs_run = len(kls)
+        self.epoch_duration_history.append([(time.time() - start) / epochs_run] * epochs_run)
+        self.policy_loss_history.append(policy_losses.mean().item())
+        self.value_loss_history.append(value_losses.mean().item())
+        self.entropy_history.append(entropies.mean().item())
+        self.kl_history.append(kls[-1].item())
+        self.epochs_history.append(epochs_run)
+
+    @staticmethod
+    def _materialize_experience(dataset: tf.data.Dataset, is_batched: bool = False) -> dict:
+        """Load all experience of a dataset into one tensor per field."""
+        if is_batched:
+            dataset = dataset.unbatch()
+
+        chunks = list(dataset.batch(4096))
+        return {k: tf.concat([chunk[k] for chunk in chunks], axis=0) for k in chunks[0].keys()}
+
+    def _optimize_model_data_parallel(self, dataset: tf.data.Dataset, epochs: int, batch_size: int,
+                                      is_batched: bool = False) -> None:
+        """Optimize the model like optimize_model, but data-parallel on the learner replicas.
+
+        The experience is split into one shard per replica. For every minibatch (and every subsequence of it for
+        recurrent models), each replica computes the gradients on its share, normalized by the sample counts of the
+        whole minibatch. Their sum is the minibatch's gradient, which is clipped and applied by this agent only. Every
+        request for gradients carries the agent's current trainable weights, s.t. the replicas need neither an
+        optimizer state of their own nor a separate broadcast after every update."""
+        if len(self._replicas) == 0 or self._replica_batch_size != batch_size:
+            self._make_learner_replicas(batch_size)
+
+        data = {k: v.numpy() for k, v in self._materialize_experience(dataset, is_batched).items()}
+        shards, n_batches = shard_experience(data, self.learner_replicas, batch_size, shuffle=not self.is_recurrent)
+
+        # the replicas receive all weights once per cycle, the trainable ones follow with every request
+        package = self._publish_weights(parallel=True)
+        for replica, shard in zip(self._replicas, shards):
+            replica.set_weights.remote(package)
+            replica.load_shard.remote(shard)
+
+        n_subsequences = data["advantage"].shape[1] if self.is_recurrent else 1
+        if self.is_recurrent:
+            # the unmasked and all steps of every subsequence of every minibatch
+            valid = np.count_nonzero(data["action_prob"][:n_batches * batch_size], axis=-1)
+            valid = valid.reshape(n_batches, batch_size, n_subsequences).sum(axis=1)
+            n_steps = float(batch_size * data["advantage"].shape[2])
+            normalizers = [[(float(valid[b, i]), n_steps) for i in range(n_subsequences)] for b in range(n_batches)]
+        else:
+            normalizers = [[(float(batch_size), float(batch_size))] for _ in range(n_batches)]
+
+        variables = self.joint.trainable_variables
+        shapes, dtypes = [tuple(v.shape.as_list()) for v in variables], [v.dtype.as_numpy_dtype for v in variables]
+
+        policy_loss_history, value_loss_history, entropy_history, kl_history, epoch_durations = [], [], [], [], []
+        for epoch in range(epochs):
+            epoch_start = time.time()
+            for replica in self._replicas:
+                replica.start_epoch.remote()
+
+            epoch_statistics = []
+            for b in range(n_batches):
+                for i in range(n_subsequences):
+                    # one round trip per update, which takes the current weights out and brings the gradients back
+                    weights_reference = ray.put(flatten_weights([v.numpy() for v in variables]))
+                    results = ray.get([replica.compute_gradients.remote(weights_reference, b, i, normalizers[b][i])
+                                       for replica in self._replicas])
+
+                    gradients = np.sum([flat_gradients for flat_gradients, _ in results], axis=0)
+                    if self.gradient_clipping is not None:
+                        gradients = clip_by_global_norm(gradients, self.gradient_clipping)
+                    self._apply_step([tf.constant(g) for g in unflatten_weights(gradients, shapes, dtypes)])
+
+                    epoch_statistics.append(np.sum([shares for _, shares in results], axis=0))
+
+            entropy, policy_loss, value_loss, kl = np.mean(epoch_statistics, axis=0).tolist()
+            epoch_durations.append(time.time() - epoch_start)
+            policy_loss_history.append(policy_loss)
+            value_loss_history.append(value_loss)
+            entropy_history.append(entropy)
+            kl_history.append(kl)
+
+            # stop before the policy moves too far from the one that collected the experience
+            if self.target_kl is not None and kl_history[-1] > self.target_kl:
+                break
+
+        self.policy_loss_history.append(statistics.mean(policy_loss_history))
+        self.value_loss_history.append(statistics.mean(value_loss_history))
+        self.entropy_history.append(statistics.mean(entropy_history))
+        self.kl_history.append(kl_history[-1])
+        self.epochs_history.append(len(epoch_durations))
+        self.epoch_duration_history.append(epoch_durations)
+
     def evaluate(self, n: int, ray_already_initialized: bool = False, workers: List[RemoteGatherer] = None,
-                 save: bool = False) -> Tuple[StatBundle, Any]:
+                 save: bool = False, ci_width: float = None, confidence: float = 0.95,
+                 min_episodes: int = 10) -> Tuple[StatBundle, Any]:
         """Evaluate the current state of the policy on the given environment for n episodes. Optionally can render to
         visually inspect the performance.
 
+        Episodes are streamed back as they finish and every worker that finishes one immediately starts the next.
+        With a ci_width, evaluation stops early once at least min_episodes episodes finished and the confidence
+        interval of the mean reward is narrower than it. No further episodes are started then, but those that are
+        still running are waited for and counted, s.t. no work is left on the workers and long episodes, which finish
+        last, are not dropped from the estimate.
+
         Args:
-            n (int): integer value indicating the number of episodes that shall be run
+            n (int): integer value indicating the number of episodes that shall be run (at most, if ci_width is given)
             ray_already_initialized (bool): if True, do not initialize ray again (default False)
             save (bool): whether to save the evaluation to the monitor directory
+            ci_width (float): if given, stop as soon as the confidence interval of the mean reward is narrower
+            confidence (float): the confidence level of the interval for the stopping rule
+            min_episodes (int): the number of episodes that finish before the stopping rule is applied, s.t. the
+                interval is not estimated from a handful of episodes
 
         Returns:
             StatBundle with evaluation results
@@ -676,23 +1371,30 @@ class PPOAgent:
 
             workers = self._make_workers(True)
 
+        package = self._publish_weights(parallel=True)
         for w in workers:
-            w.update_weights.remote(self.joint.get_weights())
+            w.update_weights.remote(package)
 
-        result_ids = []
-        w_id, processes_started = 0, 0
-        while processes_started < n:
-            result_ids.append(workers[w_id].evaluate.remote(self.preprocessor.serialize()))
-            processes_started += 1
+        # start an episode on every worker, then give the next one to whichever worker finishes first
+        preprocessor_serialized = self.preprocessor.serialize()
+        running = {workers[w_id].evaluate.remote(preprocessor_serialized): w_id for w_id in range(min(n, len(workers)))}
+        processes_started, results, stopped = len(running), [], False
+        while len(running) > 0:
+            [finished], _ = ray.wait(list(running.keys()), num_returns=1)
+            w_id = running.pop(finished)
+            results.append(ray.get(finished))
 
-            # start with the first worker again
-            w_id += 1
-            if w_id > len(workers) - 1:
-                w_id = 0
+            if ci_width is not None and not stopped and len(results) >= min_episodes:
+                stopped = mean_confidence_interval_width([r for _, r, _ in results], confidence) <= ci_width
 
-        all_lengths, all_rewards, all_classes = zip(*[ray.get(oi) for oi in result_ids])
+            if processes_started < n and not stopped:
+                running[workers[w_id].evaluate.remote(preprocessor_serialized)] = w_id
+                processes_started += 1
 
-        stats = StatBundle(n, sum(all_lengths), all_rewards, all_lengths, tbptt_underflow=0)
+        all_lengths, all_rewards, all_classes = zip(*results)
+
+        stats = StatBundle(len(results), sum(all_lengths), all_rewards, all_lengths, tbptt_underflow=0,
+                           worker_telemetry={})
 
         if save:
             os.makedirs(f"{const.PATH_TO_EXPERIMENTS}/{self.agent_id}/", exist_ok=True)
@@ -724,9 +1426,11 @@ class PPOAgent:
         # calculate percentages of computation spend on different phases of the iteration
         time_distribution_string = ""
         if len(self.time_dicts) > 0:
-            times = [time for time in self.time_dicts[-1].values() if time is not None]
+            times = [time for phase, time in self.time_dicts[-1].items() if time is not None and phase != "overlap"]
             time_percentages = [str(round(100 * t / sum(times))) for i, t in enumerate(times)]
             time_distribution_string = "[" + "|".join(map(str, time_percentages)) + "]"
+            if "overlap" in self.time_dicts[-1]:
+                time_distribution_string += f" overlap: {round(self.time_dicts[-1]['overlap'], 2)}s"
         if isinstance(self.lr_schedule, tf.keras.optimizers.schedules.LearningRateSchedule):
             current_lr = self.lr_schedule(self.optimizer.iterations)
         else:
@@ -735,26 +1439,62 @@ class PPOAgent:
         # make fps string
         fps_string = f"[{nc}{int(round(self.gathering_fps)):6d}{ec}|{nc}{int(round(self.optimization_fps)):7d}{ec}]"
 
+        # optimization speed in the first (cold) and in the further (warm) epochs
+        optimization_fps = (f"ofps: [{nc}{int(round(self.cold_optimization_fps))}{ec}|"
+                            f"{nc}{int(round(self.warm_optimization_fps))}{ec}]; ")
+
+        # traces of the learner's compiled functions since they were compiled for this drill, and how many of them
+        # were retraces
+        retraces = sum(count - 1 for count in self.trace_counts.values())
+        traces = (f"tr: [{nc}{sum(self.trace_counts.values())}{ec}|"
+                  f"{ac if retraces > 0 else nc}{retraces}{ec}]; ")
+
         # losses
         pi_loss = "-" if len(self.policy_loss_history) == 0 else f"{round(self.policy_loss_history[-1], 2):6.2f}"
         v_loss = "-" if len(self.value_loss_history) == 0 else f"{round(self.value_loss_history[-1], 2):8.2f}"
         ent = "-" if len(self.entropy_history) == 0 else f"{round(self.entropy_history[-1], 2):6.2f}"
 
+        # approximate kl divergence after the last epoch, and how many epochs ran before it reached the target kl
+        kl = "" if len(self.kl_history) == 0 else (f"kl: [{nc}{self.kl_history[-1]:.4f}{ec}|"
+                                                  f"{nc}{self.epochs_history[-1]}{ec}]; ")
+
         # tbptt underflow
         underflow = f"w: {nc}{self.underflow_history[-1]}{ec}; " if self.underflow_history[-1] is not None else ""
 
+        # spread of the throughput between workers
+        worker_fps = ""
+        if len(self.worker_throughput_history) > 0 and len(self.worker_throughput_history[-1]) > 1:
+            throughputs = self.worker_throughput_history[-1].values()
+            worker_fps = f"wfps: [{nc}{int(min(throughputs))}{ec}|{nc}{int(max(throughputs))}{ec}]; "
+
+        # memory of the most demanding worker, and its trend since the last cycle
+        worker_memory = ""
+        if len(self.worker_memory_history) > 0 and len(self.worker_memory_history[-1]) > 0:
+            peak_memory = max(self.worker_memory_history[-1].values())
+            trend = ""
+            if len(self.worker_memory_history) > 1 and len(self.worker_memory_history[-2]) > 0:
+                trend = f"{peak_memory - max(self.worker_memory_history[-2].values()):+.0f}"
+            recycled = len(self.recycled_workers_history[-1]) if len(self.recycled_workers_history) > 0 else 0
+            worker_memory = (f"mem: {nc}{peak_memory:.0f}{ec}MB{trend}"
+                             f"{f' ({recycled} recycled)' if recycled > 0 else ''}; ")
+
         # print the report
         flat_print(f"{sc}{f'Cycle {self.iteration:5d}/{total_iterations}' if self.iteration != 0 else 'Before Training'}{ec}: "
                    f"r: {reward_col}{'-' if self.cycle_reward_history[-1] is None else f'{round(self.cycle_reward_history[-1], 2):8.2f}'}{ec}; "
                    f"len: {nc}{'-' if self.cycle_length_history[-1] is None else f'{round(self.cycle_length_history[-1], 2):8.2f}'}{ec}; "
                    f"n: {nc}{'-' if self.cycle_stat_n_history[-1] is None else f'{self.cycle_stat_n_history[-1]:3d}'}{ec}; "
                    f"loss: [{nc}{pi_loss}{ec}|{nc}{v_loss}{ec}|{nc}{ent}{ec}]; "
+                   f"{kl}"
                    f"eps: {nc}{self.total_episodes_seen:5d}{ec}; "
                    f"lr: {nc}{current_lr:.2e}{ec}; "
                    f"upd: {nc}{self.optimizer.iterations.numpy().item():6d}{ec}; "
                    f"f: {nc}{round(self.total_frames_seen / 1e3, 3):8.3f}{ec}k; "
                    f"{underflow}"
                    f"fps: {fps_string} {time_distribution_string}; "
+                   f"{optimization_fps}"
+                   f"{traces}"
+                   f"{worker_fps}"
+                   f"{worker_memory}"
                    f"took {self.cycle_timings[-1] if len(self.cycle_timings) > 0 else ''}s\n")
 
     def save_agent_state(self, name=None):
@@ -772,6 +1512,10 @@ class PPOAgent:
         del parameters["env"]
         del parameters["policy"], parameters["value"], parameters["joint"], parameters["distribution"]
         del parameters["optimizer"], parameters["lr_schedule"], parameters["model_builder"], parameters["preprocessor"]
+        del parameters["weight_distributor"]
+        del parameters["_learn_step"], parameters["_learn_sequences_step"], parameters["_learn_resident_step"]
+        del parameters["_apply_step"]
+        del parameters["_state_stash"], parameters["_replicas"]
 
         parameters["c_entropy"] = parameters["c_entropy"].numpy().item()
         parameters["c_value"] = parameters["c_value"].numpy().item()
@@ -830,13 +1574,19 @@ class PPOAgent:
                                 c_entropy=parameters["c_entropy"], c_value=parameters["c_value"],
                                 gradient_clipping=parameters["gradient_clipping"], preprocessor=preprocessor,
                                 clip_values=parameters["clip_values"], tbptt_length=parameters["tbptt_length"],
-                                lr_schedule=parameters["lr_schedule_type"], distribution=distribution, _make_dirs=False)
+                                lr_schedule=parameters["lr_schedule_type"], distribution=distribution,
+                                precision=parameters.get("precision", "float32"),
+                                gradient_accumulation=parameters.get("gradient_accumulation", 1),
+                                target_kl=parameters.get("target_kl"),
+                                learner_replicas=parameters.get("learner_replicas", 1), _make_dirs=False)
 
         for p, v in parameters.items():
             if p in ["distribution", "preprocessor"]:
                 continue
 
             loaded_agent.__dict__[p] = v
+        loaded_agent.weight_distributor = WeightDistributor(dtype=loaded_agent.weight_broadcast_dtype)
+        loaded_agent._compile_learner()
 
         loaded_agent.joint.load_weights(f"{BASE_SAVE_PATH}/{agent_id}/" + f"/{from_iteration}/weights")
 
@@ -6,6 +6,7 @@ from typing import List, Union
 import gym
 import tensorflow as tf
 
+from agent.acting import ActStep
 from agent.policies import BasePolicyDistribution
 from agent.ppo import PPOAgent
 from utilities.model_utils import is_recurrent_model, list_layer_names, get_layers_by_names, build_sub_model_to, \
@@ -176,8 +177,8 @@ class Investigator:
 
     def render_episode(self, env: gym.Env, slow_down: bool = False, to_gif: bool = False) -> None:
         """Render an episode in the given environment."""
-        is_recurrent = is_recurrent_model(self.network)
-        self.network.reset_states()
+        act_step = ActStep(self.network, self.distribution, with_value=False, deterministic=True)
+        act_step.reset_states()
 
         done, step = False, 0
         state = self.preprocessor.modulate((parse_state(env.reset()), None, None, None), update=False)[0]
@@ -186,10 +187,7 @@ class Investigator:
         while not done:
             step += 1
 
-            probabilities = flatten(
-                self.network.predict(add_state_dims(parse_state(state), dims=2 if is_recurrent else 1)))
-
-            action = self.distribution.act_deterministic(*probabilities)
+            action = act_step(add_state_dims(parse_state(state), dims=1))[0][0]
             observation, reward, done, info = env.step(action)
             cumulative_reward += reward
             observation, reward, done, info = self.preprocessor.modulate((parse_state(observation), reward, done, info),
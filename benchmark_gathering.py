@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+"""Benchmark the throughput of the rollout workers' acting and collection."""
+import argparse
+import os
+import time
+import timeit
+
+import gym
+import numpy as np
+from gym.spaces import Box
+
+from agent.acting import ActStep
+from agent.core import estimate_advantage, estimate_episode_advantages, estimate_batched_advantages
+from agent.gather import Gatherer
+from agent.inference import NumpyActStep, export_model
+from agent.policies import GaussianPolicyDistribution, CategoricalPolicyDistribution
+from environments import *
+from models import build_ffn_models
+from utilities.util import parse_state, add_state_dims, flatten, env_extract_dims
+from utilities.wrappers import CombiWrapper, StateNormalizationWrapper, RewardNormalizationWrapper
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def make_distribution(environment: gym.Env):
+    """Make the default policy distribution for the action space of the environment."""
+    return (GaussianPolicyDistribution if isinstance(environment.action_space, Box)
+            else CategoricalPolicyDistribution)(environment)
+
+
+def steps_per_second(environment: gym.Env, act, n_steps: int) -> float:
+    """Step the environment n_steps times using the given act function and return the steps per second."""
+    state = parse_state(environment.reset())
+    start = time.time()
+    for _ in range(n_steps):
+        action = act(state)
+        observation, _, done, _ = environment.step(action)
+        state = parse_state(environment.reset() if done else observation)
+
+    return n_steps / (time.time() - start)
+
+
+def benchmark_acting(env_name: str, n_steps: int):
+    """Print the environment steps per second when acting with Keras' predict, as done before the act step, with the
+    compiled act step and with the numpy executor."""
+    environment = gym.make(env_name)
+    distribution = make_distribution(environment)
+    _, _, joint = build_ffn_models(environment, distribution)
+    act_step = ActStep(joint, distribution)
+
+    def act_predict(state):
+        *parameters, _ = flatten(joint.predict(add_state_dims(state, dims=1), verbose=0))
+        return distribution.act(*parameters)[0]
+
+    def act_compiled(state):
+        return act_step(add_state_dims(state, dims=1))[0][0]
+
+    steps_per_second(environment, act_compiled, 10)  # trace once before measuring
+    results = [f"predict {steps_per_second(environment, act_predict, n_steps):.1f} steps/s",
+               f"act step {steps_per_second(environment, act_compiled, n_steps):.1f} steps/s"]
+
+    try:
+        numpy_act_step = NumpyActStep(export_model(joint), distribution)
+        numpy_act_step.set_weights(joint.get_weights())
+
+        def act_numpy(state):
+            return numpy_act_step(add_state_dims(state, dims=1))[0][0]
+
+        results.append(f"numpy act step {steps_per_second(environment, act_numpy, n_steps):.1f} steps/s")
+    except NotImplementedError as error:
+        # the executor only knows the layers of the tensorflow versions the repo was written against
+        results.append(f"numpy act step unavailable ({error})")
+
+    print(f"{env_name}: " + ", ".join(results))
+
+
+def benchmark_collection(env_name: str, horizon: int, n_collections: int):
+    """Print the time of every collection of a worker acting with a recurrent model on normalized states and rewards."""
+    environment = gym.make(env_name)
+    distribution = make_distribution(environment)
+    state_dimensionality, _ = env_extract_dims(environment)
+    wrapper = CombiWrapper((StateNormalizationWrapper(state_dimensionality), RewardNormalizationWrapper()))
+
+    start = time.time()
+    gatherer = Gatherer("build_rnn_models", distribution.__class__.__name__, env_name, 0)
+    for _ in range(n_collections):
+        collection_start = time.time()
+        gatherer.collect(horizon, 0.99, 0.95, 16, wrapper.serialize(), transport="object_store")
+        duration = time.time() - collection_start
+        print(f"Gathering Time: {duration:.2f}s ({horizon / duration:.0f} steps/s)")
+
+    print(f"Program Runtime: {time.time() - start:.2f}s")
+
+
+def benchmark_advantages(n_steps: int, n_envs: int, episode_length: int):
+    """Print the time of estimating the advantages of a worker's horizon over several environments, per step, per
+    episode and batched over all environments."""
+    rewards, values = np.random.randn(n_steps, n_envs), np.random.randn(n_steps, n_envs)
+    dones = np.zeros((n_steps, n_envs), dtype=bool)
+    dones[episode_length - 1::episode_length] = True
+    last_values = np.random.randn(n_envs)
+
+    def per_step():
+        for n in range(n_envs):
+            estimate_advantage(rewards[:, n], list(values[:, n]) + [last_values[n]], dones[:, n], 0.99, 0.95)
+
+    def per_episode():
+        for n in range(n_envs):
+            starts = [0] + list(np.flatnonzero(dones[:, n]) + 1)
+            for start, end in zip(starts, starts[1:] + [n_steps]):
+                episode_values = list(values[start:end, n]) + [0 if dones[end - 1, n] else last_values[n]]
+                estimate_episode_advantages(rewards[start:end, n], episode_values, 0.99, 0.95)
+
+    def batched():
+        estimate_batched_advantages(rewards, values, dones, last_values, 0.99, 0.95)
+
+    for name, function in [("estimate_advantage", per_step), ("estimate_episode_advantages", per_episode),
+                           ("estimate_batched_advantages", batched)]:
+        print(f"{name}: {min(timeit.repeat(function, number=10, repeat=3)) / 10 * 1000:.2f}ms")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Measure the throughput of acting and collecting experience.")
+    parser.add_argument("comparison", type=str, choices=["acting", "collection", "advantages"],
+                        help="compare the ways of acting per environment step, time whole collections, or compare the "
+                             "advantage estimations of a worker with 16 environments over a horizon of 2048 steps")
+    parser.add_argument("--env", type=str, nargs="+", default=None, help="environments to measure on")
+    parser.add_argument("--steps", type=int, default=2000, help="environment steps per measurement of acting")
+    args = parser.parse_args()
+
+    if args.comparison == "acting":
+        for name in args.env or ["CartPole-v1", "HandFreeReachAbsolute-v0"]:
+            benchmark_acting(name, args.steps)
+    elif args.comparison == "collection":
+        for name in args.env or ["HalfCheetah-v2"]:
+            benchmark_collection(name, horizon=2048, n_collections=10)
+    else:
+        benchmark_advantages(n_steps=2048, n_envs=16, episode_length=200)
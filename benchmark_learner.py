@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+"""Benchmark the optimization throughput of the learner on synthetic experience."""
+import argparse
+import os
+import statistics
+import time
+
+import gym
+import numpy as np
+
+from agent.dataio import make_dataset_from_arrays
+from agent.ppo import PPOAgent
+from environments import *
+from models import get_model_builder
+
+os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
+
+
+def synthetic_experience(agent: PPOAgent, leading: tuple) -> dict:
+    """Random experience matching the batch signature of the agent's learner."""
+    arrays = {}
+    for name, spec in agent._batch_signature(len(leading)).items():
+        shape = leading + tuple(spec.shape[len(leading):])
+        if spec.dtype.is_floating:
+            arrays[name] = np.random.randn(*shape).astype(spec.dtype.as_numpy_dtype)
+        else:
+            arrays[name] = np.random.randint(0, 2, shape).astype(spec.dtype.as_numpy_dtype)
+
+    return arrays
+
+
+def benchmark(name: str, env_name: str, model: str, model_type: str, batch_size: int, n_batches: int,
+              epochs: int = 4, **agent_options):
+    """Print the optimization throughput of the learner with the given options on synthetic experience."""
+    agent = PPOAgent(get_model_builder(model, model_type, shared=False), gym.make(env_name), horizon=1024,
+                     workers=1, _make_dirs=False, **agent_options)
+    agent._rebuild_models(batch_size)
+
+    # recurrent experience consists of sequences of 8 subsequences each
+    leading = (batch_size * n_batches, 8, agent.tbptt_length) if agent.is_recurrent else (batch_size * n_batches,)
+    n_frames = int(np.prod(leading))
+
+    start = time.time()
+    agent.optimize_model(make_dataset_from_arrays([synthetic_experience(agent, leading)]), epochs=epochs,
+                         batch_size=batch_size)
+    durations = agent.epoch_duration_history[-1]
+
+    print(f"{name}: {n_frames * epochs / (time.time() - start):.0f} ofps overall, "
+          f"cold {n_frames / durations[0]:.0f} ofps, warm {n_frames / statistics.mean(durations[1:]):.0f} ofps, "
+          f"traces {agent.trace_counts}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compare the optimization throughput (ofps) of learner options.")
+    parser.add_argument("comparison", type=str, choices=["precision", "xla"],
+                        help="compare float32 with bfloat16, or the learner step with the XLA compiled one")
+    args = parser.parse_args()
+
+    if args.comparison == "precision":
+        for precision in ["float32", "bfloat16"]:
+            benchmark(f"deeper ffn, {precision}", "LunarLanderContinuous-v2", "deeper", "ffn", batch_size=256,
+                      n_batches=32, precision=precision)
+    else:
+        # XLA only compiles the learner step of feed-forward models
+        for xla in [False, True]:
+            benchmark(f"ffn, xla={xla}", "LunarLanderContinuous-v2", "simple", "ffn", batch_size=64, n_batches=128,
+                      xla=xla)
+            benchmark(f"deeper ffn, xla={xla}", "LunarLanderContinuous-v2", "deeper", "ffn", batch_size=256,
+                      n_batches=32, xla=xla)
@@ -6,7 +6,13 @@ def make_config(batch_size=64, c_entropy=0.01, c_value=1, clip=0.2, cpu=False, d
                 iterations=100, lam=0.97, load_from=None, lr_pi=0.001, clip_values=False, save_every=0,
                 workers=8, tbptt: int = 16, lr_schedule=None, no_state_norming=False, no_reward_norming=False,
                 model="ffn", early_stopping=False, distribution=None, shared=False, preload=None, sequential=False,
-                architecture="simple", radical_evaluation=False, redis_ip=None):
+                architecture="simple", radical_evaluation=False, redis_ip=None, envs_per_worker=1,
+                inference="keras", pipelined=False, experience_transport="columnar",
+                weight_broadcast_dtype="float32", frame_budget=None, straggler_policy="keep",
+                eval_ci_width=None, memory_threshold=None, persistent_episodes=False,
+                action_repeat=1, learner="dataset",
+                precision="float32", xla=False, gradient_accumulation=1,
+                target_kl=None, learner_replicas=1):
     """Make a config from scratch."""
     return dict(**locals())
 
@@ -1,11 +1,13 @@
 """Module for additional environments as well as registering modified environments."""
+import importlib
 
 import gym
 
 from environments.adapted import InvertedPendulumNoVelEnv, ReacherNoVelEnv, HalfCheetahNoVelEnv, \
     LunarLanderContinuousNoVel
 from environments.shadowhand import ShadowHandBlock, ShadowHandReach, ShadowHandBlockVector, ShadowHandMultiReach, \
-    ShadowHandFreeReach, ShadowHandTappingSequence, ShadowHandDelayedTappingSequence, ShadowHandFreeReachVisual
+    ShadowHandFreeReach, ShadowHandTappingSequence, ShadowHandDelayedTappingSequence, ShadowHandFreeReachVisual, \
+    ActionRepeatMixin
 
 # SHADOW HAND
 from utilities.const import SHADOWHAND_MAX_STEPS
@@ -97,6 +99,15 @@ for i, name in enumerate(["FF", "MF", "RF", "LF"]):
         max_episode_steps=SHADOWHAND_MAX_STEPS,
     )
 
+# coarser control: every action is held for several simulator steps, observations are only made at decisions
+for repeat in [2, 4]:
+    gym.envs.register(
+        id=f'HandFreeReachRepeat{repeat}Absolute-v0',
+        entry_point='environments:ShadowHandFreeReach',
+        kwargs={"relative_control": False, "success_multiplier": 0.1, "action_repeat": repeat},
+        max_episode_steps=SHADOWHAND_MAX_STEPS // repeat,
+    )
+
 # HAND TAPPING
 
 gym.envs.register(
@@ -158,3 +169,28 @@ gym.envs.register(
     max_episode_steps=1000,
     reward_threshold=200,
 )
+
+
+def supports_action_repeat(env_name: str) -> bool:
+    """Check whether a registered environment supports action repetition, i.e. is one of the ShadowHand environments
+    (see environments.shadowhand.ActionRepeatMixin), without making it."""
+    entry_point = gym.spec(env_name).entry_point
+    if isinstance(entry_point, str):
+        module_name, class_name = entry_point.split(":")
+        entry_point = getattr(importlib.import_module(module_name), class_name)
+
+    return isinstance(entry_point, type) and issubclass(entry_point, ActionRepeatMixin)
+
+
+def make_environment(env_name: str, action_repeat: int = 1) -> gym.Env:
+    """Make a registered environment, overruling its action repetition if one other than 1 is given.
+
+    Only the ShadowHand environments support action repetition (see environments.shadowhand.ActionRepeatMixin)."""
+    if action_repeat == 1:
+        return gym.make(env_name)
+
+    if not supports_action_repeat(env_name):
+        raise ValueError(f"Environment {env_name} does not support action repetition, only the ShadowHand environments "
+                         f"do.")
+
+    return gym.make(env_name, action_repeat=action_repeat)
\ No newline at end of file
@@ -35,14 +35,52 @@ def get_fingertip_distance(ft_a, ft_b):
     return np.linalg.norm(ft_a - ft_b, axis=-1)
 
 
-class ShadowHand(manipulate.ManipulateEnv):
+class ActionRepeatMixin:
+    """Decouples the control frequency of a robotics environment from its simulation frequency.
+
+    Every policy action is held for action_repeat simulator steps. The rewards of all these steps are summed, while
+    the observation, and with it any rendering, is only produced once at the decision point after the last step. The
+    repetition stops early if the environment signals that the episode is over. Episode limits count decisions, hence
+    with repetition an episode covers action_repeat times the simulated time."""
+
+    action_repeat = 1
+
+    def step(self, action):
+        """Make a decision step in the environment, holding the action for action_repeat simulator steps."""
+        if self.action_repeat == 1:
+            return super().step(action)
+
+        # set the control once, s.t. relative control does not accumulate over the repetition
+        action = np.clip(action, self.action_space.low, self.action_space.high)
+        self._set_action(action)
+
+        reward, info = 0, {}
+        for _ in range(self.action_repeat):
+            self.sim.step()
+            self._step_callback()
+
+            achieved_goal = self._get_achieved_goal().ravel()
+            info = {"is_success": self._is_success(achieved_goal, self.goal)}
+            reward += self.compute_reward(achieved_goal, self.goal, info)
+
+            if self._interrupts_repeat():
+                break
+
+        return self._get_obs(), reward, False, info
+
+    def _interrupts_repeat(self) -> bool:
+        """Whether the repetition of the current action needs to stop before action_repeat steps, e.g. on failure."""
+        return False
+
+
+class ShadowHand(ActionRepeatMixin, manipulate.ManipulateEnv):
     """Adjusted version of ManipulateTouchSensorsEnv Environment in the gym package to fit the projects needs."""
 
     def __init__(self, model_path, target_position, target_rotation, target_position_range, reward_type,
                  initial_qpos={}, randomize_initial_position=True, randomize_initial_rotation=True,
                  distance_threshold=0.01, rotation_threshold=0.1, n_substeps=N_SUBSTEPS, relative_control=True,
                  ignore_z_target_rotation=False, touch_visualisation="off", touch_get_obs="sensordata",
-                 visual_input: bool = False, max_steps=100):
+                 visual_input: bool = False, max_steps=100, action_repeat=1):
         """Initializes a new Hand manipulation environment with touch sensors.
 
         Args:
@@ -58,6 +96,7 @@ class ShadowHand(manipulate.ManipulateEnv):
             visual_input (bool): indicator whether the environment should return frames (True) or the exact object
                 position (False)
             max_steps (int): maximum number of steps before episode is ended
+            action_repeat (int): number of simulator steps each action is held for (see ActionRepeatMixin)
         """
 
         if visual_input:
@@ -72,6 +111,7 @@ class ShadowHand(manipulate.ManipulateEnv):
         self.notouch_color = [0, 0.5, 0, 0.2]
         self.total_steps = 0
         self.max_steps = max_steps
+        self.action_repeat = action_repeat
 
         manipulate.ManipulateEnv.__init__(
             self, model_path, target_position, target_rotation,
@@ -113,13 +153,20 @@ class ShadowHand(manipulate.ManipulateEnv):
             desired_goal=spaces.Box(-np.inf, np.inf, shape=obs['desired_goal'].shape, dtype='float32'),
             achieved_goal=spaces.Box(-np.inf, np.inf, shape=obs['achieved_goal'].shape, dtype='float32'),
             observation=spaces.Tuple((
-                spaces.Box(-np.inf, np.inf, shape=obs["observation"][0].shape, dtype='float32'),  # visual/object
+                self._primary_space(obs["observation"][0]),  # visual/object
                 spaces.Box(-np.inf, np.inf, shape=obs["observation"][1].shape, dtype='float32'),  # proprioception
                 spaces.Box(-np.inf, np.inf, shape=obs["observation"][2].shape, dtype='float32'),  # touch sensors
                 spaces.Box(-np.inf, np.inf, shape=obs["observation"][3].shape, dtype='float32'),  # goal
             ))
         ))
 
+    def _primary_space(self, primary: np.ndarray) -> spaces.Box:
+        """Space of the primary information, uint8 frames if the input is visual."""
+        if self.visual_input:
+            return spaces.Box(0, 255, shape=primary.shape, dtype='uint8')
+
+        return spaces.Box(-np.inf, np.inf, shape=primary.shape, dtype='float32')
+
     def _viewer_setup(self):
         super()._viewer_setup()
 
@@ -186,6 +233,9 @@ class ShadowHand(manipulate.ManipulateEnv):
 
         return dropped
 
+    def _interrupts_repeat(self) -> bool:
+        return self._is_dropped()
+
     def step(self, action):
         """Make step in environment."""
         self.total_steps += 1
@@ -215,7 +265,7 @@ class ShadowHandBlock(ShadowHand, utils.EzPickle):
     """ShadowHand Environment with a Block as an object."""
 
     def __init__(self, target_position='ignore', target_rotation='xyz', touch_get_obs='sensordata',
-                 reward_type='dense', visual_input: bool = False, max_steps=100):
+                 reward_type='dense', visual_input: bool = False, max_steps=100, action_repeat=1):
         utils.EzPickle.__init__(self, target_position, target_rotation, touch_get_obs, reward_type)
         ShadowHand.__init__(self,
                             model_path=MANIPULATE_BLOCK_XML,
@@ -225,14 +275,15 @@ class ShadowHandBlock(ShadowHand, utils.EzPickle):
                             target_position_range=np.array([(-0.04, 0.04), (-0.06, 0.02), (0.0, 0.06)]),
                             reward_type=reward_type,
                             visual_input=visual_input,
-                            max_steps=max_steps)
+                            max_steps=max_steps,
+                            action_repeat=action_repeat)
 
 
 class ShadowHandEgg(ShadowHand, utils.EzPickle):
     """ShadowHand Environment with an Egg as an object."""
 
     def __init__(self, target_position='ignore', target_rotation='xyz', touch_get_obs='sensordata',
-                 reward_type='dense', visual_input: bool = False, max_steps=100):
+                 reward_type='dense', visual_input: bool = False, max_steps=100, action_repeat=1):
         utils.EzPickle.__init__(self, target_position, target_rotation, touch_get_obs, reward_type)
         ShadowHand.__init__(self,
                             model_path=MANIPULATE_EGG_XML,
@@ -242,20 +293,22 @@ class ShadowHandEgg(ShadowHand, utils.EzPickle):
                             target_position_range=np.array([(-0.04, 0.04), (-0.06, 0.02), (0.0, 0.06)]),
                             reward_type=reward_type,
                             visual_input=visual_input,
-                            max_steps=max_steps)
+                            max_steps=max_steps,
+                            action_repeat=action_repeat)
 
 
 # RELATED HAND TASKS
 
-class ShadowHandReach(HandReachEnv):
+class ShadowHandReach(ActionRepeatMixin, HandReachEnv):
     """Simpler Reaching task."""
 
     FORCE_MULTIPLIER = 0.05
 
     def __init__(self, distance_threshold=0.02, n_substeps=N_SUBSTEPS, relative_control=True,
-                 initial_qpos=DEFAULT_INITIAL_QPOS, reward_type='dense', success_multiplier=0.1):
+                 initial_qpos=DEFAULT_INITIAL_QPOS, reward_type='dense', success_multiplier=0.1, action_repeat=1):
         self.success_multiplier = success_multiplier
         self.current_target_finger = "none"
+        self.action_repeat = action_repeat
 
         self._touch_sensor_id_site_id = []
         self._touch_sensor_id = []
@@ -335,9 +388,9 @@ class ShadowHandMultiReach(ShadowHandReach):
     """Reaching task where three fingers have to be joined."""
 
     def __init__(self, distance_threshold=0.02, n_substeps=N_SUBSTEPS, relative_control=True,
-                 initial_qpos=DEFAULT_INITIAL_QPOS, reward_type='dense', success_multiplier=0.1):
+                 initial_qpos=DEFAULT_INITIAL_QPOS, reward_type='dense', success_multiplier=0.1, action_repeat=1):
         super().__init__(distance_threshold, n_substeps, relative_control, initial_qpos, reward_type,
-                         success_multiplier)
+                         success_multiplier, action_repeat=action_repeat)
 
     def _sample_goal(self):
         thumb_name = 'robot0:S_thtip'
@@ -379,13 +432,13 @@ class ShadowHandFreeReach(ShadowHandReach):
     The goal is represented as a one-hot vector of size 4."""
 
     def __init__(self, distance_threshold=0.02, n_substeps=N_SUBSTEPS, relative_control=True,
-                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.1, force_finger=None):
+                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.1, force_finger=None, action_repeat=1):
         assert force_finger in list(range(5)) + [None], "Forced finger index out of range [0, 5]."
 
         self.thumb_name = 'robot0:S_thtip'
         self.forced_finger = force_finger
         super().__init__(distance_threshold, n_substeps, relative_control, initial_qpos, "dense",
-                         success_multiplier)
+                         success_multiplier, action_repeat=action_repeat)
 
     def compute_reward(self, achieved_goal, goal, info):
         reward = (- get_fingertip_distance(self._get_thumb_position(), self._get_target_finger_position())
@@ -457,7 +510,7 @@ class ShadowHandFreeReach(ShadowHandReach):
 class ShadowHandFreeReachVisual(ShadowHandFreeReach):
 
     def __init__(self, distance_threshold=0.02, n_substeps=N_SUBSTEPS, relative_control=True,
-                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.1, force_finger=None):
+                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.1, force_finger=None, action_repeat=1):
         # init rendering [IMPORTANT]
         from mujoco_py import GlfwContext
         GlfwContext(offscreen=True)  # in newer version of gym use quiet=True to silence this
@@ -466,7 +519,8 @@ class ShadowHandFreeReachVisual(ShadowHandFreeReach):
 
         super().__init__(distance_threshold=distance_threshold, n_substeps=n_substeps,
                          relative_control=relative_control, initial_qpos=initial_qpos,
-                         success_multiplier=success_multiplier, force_finger=force_finger)
+                         success_multiplier=success_multiplier, force_finger=force_finger,
+                         action_repeat=action_repeat)
 
         # set hand and background colors
         self.sim.model.mat_rgba[2] = np.array([16, 18, 35, 255]) / 255
@@ -488,7 +542,7 @@ class ShadowHandFreeReachVisual(ShadowHandFreeReach):
             desired_goal=spaces.Box(-np.inf, np.inf, shape=obs['desired_goal'].shape, dtype='float32'),
             achieved_goal=spaces.Box(-np.inf, np.inf, shape=obs['achieved_goal'].shape, dtype='float32'),
             observation=spaces.Tuple((
-                spaces.Box(-np.inf, np.inf, shape=obs["observation"][0].shape, dtype='float32'),  # visual
+                spaces.Box(0, 255, shape=obs["observation"][0].shape, dtype='uint8'),  # visual
                 spaces.Box(-np.inf, np.inf, shape=obs["observation"][1].shape, dtype='float32'),  # proprioception
                 spaces.Box(-np.inf, np.inf, shape=obs["observation"][2].shape, dtype='float32'),  # touch sensors
                 spaces.Box(-np.inf, np.inf, shape=obs["observation"][3].shape, dtype='float32'),  # goal
@@ -515,10 +569,10 @@ class ShadowHandFreeReachVisual(ShadowHandFreeReach):
 class ShadowHandFreeReachAction(ShadowHandFreeReach):
 
     def __init__(self, distance_threshold=0.02, n_substeps=20, relative_control=True,
-                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.1, force_finger=None):
+                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.1, force_finger=None, action_repeat=1):
 
         super().__init__(distance_threshold, n_substeps, relative_control, initial_qpos,
-                         success_multiplier, force_finger)
+                         success_multiplier, force_finger, action_repeat=action_repeat)
         self.previous_reward = 0
 
     def compute_reward(self, achieved_goal, goal, info):
@@ -545,8 +599,9 @@ class ShadowHandTappingSequence(ShadowHandFreeReach):
     punishing distance of the thumb to target fingers and rewarding the distance to non-target fingers."""
 
     def __init__(self, distance_threshold=0.02, n_substeps=N_SUBSTEPS, relative_control=True,
-                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.5):
-        super().__init__(distance_threshold, n_substeps, relative_control, initial_qpos, success_multiplier)
+                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.5, action_repeat=1):
+        super().__init__(distance_threshold, n_substeps, relative_control, initial_qpos, success_multiplier,
+                         action_repeat=action_repeat)
         self.goal_sequence = [0, 1, 2, 3, 2, 1, 0]
         self.current_sequence_position = 0
 
@@ -640,13 +695,14 @@ class ShadowHandDelayedTappingSequence(ShadowHandTappingSequence):
     punishing distance of the thumb to target fingers and rewarding the distance to non-target fingers."""
 
     def __init__(self, distance_threshold=0.02, n_substeps=N_SUBSTEPS, relative_control=True,
-                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.1, resting_duration=10):
-        super().__init__(distance_threshold, n_substeps, relative_control, initial_qpos, success_multiplier)
+                 initial_qpos=DEFAULT_INITIAL_QPOS, success_multiplier=0.1, resting_duration=10, action_repeat=1):
+        super().__init__(distance_threshold, n_substeps, relative_control, initial_qpos, success_multiplier,
+                         action_repeat=action_repeat)
         self.resting_duration = resting_duration
         self.steps_on_target = 0
 
     def step(self, action):
-        observation, reward, done, info = HandReachEnv.step(self, action)
+        observation, reward, done, info = ActionRepeatMixin.step(self, action)
 
         # set next goal
         if info["is_success"]:
@@ -667,7 +723,11 @@ class ShadowHandDelayedTappingSequence(ShadowHandTappingSequence):
         return observation, reward, done, info
 
 
-class ShadowHandBlockVector(HandBlockEnv):
+class ShadowHandBlockVector(ActionRepeatMixin, HandBlockEnv):
+
+    def __init__(self, action_repeat=1, **kwargs):
+        self.action_repeat = action_repeat
+        super().__init__(**kwargs)
 
     def _get_obs(self):
         robot_qpos, robot_qvel = robot_get_obs(self.sim)
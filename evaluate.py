@@ -12,7 +12,11 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
 parser = argparse.ArgumentParser(description="Evaluate an agent.")
 parser.add_argument("id", type=int, nargs="?", help="id of the agent, defaults to newest", default=None)
-parser.add_argument("-n", type=int, help="number of evaluation episodes", default=10)
+parser.add_argument("-n", type=int, help="(maximum) number of evaluation episodes", default=10)
+parser.add_argument("--ci-width", type=float, default=None,
+                    help="stop early once the confidence interval of the mean reward is narrower than this")
+parser.add_argument("--confidence", type=float, default=0.95, help="confidence level of the interval")
+parser.add_argument("--min-episodes", type=int, default=10, help="episodes to finish before stopping early")
 args = parser.parse_args()
 
 if args.id is None:
@@ -23,14 +27,14 @@ start = time.time()
 agent = PPOAgent.from_agent_state(args.id, "b")
 print(f"Agent {args.id} successfully loaded.")
 
-stats, _ = agent.evaluate(args.n)
+stats, _ = agent.evaluate(args.n, ci_width=args.ci_width, confidence=args.confidence, min_episodes=args.min_episodes)
 
 average_reward = round(statistics.mean(stats.episode_rewards), 2)
 average_length = round(statistics.mean(stats.episode_lengths), 2)
 std_reward = round(statistics.stdev(stats.episode_rewards), 2)
 std_length = round(statistics.stdev(stats.episode_lengths), 2)
 
-print(f"Evaluated agent on {args.n} x {agent.env_name} and achieved an average reward of {average_reward} [std: {std_reward}; "
+print(f"Evaluated agent on {stats.numb_completed_episodes} x {agent.env_name} and achieved an average reward of {average_reward} [std: {std_reward}; "
       f"between ({min(stats.episode_rewards)}, {max(stats.episode_rewards)})].\n"
       f"An episode on average took {average_length} steps [std: {std_length}; "
       f"between ({min(stats.episode_lengths)}, {max(stats.episode_lengths)})].\n"
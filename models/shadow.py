@@ -8,6 +8,7 @@ from tensorflow.keras.layers import TimeDistributed as TD
 from tensorflow_core.python.keras.utils import plot_model
 from tqdm import tqdm
 
+from agent.layers import ImageNormalization
 from agent.policies import BasePolicyDistribution, BetaPolicyDistribution
 from environments import *
 from models.components import _build_fcn_component
@@ -28,13 +29,14 @@ def build_shadow_brain_v1(env: gym.Env, distribution: BasePolicyDistribution, bs
         model_type]
 
     # inputs
-    visual_in = tf.keras.Input(batch_shape=(bs, None, VISION_WH, VISION_WH, 3), name="visual_input")
+    visual_in = tf.keras.Input(batch_shape=(bs, None, VISION_WH, VISION_WH, 3), name="visual_input", dtype=tf.uint8)
     proprio_in = tf.keras.Input(batch_shape=(bs, None, 48,), name="proprioceptive_input")
     touch_in = tf.keras.Input(batch_shape=(bs, None, 92,), name="somatosensory_input")
     goal_in = tf.keras.Input(batch_shape=(bs, None, 7,), name="goal_input")
 
     # abstractions of perceptive inputs
-    visual_latent = TD(_build_visual_encoder(shape=(VISION_WH, VISION_WH, 3), batch_size=bs))(visual_in)
+    visual_normed = ImageNormalization()(visual_in)
+    visual_latent = TD(_build_visual_encoder(shape=(VISION_WH, VISION_WH, 3), batch_size=bs))(visual_normed)
     proprio_latent = TD(_build_fcn_component(48, 12, 8, batch_size=bs, name="latent_proprio"))(proprio_in)
     touch_latent = TD(_build_fcn_component(92, 24, 8, batch_size=bs, name="latent_touch"))(touch_in)
 
@@ -118,13 +120,14 @@ def build_shadow_brain_v2(env: gym.Env, distribution: BasePolicyDistribution, bs
     hidden_dimensions = 32
 
     # inputs
-    visual_in = tf.keras.Input(batch_shape=(bs, None, VISION_WH, VISION_WH, 3), name="visual_input")
+    visual_in = tf.keras.Input(batch_shape=(bs, None, VISION_WH, VISION_WH, 3), name="visual_input", dtype=tf.uint8)
     proprio_in = tf.keras.Input(batch_shape=(bs, None, 48,), name="proprioceptive_input")
     touch_in = tf.keras.Input(batch_shape=(bs, None, 92,), name="somatosensory_input")
     goal_in = tf.keras.Input(batch_shape=(bs, None, 7,), name="goal_input")
 
     # abstractions of perceptive inputs
-    visual_latent = TD(_build_visual_encoder(shape=(VISION_WH, VISION_WH, 3), batch_size=bs))(visual_in)
+    visual_normed = ImageNormalization()(visual_in)
+    visual_latent = TD(_build_visual_encoder(shape=(VISION_WH, VISION_WH, 3), batch_size=bs))(visual_normed)
     visual_latent = TD(tf.keras.layers.Dense(128))(visual_latent)
     visual_latent = TD(tf.keras.layers.ReLU())(visual_latent)
     visual_latent.set_shape([bs] + visual_latent.shape[1:])
@@ -241,7 +241,8 @@ def evaluate():
     if request.method == "POST":
         try:
             agent = PPOAgent.from_agent_state(request.json['id'])
-            evaluation_stats, _ = agent.evaluate(10, save=True)
+            evaluation_stats, _ = agent.evaluate(request.json.get("n", 10), save=True,
+                                                 ci_width=request.json.get("ci_width"))
 
             return {"results": evaluation_stats._asdict()}
 
@@ -40,6 +40,7 @@ entropy_plot_div = document.getElementById('entropy-plot');
 
 vloss_plot_div = document.getElementById('vloss-plot');
 ploss_plot_div = document.getElementById('ploss-plot');
+kl_plot_div = document.getElementById('kl-plot');
 
 rew_norm_plot_div = document.getElementById('rew-norm-plot');
 state_norm_plot_div = document.getElementById('state-norm-plot');
@@ -269,6 +270,26 @@ $.when(
         title: "Value Loss",
     }, objective_layout), {responsive: true});
 
+    // KL DIVERGENCE PLOT, only recorded by newer experiments
+    if ("kl" in prog) {
+        let kl_trace = {
+            x: _.range(_.size(prog["kl"])), y: prog["kl"],
+            mode: "lines", name: "Approximate KL Divergence",
+            marker: {color: "SlateBlue"},
+        };
+
+        let epochs_trace = {
+            x: _.range(_.size(prog["epochs"])), y: prog["epochs"],
+            mode: "lines", name: "Epochs", line: {color: "lightgrey", dash: "dot"}, yaxis: 'y2',
+        };
+
+        Plotly.newPlot(kl_plot_div, [kl_trace, epochs_trace], _.merge({
+            title: "Approximate KL Divergence",
+            yaxis2: {title: "Epochs", side: "right", overlaying: 'y', showgrid: false},
+            yaxis: {title: "KL", showgrid: false},
+        }, standard_layout), {responsive: true});
+    }
+
     // NORMALIZATION PLOTS
     let norm_plot_x = _.range(_.size(prog["preprocessors"]["RewardNormalizationWrapper"]["mean"]))
     let rew_norm_traces = [];
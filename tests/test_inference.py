@@ -0,0 +1,89 @@
+import unittest
+
+import gym
+import numpy as np
+import tensorflow as tf
+
+from agent.inference import export_model, NumpyModel, NumpyActStep
+from agent.layers import ImageNormalization
+from agent.policies import GaussianPolicyDistribution, BetaPolicyDistribution, CategoricalPolicyDistribution
+from models import build_ffn_models, build_rnn_models
+from models.convolutional import _build_visual_encoder
+from utilities.util import flatten
+
+
+class InferenceTest(unittest.TestCase):
+
+    def assert_parity(self, keras_model, numpy_model, inputs):
+        keras_outputs = flatten(keras_model.predict(inputs))
+        numpy_outputs = numpy_model(inputs)
+
+        self.assertEqual(len(keras_outputs), len(numpy_outputs))
+        for k, n in zip(keras_outputs, numpy_outputs):
+            self.assertEqual(k.shape, n.shape)
+            self.assertTrue(np.allclose(k, n, atol=1e-5), msg="Numpy inference deviates from Keras.")
+
+    def test_ffn_parity(self):
+        continuous_env, discrete_env = gym.make("LunarLanderContinuous-v2"), gym.make("LunarLander-v2")
+
+        for env, distribution, shared in [(continuous_env, GaussianPolicyDistribution, False),
+                                          (continuous_env, BetaPolicyDistribution, True),
+                                          (discrete_env, CategoricalPolicyDistribution, False)]:
+            _, _, joint = build_ffn_models(env, distribution(env), shared=shared)
+            numpy_joint = NumpyModel(export_model(joint), joint.get_weights())
+
+            self.assert_parity(joint, numpy_joint, np.random.randn(5, 8).astype(np.float32))
+
+    def test_recurrent_parity(self):
+        continuous_env, discrete_env = gym.make("LunarLanderContinuous-v2"), gym.make("LunarLander-v2")
+
+        for env, distribution, model_type in [(continuous_env, GaussianPolicyDistribution, "gru"),
+                                              (continuous_env, BetaPolicyDistribution, "lstm"),
+                                              (discrete_env, CategoricalPolicyDistribution, "rnn")]:
+            _, _, joint = build_rnn_models(env, distribution(env), bs=3, model_type=model_type)
+            numpy_joint = NumpyModel(export_model(joint), joint.get_weights())
+
+            # stateful models need to stay in sync over several calls, including masked timesteps
+            sequence = np.random.randn(3, 4, 8).astype(np.float32)
+            sequence[1, 2] = 0
+            self.assert_parity(joint, numpy_joint, sequence)
+            for _ in range(3):
+                self.assert_parity(joint, numpy_joint, np.random.randn(3, 1, 8).astype(np.float32))
+
+            joint.reset_states()
+            numpy_joint.reset_states()
+            self.assert_parity(joint, numpy_joint, np.random.randn(3, 1, 8).astype(np.float32))
+
+    def test_convolutional_parity(self):
+        encoder = _build_visual_encoder(shape=(67, 67, 3))
+        numpy_encoder = NumpyModel(export_model(encoder), encoder.get_weights())
+
+        self.assert_parity(encoder, numpy_encoder, np.random.random((2, 67, 67, 3)).astype(np.float32))
+
+    def test_uint8_image_parity(self):
+        inputs = tf.keras.Input((67, 67, 3), dtype=tf.uint8)
+        encoder = _build_visual_encoder(shape=(67, 67, 3))
+        model = tf.keras.Model(inputs, encoder(ImageNormalization()(inputs)))
+        numpy_model = NumpyModel(export_model(model), model.get_weights())
+
+        self.assert_parity(model, numpy_model, np.random.randint(0, 256, (2, 67, 67, 3), dtype=np.uint8))
+
+    def test_numpy_act_step(self):
+        env = gym.make("LunarLanderContinuous-v2")
+        distribution = BetaPolicyDistribution(env)
+        _, _, joint = build_ffn_models(env, distribution)
+
+        act_step = NumpyActStep(export_model(joint), distribution)
+        act_step.set_weights(joint.get_weights())
+        states = np.random.randn(4, 8).astype(np.float32)
+        actions, log_probabilities, values = act_step(states)
+
+        alphas, betas, reference_values = flatten(joint.predict(states))
+        self.assertEqual(actions.shape, (4, 2))
+        self.assertTrue(np.allclose(values, reference_values[:, 0], atol=1e-5))
+        self.assertTrue(np.allclose(log_probabilities, distribution.log_probability(actions, alphas, betas),
+                                    atol=1e-3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@ import unittest
 
 import numpy as np
 
-from utilities.statistics import increment_mean_var
+from utilities.statistics import increment_mean_var, mean_confidence_interval_width
 
 
 class StatisticsTest(unittest.TestCase):
@@ -23,4 +23,13 @@ class StatisticsTest(unittest.TestCase):
         np_var = np.var(samples, axis=0)
 
         self.assertTrue(np.allclose(mean, np_mean),
-                        np.allclose(mean, np_var))
\ No newline at end of file
+                        np.allclose(mean, np_var))
+
+    def test_mean_confidence_interval_width(self):
+        samples = np.random.randn(10000) * 3 + 5
+
+        # for many samples the t-distribution approaches the normal distribution
+        self.assertTrue(np.isclose(mean_confidence_interval_width(samples, 0.95), 2 * 1.96 * 3 / 100, rtol=0.05))
+        self.assertGreater(mean_confidence_interval_width(samples[:10], 0.99),
+                           mean_confidence_interval_width(samples[:10], 0.9))
+        self.assertEqual(mean_confidence_interval_width(samples[:1]), float("inf"))
@@ -2,6 +2,7 @@ import itertools
 import logging
 import os
 import random
+import tempfile
 import unittest
 
 import gym
@@ -11,15 +12,25 @@ import tensorflow as tf
 from scipy.signal import lfilter
 from scipy.stats import norm, entropy, beta
 
-from agent.core import extract_discrete_action_probabilities, estimate_advantage
+from agent.acting import ActStep
+from agent.broadcast import WeightDistributor, unpack_weights
+from agent.core import extract_discrete_action_probabilities, estimate_advantage, estimate_episode_advantages, \
+    estimate_batched_advantages
+from agent.learner import shard_experience, clip_by_global_norm
+from agent.dataio import buffer_to_arrays, make_dataset_from_arrays, write_columnar_shard, read_columnar_shard, \
+    MemmapExperienceStore, tf_serialize_example, get_cycle_file_name, read_dataset_from_storage, \
+    delete_cycle_from_storage
+from agent.gather import Gatherer
 from agent.policies import GaussianPolicyDistribution, CategoricalPolicyDistribution, BetaPolicyDistribution
 from agent.ppo import PPOAgent
 from analysis.investigation import Investigator
 from models import get_model_builder
 from utilities.const import NP_FLOAT_PREC
-from utilities.model_utils import reset_states_masked
+from utilities.datatypes import ExperienceBuffer, TimeSequenceExperienceBuffer, StatBundle, condense_stats, \
+    worker_throughputs
+from utilities.model_utils import reset_states_masked, reset_states_masked_in_graph, compute_precision
 from utilities.util import insert_unknown_shape_dimensions
-from utilities.wrappers import StateNormalizationWrapper, RewardNormalizationWrapper
+from utilities.wrappers import StateNormalizationWrapper, RewardNormalizationWrapper, CombiWrapper, SkipWrapper
 
 from tests import *
 
@@ -50,6 +61,46 @@ class CoreTest(unittest.TestCase):
 
         self.assertTrue(tf.reduce_all(tf.equal(result, result_reference)).numpy().item())
 
+    def test_extract_discrete_action_probabilities_with_unknown_shapes(self):
+        for rank in [1, 2]:
+            extract = tf.function(extract_discrete_action_probabilities, input_signature=[
+                tf.TensorSpec((None,) * rank + (3,), tf.float32), tf.TensorSpec((None,) * rank, tf.int32)])
+
+            predictions = tf.random.normal((4, 5, 3)[2 - rank:])
+            actions = tf.random.uniform((4, 5)[2 - rank:], 0, 3, dtype=tf.int32)
+            reference = tf.reduce_sum(predictions * tf.one_hot(actions, 3), axis=-1)
+
+            self.assertTrue(np.allclose(extract(predictions, actions), reference))
+
+    def test_batched_advantages_match_estimate_advantage(self):
+        rewards, values = np.random.randn(100, 5), np.random.randn(100, 5)
+        dones, last_values = np.random.random((100, 5)) < 0.05, np.random.randn(5)
+
+        advantages, returns = estimate_batched_advantages(rewards, values, dones, last_values, 0.99, 0.95)
+
+        self.assertEqual(advantages.shape, (100, 5))
+        self.assertTrue(np.allclose(returns, advantages + values))
+        for n in range(5):
+            reference = estimate_advantage(rewards[:, n], np.append(values[:, n], last_values[n]), dones[:, n], 0.99,
+                                           0.95)
+            self.assertTrue(np.allclose(advantages[:, n], reference, atol=1e-5))
+
+    def test_batched_advantages_match_episode_advantages(self):
+        rewards, values = np.random.randn(30, 2), np.random.randn(30, 2)
+        dones = np.zeros((30, 2), dtype=bool)
+        dones[9, 0] = dones[29, 1] = True
+        last_values = np.random.randn(2)
+
+        advantages, _ = estimate_batched_advantages(rewards, values, dones, last_values, 0.99, 0.95)
+
+        # a finished and a truncated episode in the first environment, one finished episode in the second
+        self.assertTrue(np.allclose(advantages[:10, 0], estimate_episode_advantages(
+            rewards[:10, 0], np.append(values[:10, 0], 0), 0.99, 0.95)))
+        self.assertTrue(np.allclose(advantages[10:, 0], estimate_episode_advantages(
+            rewards[10:, 0], np.append(values[10:, 0], last_values[0]), 0.99, 0.95)))
+        self.assertTrue(np.allclose(advantages[:, 1], estimate_episode_advantages(
+            rewards[:, 1], np.append(values[:, 1], 0), 0.99, 0.95)))
+
 
 class ProbabilityTest(unittest.TestCase):
 
@@ -125,6 +176,64 @@ class ProbabilityTest(unittest.TestCase):
         self.assertTrue(np.allclose(result_reference, result), msg="Discrete entropy returns wrong result")
         self.assertTrue(np.allclose(result_log, result_reference), msg="Discrete entropy from log returns wrong result")
 
+    # MIXED PRECISION
+
+    def test_bfloat16_distribution_parameters(self):
+        env = gym.make("LunarLanderContinuous-v2")
+        build_models = get_model_builder(model="simple", model_type="ffn", shared=False)
+        states = np.random.randn(32, 8).astype(np.float32)
+
+        for distro in [GaussianPolicyDistribution(env), BetaPolicyDistribution(env)]:
+            policy, _, _ = build_models(env, distro)
+            with compute_precision("bfloat16"):
+                bfloat_policy, _, _ = build_models(env, distro)
+            bfloat_policy.set_weights(policy.get_weights())
+
+            params = policy(states)
+            bfloat_params = [tf.cast(p, tf.float32) for p in bfloat_policy(states)]
+            actions, _ = distro.act_in_graph(*params)
+
+            for reference, result in [(distro.log_probability(actions, *params),
+                                       distro.log_probability(actions, *bfloat_params)),
+                                      (distro.entropy(params), distro.entropy(bfloat_params))]:
+                self.assertEqual(result.dtype, tf.float32)
+                self.assertTrue(np.all(np.isfinite(result.numpy())))
+                self.assertTrue(np.allclose(reference.numpy(), result.numpy(), rtol=0.05, atol=0.05),
+                                msg=f"{distro.short_name} deviates under bfloat16")
+
+    # IN GRAPH ACTING
+
+    def test_act_in_graph(self):
+        env = gym.make("LunarLanderContinuous-v2")
+        params = tf.convert_to_tensor([[2, 1], [1, 3], [2, 2]], dtype=tf.float32)
+
+        for distro in [GaussianPolicyDistribution(env), BetaPolicyDistribution(env)]:
+            actions, log_probabilities = tf.function(distro.act_in_graph)(params, params)
+
+            self.assertEqual(actions.shape, params.shape)
+            self.assertTrue(np.allclose(log_probabilities, distro.log_probability(actions, params, params)),
+                            msg=f"{distro.short_name} act in graph returns wrong log probabilities")
+
+        distro = BetaPolicyDistribution(env)
+        actions, _ = distro.act_in_graph(params, params)
+        self.assertTrue(np.all(actions >= env.action_space.low) and np.all(actions <= env.action_space.high))
+
+        distro = CategoricalPolicyDistribution(gym.make("CartPole-v1"))
+        log_pmf = tf.math.log(tf.convert_to_tensor([[0.1, 0.9], [0.5, 0.5], [1.0, 0.0]], dtype=tf.float32))
+        actions, log_probabilities = tf.function(distro.act_in_graph)(log_pmf)
+
+        self.assertTrue(np.allclose(log_probabilities, [log_pmf[i, a] for i, a in enumerate(actions.numpy())]))
+        self.assertEqual(actions[2].numpy().item(), 0)
+
+    def test_masked_approximate_kl_divergence(self):
+        distro = CategoricalPolicyDistribution(gym.make("CartPole-v1"))
+        log_pa = tf.convert_to_tensor([[-0.5, -1.0, 0.0]], dtype=tf.float32)
+        log_pb = tf.convert_to_tensor([[-0.7, -1.0, -np.inf]], dtype=tf.float32)
+
+        kl = distro.approximate_kl_divergence(log_pa, log_pb, mask=tf.not_equal(log_pa, 0))
+        self.assertTrue(np.isclose(kl.numpy(), .5 * (0.2 ** 2) / 2))
+        self.assertEqual(distro.approximate_kl_divergence(log_pa[:, :2], log_pb[:, :2]).numpy(), kl.numpy())
+
 
 class UtilTest(unittest.TestCase):
 
@@ -153,6 +262,438 @@ class UtilTest(unittest.TestCase):
             [0, 0, 0, 0, 0],
         ]))
 
+    def test_masked_state_reset_in_graph(self):
+        model = tf.keras.Sequential((
+            tf.keras.layers.Dense(2, batch_input_shape=(3, None, 2)),
+            tf.keras.layers.GRU(4, stateful=True, name="gary"))
+        )
+
+        layer = model.get_layer("gary")
+        layer.reset_states([s.numpy() + 9 for s in layer.states])
+        tf.function(lambda mask: reset_states_masked_in_graph(model, mask))(tf.constant([False, True, False]))
+
+        self.assertTrue(np.allclose(layer.states[0].numpy(), [[9] * 4, [0] * 4, [9] * 4]))
+
+
+class BroadcastTest(unittest.TestCase):
+
+    def test_weight_package_round_trip(self):
+        model = tf.keras.Sequential((tf.keras.layers.Dense(5, input_shape=(3,)), tf.keras.layers.Dense(2)))
+        distributor = WeightDistributor()
+
+        package = distributor.publish(model, version=0, use_object_store=False)
+        for original, unpacked in zip(model.get_weights(), unpack_weights(package)):
+            self.assertEqual(original.shape, unpacked.shape)
+            self.assertTrue(np.all(original == unpacked))
+
+        # the same version is not packed again, a new one is
+        self.assertIs(distributor.publish(model, version=0, use_object_store=False), package)
+        self.assertIsNot(distributor.publish(model, version=1, use_object_store=False), package)
+
+    def test_half_precision_weight_package(self):
+        model = tf.keras.Sequential((tf.keras.layers.Dense(5, input_shape=(3,)), tf.keras.layers.Dense(2)))
+        package = WeightDistributor(dtype="float16").publish(model, version=0, use_object_store=False)
+
+        self.assertEqual(package.reference.dtype, np.float16)
+        for original, unpacked in zip(model.get_weights(), unpack_weights(package)):
+            self.assertEqual(unpacked.dtype, np.float32)
+            self.assertTrue(np.allclose(original, unpacked, atol=1e-2))
+
+
+class BufferTest(unittest.TestCase):
+
+    def test_preallocated_buffer(self):
+        env = gym.make("CartPole-v1")
+        buffer = ExperienceBuffer.new(env, size=6, is_continuous=False, is_multi_feature=False, n_slots=2)
+        self.assertEqual(buffer.states.dtype, np.float32)
+        self.assertEqual(buffer.actions.dtype, np.int32)
+
+        for step in range(3):
+            for slot in range(2):
+                buffer.push(np.full(4, 10 * slot + step), slot, 0.5, step, slot=slot)
+        buffer.push_adv_ret_to_buffer(np.arange(3), np.arange(3) + 1, slot=1)
+
+        self.assertEqual(buffer.filled, 6)
+        self.assertTrue(np.all(buffer.states[:, 0] == [0, 1, 2, 10, 11, 12]))
+        self.assertTrue(np.all(buffer.actions == [0, 0, 0, 1, 1, 1]))
+        self.assertTrue(np.all(buffer.advantages == [0, 0, 0, 0, 1, 2]))
+        self.assertTrue(np.all(buffer.returns == [0, 0, 0, 1, 2, 3]))
+
+    def test_preallocated_sequence_buffer(self):
+        env = gym.make("CartPole-v1")
+        buffer = TimeSequenceExperienceBuffer.new(env, size=4, seq_len=3, is_continuous=False,
+                                                  is_multi_feature=False, n_slots=2)
+
+        # a full subsequence, then one cut short by an episode end
+        for step in range(5):
+            buffer.push(np.full(4, step), 1, 0.5, step, slot=1)
+            if step in [2, 4]:
+                buffer.end_sequence(slot=1, done=step == 4)
+
+        self.assertEqual(buffer.true_number_of_transitions, 5)
+        self.assertTrue(np.all(buffer.states[2:, :, 0] == [[0, 1, 2], [3, 4, 0]]))
+        self.assertTrue(np.all(buffer.dones[2:] == [[0, 0, 0], [0, 1, 0]]))
+        self.assertTrue(np.all(buffer.actions[:2] == 0))
+
+    def test_worker_telemetry_condensation(self):
+        stats = condense_stats([
+            StatBundle(1, 100, [1], [100], None, worker_telemetry={0: {"frames": 100, "seconds": 2}}),
+            StatBundle(1, 100, [1], [100], None, worker_telemetry={0: {"frames": 100, "seconds": 2}}),
+            StatBundle(1, 100, [1], [100], None, worker_telemetry={1: {"frames": 100, "seconds": 10}}),
+            StatBundle(1, 100, [1], [100], None, worker_telemetry={}),
+        ])
+
+        self.assertEqual(stats.worker_telemetry, {0: {"frames": 200, "seconds": 4}, 1: {"frames": 100, "seconds": 10}})
+        self.assertEqual(worker_throughputs(stats.worker_telemetry), {0: 50, 1: 10})
+
+
+class DataIOTest(unittest.TestCase):
+
+    def test_dataset_from_arrays(self):
+        shards = []
+        for worker in range(3):
+            buffer = ExperienceBuffer.new_empty(is_continuous=True, is_multi_feature=False)
+            buffer.fill(s=np.random.randn(10, 4).astype(np.float32), a=np.random.randn(10, 2).astype(np.float32),
+                        ap=np.random.randn(10).astype(np.float32), adv=np.random.randn(10).astype(np.float32),
+                        ret=np.random.randn(10).astype(np.float32), v=np.full(10, worker, dtype=np.float32))
+            shards.append(buffer_to_arrays(buffer, is_shadow_brain=False))
+
+            self.assertTrue(np.all(shards[-1]["value"] == worker))
+
+        elements = list(make_dataset_from_arrays(shards))
+        self.assertEqual(len(elements), 30)
+        self.assertEqual(sorted(e["value"].numpy().item() for e in elements), [0] * 10 + [1] * 10 + [2] * 10)
+        self.assertEqual(elements[0]["state"].shape, (4,))
+
+    def test_tfrecord_round_trip(self):
+        arrays = {"in_vision": np.random.randint(0, 256, (9, 5, 5, 3), dtype=np.uint8),
+                  "in_proprio": np.random.randn(9, 4).astype(np.float32),
+                  "in_touch": np.random.randn(9, 2).astype(np.float32),
+                  "in_goal": np.random.randn(9, 3).astype(np.float32),
+                  "action": np.random.randn(9, 2).astype(np.float32),
+                  "action_prob": np.random.randn(9).astype(np.float32),
+                  "return": np.random.randn(9).astype(np.float32),
+                  "advantage": np.random.randn(9).astype(np.float32),
+                  "value": np.arange(9).astype(np.float32)}
+
+        dataset = tf.data.Dataset.from_tensor_slices(arrays).map(tf_serialize_example)
+        with tempfile.TemporaryDirectory() as directory:
+            tf.data.experimental.TFRecordWriter(get_cycle_file_name(0, 0, directory=directory)).write(dataset)
+
+            # partially written shards of this or other cycles are never read
+            tf.data.experimental.TFRecordWriter(get_cycle_file_name(0, 1, directory=directory) + ".partial").write(
+                dataset)
+            tf.data.experimental.TFRecordWriter(get_cycle_file_name(1, 0, directory=directory)).write(dataset)
+
+            elements = list(read_dataset_from_storage(tf.float32, is_shadow_hand=True, shuffle=False, cycle=0,
+                                                      dtype_vision=tf.uint8, parse_batch_size=4, directory=directory))
+
+            delete_cycle_from_storage(0, directory)
+            self.assertEqual(os.listdir(directory), [os.path.basename(get_cycle_file_name(1, 0))])
+
+        self.assertEqual(len(elements), 9)
+        for i, element in enumerate(elements):
+            for name, array in arrays.items():
+                self.assertEqual(element[name].dtype.as_numpy_dtype, array.dtype)
+                self.assertTrue(np.array_equal(element[name].numpy(), array[i]))
+
+    def test_columnar_shard_round_trip(self):
+        arrays = {"in_vision": np.random.random((7, 5, 5, 3)).astype(np.float32),
+                  "in_goal": np.random.randn(7, 3).astype(np.float32),
+                  "action": np.random.randint(0, 4, size=7).astype(np.int32),
+                  "value": np.random.randn(7).astype(np.float32)}
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "shard")
+            write_columnar_shard(path, arrays)
+            read = read_columnar_shard(path)
+
+            self.assertEqual(list(read.keys()), list(arrays.keys()))
+            for name, array in arrays.items():
+                self.assertEqual(read[name].dtype, array.dtype)
+                self.assertTrue(np.array_equal(read[name], array))
+
+            elements = list(make_dataset_from_arrays([read]))
+            self.assertEqual(len(elements), 7)
+            self.assertEqual(elements[0]["in_vision"].shape, (5, 5, 3))
+
+            # the mapped arrays are read chunk by chunk, in order
+            elements = list(make_dataset_from_arrays([read], chunk_size=3))
+            for name, array in arrays.items():
+                self.assertTrue(np.array_equal(np.stack([element[name].numpy() for element in elements]), array))
+
+    def test_memmap_experience_store(self):
+        env = gym.make("CartPole-v1")
+
+        with tempfile.TemporaryDirectory() as directory:
+            store = MemmapExperienceStore(directory)
+            for worker in range(2):
+                buffer = ExperienceBuffer.new(env, size=6, is_continuous=False, is_multi_feature=False, n_slots=2,
+                                              allocate=store.allocator(cycle=0, worker_id=worker))
+                for step in range(6):
+                    buffer.push(np.full(4, worker * 6 + step), 1, 0.5, worker * 6 + step, slot=step % 2)
+                buffer.set_advantages_and_returns(np.ones((2, 3)), np.ones((2, 3)))
+                buffer.normalize_advantages()
+                del buffer
+
+                # uncommitted shards are invisible to the learner
+                self.assertEqual(len(store.read_shards(0, is_shadow_hand=False)), worker)
+                store.commit(cycle=0, worker_id=worker)
+
+            batches = list(store.make_batched_dataset(0, batch_size=4, is_shadow_hand=False))
+            self.assertEqual(len(batches), 3)
+            self.assertEqual(batches[0]["state"].shape, (4, 4))
+
+            values = np.concatenate([b["value"].numpy() for b in batches])
+            self.assertEqual(sorted(values.tolist()), list(range(12)))
+            for b in batches:
+                self.assertTrue(np.all(b["state"].numpy()[:, 0] == b["value"].numpy()))
+                self.assertTrue(np.all(b["advantage"].numpy() == 0))
+
+            store.delete_cycle(0)
+            self.assertFalse(os.path.exists(store.cycle_directory(0)))
+
+
+class GatherTest(unittest.TestCase):
+
+    def test_persistent_episodes_continue_collection(self):
+        # two collections that continue the running episodes gather the same experience as one long collection
+        experiences, weights = [], None
+        for horizons in [[64], [32, 32]]:
+            gatherer = Gatherer("build_rnn_models", "CategoricalPolicyDistribution", "CartPole-v1", 0, n_envs=2,
+                                persistent_episodes=True)
+            gatherer.act_step = ActStep(gatherer.joint, gatherer.distribution, deterministic=True)
+            for seed, env in enumerate(gatherer.envs):
+                env.seed(seed)
+
+            if weights is None:
+                weights = gatherer.joint.get_weights()
+            gatherer.joint.set_weights(weights)
+
+            collections = [gatherer.collect(horizon, 0.99, 0.95, 8, SkipWrapper().serialize(),
+                                            transport="object_store")[2] for horizon in horizons]
+
+            # the buffer holds the sequences of the environment slots one after another
+            experiences.append({k: np.concatenate([c[k].reshape(2, -1) for c in collections], axis=1)
+                                for k in ["state", "action", "value", "done"]})
+
+        for k in ["state", "action", "done"]:
+            self.assertTrue(np.all(experiences[0][k] == experiences[1][k]), msg=k)
+        self.assertTrue(np.allclose(experiences[0]["value"], experiences[1]["value"], atol=1e-6))
+
+    def test_persistent_episodes_keep_workers(self):
+        # the running episodes live in the workers, which hence are not recreated every RESET_EVERY cycles
+        env = gym.make("CartPole-v1")
+        builder = get_model_builder(model="simple", model_type="ffn", shared=False)
+        agent = PPOAgent(builder, env, horizon=64, workers=1, persistent_episodes=True, _make_dirs=False)
+
+        workers = [object()]
+        self.assertIs(agent._recreate_workers_if_due(workers, parallel=False, cycle=0), workers)
+
+
+def make_discrete_experience(n: int, seed: int = 0) -> dict:
+    """Make the arrays of n samples of seeded random experience of CartPole, collected by a uniform policy."""
+    random_state = np.random.RandomState(seed)
+
+    buffer = ExperienceBuffer.new_empty(is_continuous=False, is_multi_feature=False)
+    buffer.fill(s=random_state.randn(n, 4).astype(np.float32), a=random_state.randint(0, 2, n).astype(np.int32),
+                ap=np.log(np.full(n, 0.5, dtype=np.float32)), adv=random_state.randn(n).astype(np.float32),
+                ret=random_state.randn(n).astype(np.float32), v=random_state.randn(n).astype(np.float32))
+
+    return buffer_to_arrays(buffer, is_shadow_brain=False)
+
+
+class LearnerTest(unittest.TestCase):
+
+    def setUp(self):
+        # the tests count the traces of the learner's functions, which must not run eagerly for that
+        self.functions_run_eagerly = tf.config.experimental_functions_run_eagerly()
+        tf.config.experimental_run_functions_eagerly(False)
+
+        # the experience is seeded by make_discrete_experience, this seeds the models' initialization and shuffling
+        tf.random.set_seed(0)
+
+    def tearDown(self):
+        tf.config.experimental_run_functions_eagerly(self.functions_run_eagerly)
+
+    def test_resident_learner(self):
+        """The resident learner compiles for the discrete actions of CartPole and updates like the dataset learner."""
+        env = gym.make("CartPole-v1")
+        builder = get_model_builder(model="simple", model_type="ffn", shared=False)
+        agent = PPOAgent(builder, env, horizon=50, workers=1, learner="resident", _make_dirs=False)
+        reference = PPOAgent(builder, env, horizon=50, workers=1, _make_dirs=False)
+        reference.joint.set_weights(agent.joint.get_weights())
+
+        arrays = make_discrete_experience(50)
+
+        # on one minibatch of all samples, the order of the samples does not matter
+        for learner in [agent, reference]:
+            learner.optimize_model(make_dataset_from_arrays([arrays]), epochs=1, batch_size=50)
+        for w, u in zip(reference.joint.get_weights(), agent.joint.get_weights()):
+            self.assertTrue(np.allclose(w, u, atol=1e-5))
+
+        weights = agent.joint.get_weights()
+        agent.optimize_model(make_dataset_from_arrays([arrays]), epochs=3, batch_size=16)
+
+        self.assertEqual(len(agent.epoch_duration_history[-1]), 3)
+        self.assertTrue(np.isfinite(agent.policy_loss_history[-1]))
+        self.assertTrue(np.isfinite(agent.value_loss_history[-1]))
+        self.assertTrue(any(not np.allclose(w, u) for w, u in zip(weights, agent.joint.get_weights())))
+        self.assertEqual(agent.trace_counts, {"resident": 1})
+
+    def test_learner_traces_once(self):
+        env = gym.make("CartPole-v1")
+        agent = PPOAgent(get_model_builder(model="simple", model_type="ffn", shared=False), env, horizon=64,
+                         workers=1, _make_dirs=False)
+
+        for n, batch_size in [(64, 16), (48, 8)]:
+            agent.optimize_model(make_dataset_from_arrays([make_discrete_experience(n)]), epochs=2,
+                                 batch_size=batch_size)
+
+        self.assertEqual(agent.trace_counts, {"step": 1})
+
+    def test_agent_state_round_trip(self):
+        # the compiled learner functions must stay out of the saved parameters
+        env = gym.make("CartPole-v1")
+        working_directory = os.getcwd()
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            try:
+                agent = PPOAgent(get_model_builder(model="simple", model_type="ffn", shared=False), env, horizon=64,
+                                 workers=1)
+                agent.save_agent_state(name="best")
+                loaded = PPOAgent.from_agent_state(agent.agent_id, "best")
+            finally:
+                os.chdir(working_directory)
+
+        self.assertEqual(loaded.horizon, agent.horizon)
+        for w, u in zip(agent.joint.get_weights(), loaded.joint.get_weights()):
+            self.assertTrue(np.allclose(w, u))
+
+    def test_xla_learner(self):
+        env = gym.make("CartPole-v1")
+        builder = get_model_builder(model="simple", model_type="ffn", shared=False)
+
+        arrays = make_discrete_experience(64)
+
+        reference = PPOAgent(builder, env, horizon=64, workers=1, _make_dirs=False)
+        agent = PPOAgent(builder, env, horizon=64, workers=1, xla=True, _make_dirs=False)
+        agent.joint.set_weights(reference.joint.get_weights())
+
+        # on one minibatch of all samples, the order of the samples does not matter
+        for learner in [reference, agent]:
+            learner.optimize_model(make_dataset_from_arrays([arrays]), epochs=2, batch_size=64)
+        for w, u in zip(reference.joint.get_weights(), agent.joint.get_weights()):
+            self.assertTrue(np.allclose(w, u, atol=1e-5))
+        self.assertEqual(agent.trace_counts, {"step": 1})
+
+    def test_kl_early_stopping(self):
+        env = gym.make("CartPole-v1")
+
+        for learner in ["dataset", "resident"]:
+            agent = PPOAgent(get_model_builder(model="simple", model_type="ffn", shared=False), env, horizon=64,
+                             workers=1, learner=learner, target_kl=1e-12, _make_dirs=False)
+
+            agent.optimize_model(make_dataset_from_arrays([make_discrete_experience(64)]), epochs=5, batch_size=16)
+
+            # the behavior policy is uniform, the freshly initialized policy is not exactly
+            self.assertEqual(agent.epochs_history, [1], msg=f"{learner} learner did not stop early")
+            self.assertEqual(len(agent.epoch_duration_history[-1]), 1)
+            self.assertGreater(agent.kl_history[-1], 1e-12)
+
+    def test_gradient_accumulation(self):
+        env = gym.make("CartPole-v1")
+        agent = PPOAgent(get_model_builder(model="simple", model_type="ffn", shared=False), env, horizon=32,
+                         workers=1, gradient_accumulation=4, _make_dirs=False)
+
+        batch = {"state": tf.random.normal((32, 4)), "action": tf.random.uniform((32,), 0, 2, dtype=tf.int32),
+                 "action_prob": tf.math.log(tf.fill((32,), 0.5)), "advantage": tf.random.normal((32,)),
+                 "return": tf.random.normal((32,)), "value": tf.random.normal((32,))}
+
+        full = agent._loss_gradients(batch)
+        accumulated = agent._accumulate_gradients(batch)
+        for f, a in zip(full[:4], accumulated[:4]):
+            self.assertTrue(all(np.allclose(x, y, atol=1e-5) for x, y in zip(tf.nest.flatten(f), tf.nest.flatten(a))))
+
+    def test_recurrent_gradient_accumulation(self):
+        env = gym.make("CartPole-v1")
+        builder = get_model_builder(model="simple", model_type="gru", shared=False)
+        agent = PPOAgent(builder, env, horizon=32, workers=1, _make_dirs=False)
+        accumulating = PPOAgent(builder, env, horizon=32, workers=1, gradient_accumulation=2, _make_dirs=False)
+        agent._rebuild_models(4)
+        accumulating._rebuild_models(2)
+        accumulating.joint.set_weights(agent.joint.get_weights())
+
+        action_prob = np.log(np.full((4, 3), 0.5, dtype=np.float32))
+        action_prob[1, 2:] = 0
+        subsequences = [{"state": tf.random.normal((4, 3, 4)), "action": tf.random.uniform((4, 3), 0, 2, tf.int32),
+                         "action_prob": tf.constant(action_prob), "advantage": tf.random.normal((4, 3)),
+                         "return": tf.random.normal((4, 3)), "value": tf.random.normal((4, 3))} for _ in range(2)]
+
+        # the second subsequence only matches if every micro-batch continues from its own sequences' states
+        for subsequence in subsequences:
+            full = agent._loss_gradients(subsequence)
+            accumulated = accumulating._accumulate_gradients(subsequence)
+            for x, y in zip(full[0] + list(full[1:4]), accumulated[0] + list(accumulated[1:4])):
+                self.assertTrue(np.allclose(x, y, atol=1e-5))
+
+
+class DataParallelTest(unittest.TestCase):
+
+    def test_shard_experience(self):
+        data = {"advantage": np.arange(21, dtype=np.float32), "state": np.arange(42, dtype=np.float32).reshape(21, 2)}
+
+        for shuffle in [True, False]:
+            shards, n_batches = shard_experience(data, n_shards=2, batch_size=8, shuffle=shuffle)
+            self.assertEqual(n_batches, 2)
+
+            # fields stay aligned, and without shuffling every minibatch is made of consecutive samples
+            self.assertTrue(np.all(shards[0]["state"][:, 0] == 2 * shards[0]["advantage"]))
+            if not shuffle:
+                for b in range(n_batches):
+                    minibatch = np.concatenate([shard["advantage"][b * 4:(b + 1) * 4] for shard in shards])
+                    self.assertTrue(np.all(minibatch == np.arange(b * 8, (b + 1) * 8)))
+
+            self.assertEqual(len(np.unique(np.concatenate([shard["advantage"] for shard in shards]))), 16)
+
+    def test_clip_by_global_norm(self):
+        gradients = [np.random.randn(3, 4).astype(np.float32), np.random.randn(5).astype(np.float32)]
+        flat = np.concatenate([g.ravel() for g in gradients])
+
+        for clip_norm in [0.5, 100.]:
+            clipped, _ = tf.clip_by_global_norm(gradients, clip_norm)
+            self.assertTrue(np.allclose(clip_by_global_norm(flat, clip_norm),
+                                        np.concatenate([c.numpy().ravel() for c in clipped])))
+
+    def test_data_parallel_learner(self):
+        """Replicas in separate processes on this host make the same update as a single process learner."""
+        env = gym.make("CartPole-v1")
+        builder = get_model_builder(model="simple", model_type="ffn", shared=False)
+        reference = PPOAgent(builder, env, horizon=64, workers=1, gradient_clipping=0.5, _make_dirs=False)
+        agent = PPOAgent(builder, env, horizon=64, workers=1, gradient_clipping=0.5, learner_replicas=2,
+                         _make_dirs=False)
+        agent.joint.set_weights(reference.joint.get_weights())
+
+        arrays = make_discrete_experience(64)
+
+        ray.init(num_cpus=2, logging_level=logging.ERROR)
+        try:
+            # one minibatch of all samples, s.t. the shuffling does not matter; the second epoch computes its
+            # gradients at the weights of the first update and applies them with the optimizer state it left
+            reference.optimize_model(make_dataset_from_arrays([arrays]), epochs=2, batch_size=64)
+            agent.optimize_model(make_dataset_from_arrays([arrays]), epochs=2, batch_size=64)
+
+            for w, u in zip(reference.joint.get_weights(), agent.joint.get_weights()):
+                self.assertTrue(np.allclose(w, u, atol=1e-5))
+            self.assertEqual(agent.optimizer.iterations.numpy(), 2)
+
+            self.assertTrue(np.isclose(reference.policy_loss_history[-1], agent.policy_loss_history[-1], atol=1e-5))
+            self.assertTrue(np.isclose(reference.kl_history[-1], agent.kl_history[-1], atol=1e-6))
+        finally:
+            agent._replicas = []
+            ray.shutdown()
+
+
 
 class WrapperTest(unittest.TestCase):
 
@@ -182,6 +723,29 @@ class WrapperTest(unittest.TestCase):
         self.assertTrue(np.allclose(true_mean, normalizer.mean))
         self.assertTrue(np.allclose(true_std, np.sqrt(normalizer.variance)))
 
+    def test_episode_state_carry(self):
+        previous = CombiWrapper([StateNormalizationWrapper(3), RewardNormalizationWrapper()])
+        for _ in range(5):
+            previous.modulate((np.random.randn(3), random.random(), False, None))
+
+        continuing = CombiWrapper([StateNormalizationWrapper(3), RewardNormalizationWrapper()])
+        continuing.carry_episode_state(previous)
+
+        # the running return continues, the statistics stay those of the new wrapper
+        self.assertEqual(continuing[1].ret, previous[1].ret)
+        self.assertLess(continuing[1].n, 1)
+
+    def test_state_normalization_passes_images(self):
+        normalizer = StateNormalizationWrapper([(5, 5, 3), (4,)])
+
+        image = np.random.randint(0, 256, (5, 5, 3), dtype=np.uint8)
+        for _ in range(3):
+            (normed_image, normed_vector), _, _, _ = normalizer.modulate(((image, np.random.randn(4)), 1, 1, 1))
+
+        self.assertEqual(normed_image.dtype, np.uint8)
+        self.assertTrue(np.array_equal(normed_image, image))
+        self.assertEqual(normed_vector.shape, (4,))
+
     def test_state_normalization_adding(self):
         normalizer_a = StateNormalizationWrapper(10)
         normalizer_b = StateNormalizationWrapper(10)
@@ -7,6 +7,7 @@ from gym.spaces import Box
 import configs
 from agent.policies import get_distribution_by_short_name
 from agent.ppo import PPOAgent
+from environments import make_environment
 from models import *
 from models import get_model_builder
 from models.shadow import build_blind_shadow_brain_v1
@@ -30,7 +31,7 @@ def run_experiment(environment, settings: dict, verbose=True, init_ray=True, use
                                         "agent state. This cannot be resolved.")
 
     # setup environment and extract and report information
-    env = gym.make(environment)
+    env = make_environment(environment, settings["action_repeat"])
     state_dim, number_of_actions = env_extract_dims(env)
     env_action_space_type = "continuous" if isinstance(env.action_space, Box) else "discrete"
     env_observation_space_type = "continuous" if isinstance(env.observation_space, Box) else "discrete"
@@ -96,7 +97,17 @@ def run_experiment(environment, settings: dict, verbose=True, init_ray=True, use
                          gradient_clipping=settings["grad_norm"], clip_values=settings["clip_values"],
                          tbptt_length=settings["tbptt"], distribution=distribution, preprocessor=preprocessor,
                          pretrained_components=None if settings["preload"] is None else [settings["preload"]],
-                         debug=settings["debug"])
+                         debug=settings["debug"], envs_per_worker=settings["envs_per_worker"],
+                         inference=settings["inference"],
+                         experience_transport=settings["experience_transport"],
+                         weight_broadcast_dtype=settings["weight_broadcast_dtype"],
+                         frame_budget=settings["frame_budget"], straggler_policy=settings["straggler_policy"],
+                         memory_threshold=settings["memory_threshold"],
+                         persistent_episodes=settings["persistent_episodes"],
+                         action_repeat=settings["action_repeat"], learner=settings["learner"],
+                         precision=settings["precision"], xla=settings["xla"],
+                         gradient_accumulation=settings["gradient_accumulation"], target_kl=settings["target_kl"],
+                         learner_replicas=settings["learner_replicas"])
 
         print(f"{wn}Created agent{ec} with ID {bc}{agent.agent_id}{ec}")
 
@@ -114,7 +125,8 @@ def run_experiment(environment, settings: dict, verbose=True, init_ray=True, use
     agent.drill(n=settings["iterations"], epochs=settings["epochs"], batch_size=settings["batch_size"], monitor=monitor,
                 export=settings["export_file"], save_every=settings["save_every"], separate_eval=settings["eval"],
                 stop_early=settings["stop_early"], parallel=not settings["sequential"], ray_is_initialized=not init_ray,
-                radical_evaluation=settings["radical_evaluation"], redis_auth=redis_auth)
+                radical_evaluation=settings["radical_evaluation"], redis_auth=redis_auth,
+                pipelined=settings["pipelined"], evaluation_ci_width=settings["eval_ci_width"])
 
     agent.save_agent_state()
     env.close()
@@ -146,11 +158,15 @@ if __name__ == "__main__":
     parser.add_argument("--config", type=str, default=None, help="config name (utilities/configs.py) to be loaded")
     parser.add_argument("--cpu", action="store_true", help=f"use cpu only")
     parser.add_argument("--sequential", action="store_true", help=f"run worker sequentially workers")
+    parser.add_argument("--pipelined", action="store_true",
+                        help=f"collect the next cycle while optimizing on the current one")
     parser.add_argument("--load-from", type=int, default=None, help=f"load from given agent id")
     parser.add_argument("--preload", type=str, default=None, help=f"load visual component weights from pretraining")
     parser.add_argument("--export-file", type=int, default=None, help=f"save policy to be loaded in workers into file")
     parser.add_argument("--eval", action="store_true", help=f"evaluate additionally to have at least 5 eps")
     parser.add_argument("--radical-evaluation", action="store_true", help=f"only record stats from seperate evaluation")
+    parser.add_argument("--eval-ci-width", type=float, default=None,
+                        help=f"stop separate evaluation once the confidence interval of the mean reward is this narrow")
     parser.add_argument("--save-every", type=int, default=0, help=f"save agent every given number of iterations")
     parser.add_argument("--monitor-frequency", type=int, default=1, help=f"update the monitor every n iterations.")
     parser.add_argument("--gif-every", type=int, default=0, help=f"make a gif every n iterations.")
@@ -161,6 +177,25 @@ if __name__ == "__main__":
     # gathering parameters
     parser.add_argument("--workers", type=int, default=8, help=f"the number of workers exploring the environment")
     parser.add_argument("--horizon", type=int, default=2048, help=f"number of timesteps one worker generates")
+    parser.add_argument("--envs-per-worker", type=int, default=1,
+                        help=f"number of environments a worker steps in lockstep, sharing its horizon")
+    parser.add_argument("--inference", choices=["keras", "numpy"], default="keras",
+                        help=f"how workers run the policy; numpy avoids building keras models in workers")
+    parser.add_argument("--experience-transport", choices=["columnar", "tfrecord", "object_store", "memmap"],
+                        default="columnar",
+                        help=f"how workers hand experience to the learner; object_store avoids writing files")
+    parser.add_argument("--weight-broadcast-dtype", choices=["float32", "float16"], default="float32",
+                        help=f"dtype in which weights are broadcast to the workers")
+    parser.add_argument("--frame-budget", type=int, default=None,
+                        help=f"total frames per cycle, collected in chunks of horizon steps by free workers")
+    parser.add_argument("--straggler-policy", choices=["keep", "discard"], default="keep",
+                        help=f"whether chunks running when the frame budget is reached are kept or dropped")
+    parser.add_argument("--memory-threshold", type=float, default=None,
+                        help=f"replace workers exceeding this memory in MB instead of resetting all periodically")
+    parser.add_argument("--persistent-episodes", action="store_true",
+                        help=f"continue running episodes of the workers across cycles instead of resetting them")
+    parser.add_argument("--action-repeat", type=int, default=1,
+                        help=f"hold every action for this many simulator steps (ShadowHand environments only)")
     parser.add_argument("--discount", type=float, default=0.99, help=f"discount factor for future rewards")
     parser.add_argument("--lam", type=float, default=0.97, help=f"lambda parameter in the GAE algorithm")
     parser.add_argument("--no-state-norming", action="store_true", help=f"do not normalize states")
@@ -169,6 +204,17 @@ if __name__ == "__main__":
     # optimization parameters
     parser.add_argument("--epochs", type=int, default=3, help=f"the number of optimization epochs in each cycle")
     parser.add_argument("--batch-size", type=int, default=64, help=f"minibatch size during optimization")
+    parser.add_argument("--learner", choices=["dataset", "resident"], default="dataset",
+                        help=f"resident runs all epochs on experience held in tensors in one compiled loop (ffn only)")
+    parser.add_argument("--precision", choices=["float32", "bfloat16"], default="float32",
+                        help=f"compute precision of the learner's layers; weights and losses stay float32")
+    parser.add_argument("--xla", action="store_true", help=f"compile the learner step with XLA")
+    parser.add_argument("--gradient-accumulation", type=int, default=1,
+                        help=f"number of micro-batches whose gradients are accumulated into one update per minibatch")
+    parser.add_argument("--learner-replicas", type=int, default=1,
+                        help=f"optimize data-parallel on this many learner replicas, which all-reduce their gradients")
+    parser.add_argument("--target-kl", type=float, default=None,
+                        help=f"skip the remaining epochs of a cycle once the approximate kl divergence exceeds this")
     parser.add_argument("--lr-pi", type=float, default=1e-3, help=f"learning rate of the policy")
     parser.add_argument("--lr-schedule", type=str, default=None, choices=[None, "exponential"],
                         help=f"lr schedule type")
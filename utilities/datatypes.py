@@ -4,27 +4,36 @@ import itertools
 import logging
 import statistics
 from collections import namedtuple
-from typing import List, Union
+from typing import List, Union, Callable
 
 import gym
 import numpy as np
 from keras_preprocessing.sequence import pad_sequences
 from numpy import ndarray as arr
 
-from utilities.util import add_state_dims, env_extract_dims
+from utilities.util import add_state_dims, env_extract_dims, env_extract_state_dtypes
 
 StatBundle = namedtuple("StatBundle", ["numb_completed_episodes", "numb_processed_frames",
-                                       "episode_rewards", "episode_lengths", "tbptt_underflow"])
+                                       "episode_rewards", "episode_lengths", "tbptt_underflow", "worker_telemetry"])
 ModelTuple = namedtuple("ModelTuple", ["model_builder", "weights", "distribution_type"])
 
 
+def _allocate_zeros(name: str, shape: tuple, dtype) -> arr:
+    """Default allocation of the arrays of a preallocated buffer."""
+    return np.zeros(shape, dtype=dtype)
+
+
 class ExperienceBuffer:
-    """Buffer for experience gathered in an environment."""
+    """Buffer for experience gathered in an environment.
+
+    A buffer created by new() is preallocated and columnar: every field is one array (one per feature for multi input
+    states) that experience is written into in place. It is split into equally sized, consecutive blocks, one per
+    environment slot."""
 
     def __init__(self, states: Union[List, arr], actions: Union[List, arr], action_probabilities: Union[List, arr],
                  returns: Union[List, arr], advantages: Union[List, arr], values: Union[List, arr],
                  episodes_completed: int, episode_rewards: List[int], capacity: int, episode_lengths: List[int],
-                 is_multi_feature: bool, is_continuous: bool):
+                 is_multi_feature: bool, is_continuous: bool, n_slots: int = 1):
 
         self.is_continuous = is_continuous
         self.is_multi_feature = is_multi_feature
@@ -42,6 +51,11 @@ class ExperienceBuffer:
         self.states = states
         self.values = values
 
+        self.n_slots = n_slots
+        self.slot_size = capacity // n_slots
+        self.slot_steps_pushed = np.zeros(n_slots, dtype=np.int32)
+        self.slot_advantage_stops = np.zeros(n_slots, dtype=np.int32)
+
     def __repr__(self):
         return f"{self.__class__.__name__}[{self.filled}/{self.capacity}]"
 
@@ -53,6 +67,41 @@ class ExperienceBuffer:
         self.advantages, self.returns, self.action_probabilities, self.actions, self.states = adv, ret, ap, a, s
         self.values = v
 
+    def _write_step(self, index, state, action, action_probability, value):
+        """Write the experience of a single step to the given index of the preallocated arrays."""
+        if self.is_multi_feature:
+            for feature_array, feature in zip(self.states, state):
+                feature_array[index] = feature
+        else:
+            self.states[index] = state
+
+        self.actions[index] = action
+        self.action_probabilities[index] = action_probability
+        self.values[index] = value
+
+    def push(self, state, action, action_probability, value, slot: int = 0):
+        """Write the experience of a single step to the next free position in the block of the given environment
+        slot."""
+        self._write_step(slot * self.slot_size + self.slot_steps_pushed[slot], state, action, action_probability,
+                         value)
+
+        self.slot_steps_pushed[slot] += 1
+        self.filled += 1
+
+    def push_adv_ret_to_buffer(self, advantages: arr, returns: arr, slot: int = 0):
+        """Push advantages and returns of a whole episode that was experienced in the given environment slot."""
+        start = slot * self.slot_size + self.slot_advantage_stops[slot]
+        self.advantages[start:start + len(advantages)] = advantages
+        self.returns[start:start + len(advantages)] = returns
+
+        self.slot_advantage_stops[slot] += len(advantages)
+
+    def set_advantages_and_returns(self, advantages: arr, returns: arr):
+        """Set the advantages and returns of the whole buffer at once, given per environment slot in the shape
+        (n_slots, steps per slot)."""
+        self.advantages[...] = np.reshape(advantages, self.advantages.shape)
+        self.returns[...] = np.reshape(returns, self.returns.shape)
+
     def normalize_advantages(self):
         """Normalize the buffered advantages using z-scores. This requires the sequences to be of equal lengths,
         hence if this is not guaranteed during pushing to the buffer, pad_buffer has to be called first."""
@@ -61,7 +110,7 @@ class ExperienceBuffer:
 
         mean = np.mean(self.advantages)
         std = np.maximum(np.std(self.advantages), 1e-6)
-        self.advantages = (self.advantages - mean) / std
+        self.advantages[...] = (self.advantages - mean) / std
 
     def inject_batch_dimension(self):
         """Add a batch dimension to the buffered experience."""
@@ -88,68 +137,97 @@ class ExperienceBuffer:
                                 is_multi_feature=is_multi_feature)
 
     @staticmethod
-    def new(env: gym.Env, size: int, is_continuous, is_multi_feature):
-        """Return an empty buffer."""
+    def new(env: gym.Env, size: int, is_continuous, is_multi_feature, n_slots: int = 1,
+            allocate: Callable[[str, tuple, type], arr] = None):
+        """Return an empty, preallocated buffer. The size needs to be divisible by the number of environment slots.
+
+        The arrays are allocated by the given function, called with the name of the field, the shape and the dtype,
+        which allows to back them by memory mapped files. By default they are zeroed arrays in memory."""
+        assert size % n_slots == 0, "Cannot split the buffer evenly between the environment slots."
+        allocate = _allocate_zeros if allocate is None else allocate
+
         state_dim, action_dim = env_extract_dims(env)
+        state_dtype = env_extract_state_dtypes(env)
 
         if isinstance(state_dim, int):
-            state_buffer = np.zeros((size, action_dim))
+            state_buffer = allocate("state", (size, state_dim), state_dtype)
         else:
-            state_buffer = tuple(np.zeros((size,) + shape) for shape in state_dim)
+            state_buffer = tuple(allocate(f"state_{i}", (size,) + shape, dtype)
+                                 for i, (shape, dtype) in enumerate(zip(state_dim, state_dtype)))
         return ExperienceBuffer(states=state_buffer,
-                                actions=np.zeros((size, action_dim)),
-                                action_probabilities=np.zeros((size,)),
-                                returns=np.zeros((size,)),
-                                advantages=np.zeros((size,)),
-                                values=np.zeros((size,)),
+                                actions=allocate("action", (size,) + ((action_dim,) if is_continuous else ()),
+                                                 np.float32 if is_continuous else np.int32),
+                                action_probabilities=allocate("action_prob", (size,), np.float32),
+                                returns=allocate("return", (size,), np.float32),
+                                advantages=allocate("advantage", (size,), np.float32),
+                                values=allocate("value", (size,), np.float32),
                                 episodes_completed=0, episode_rewards=[], episode_lengths=[],
                                 capacity=size,
                                 is_continuous=is_continuous,
-                                is_multi_feature=is_multi_feature)
+                                is_multi_feature=is_multi_feature,
+                                n_slots=n_slots)
 
 
 class TimeSequenceExperienceBuffer(ExperienceBuffer):
-    """Experience Buffer for TimeSequence Data"""
+    """Experience Buffer for TimeSequence Data
+
+    Besides the experience, the buffer holds a done mask marking the last step of every episode, which tells the
+    learner after which subsequences the recurrent states need to be reset."""
 
     def __init__(self, states: Union[List, arr], actions: Union[List, arr], action_probabilities: Union[List, arr],
                  returns: Union[List, arr], advantages: Union[List, arr], values: Union[List, arr],
                  episodes_completed: int, episode_rewards: List[int], capacity: int, seq_length: int,
-                 episode_lengths: List[int], is_multi_feature: bool, is_continuous: bool):
+                 episode_lengths: List[int], is_multi_feature: bool, is_continuous: bool, n_slots: int = 1,
+                 dones: arr = None):
 
         super().__init__(states, actions, action_probabilities, returns, advantages, values, episodes_completed,
-                         episode_rewards, capacity, episode_lengths, is_multi_feature, is_continuous)
+                         episode_rewards, capacity, episode_lengths, is_multi_feature, is_continuous, n_slots)
 
+        self.dones = dones if dones is not None else np.zeros(advantages.shape, dtype=np.float32)
         self.seq_length = seq_length
         self.true_number_of_transitions = 0
         self.number_of_subsequences_pushed = 0
         self.advantage_mask = np.ones(advantages.shape)
 
-        self.last_advantage_stop = 0
+        # the blocks of the environment slots consist of subsequences, whose steps are counted separately
+        self.slot_size = advantages.shape[0] // n_slots
+        self.slot_subsequences_pushed = np.zeros(n_slots, dtype=np.int32)
 
-    def push_seq_to_buffer(self, states: List[arr], actions: List[arr], action_probabilities: List[arr], values: List[arr]):
-        """Push a sequence to the buffer, constructed from given lists of values."""
-        assert np.all(np.array([len(states), len(actions), len(action_probabilities), len(values)]) == len(states)), \
-            "Inconsistent input sizes."
+    def push(self, state, action, action_probability, value, slot: int = 0):
+        """Write the experience of a single step to the open subsequence of the given environment slot."""
+        row = slot * self.slot_size + self.slot_subsequences_pushed[slot]
+        self._write_step((row, self.slot_steps_pushed[slot]), state, action, action_probability, value)
+        self.advantage_mask[row, self.slot_steps_pushed[slot]] = 0
 
-        seq_length = len(actions)
-        if self.is_multi_feature:
-            states = [np.stack(list(map(lambda s: s[f_id], states))) for f_id in range(len(states[0]))]
-            for feature_array, features in zip(self.states, states):
-                feature_array[self.number_of_subsequences_pushed, :seq_length, ...] = features
-        else:
-            self.states[self.number_of_subsequences_pushed, :seq_length, ...] = np.stack(states)
+        self.slot_steps_pushed[slot] += 1
 
-        # can I point out for a second that numpy slicing is beautiful as fu**
-        self.actions[self.number_of_subsequences_pushed, :seq_length, ...] = np.stack(actions)
-        self.action_probabilities[self.number_of_subsequences_pushed, :seq_length] = action_probabilities
-        self.values[self.number_of_subsequences_pushed, :seq_length] = values
+    def end_sequence(self, slot: int = 0, done: bool = False):
+        """Close the open subsequence of the given environment slot, s.t. following steps start a new one. If done, its
+        last step is marked as the end of an episode."""
+        if done:
+            row = slot * self.slot_size + self.slot_subsequences_pushed[slot]
+            self.dones[row, self.slot_steps_pushed[slot] - 1] = 1
 
+        self.slot_subsequences_pushed[slot] += 1
         self.number_of_subsequences_pushed += 1
-        self.filled += self.actions.shape[1]
-        self.true_number_of_transitions += seq_length
+        self.filled += self.seq_length
+        self.true_number_of_transitions += self.slot_steps_pushed[slot]
+
+        self.slot_steps_pushed[slot] = 0
+
+    def push_seq_to_buffer(self, states: List[arr], actions: List[arr], action_probabilities: List[arr],
+                           values: List[arr], slot: int = 0):
+        """Push a sequence to the buffer, constructed from given lists of values. The sequence is appended to the block
+        of the given environment slot."""
+        assert np.all(np.array([len(states), len(actions), len(action_probabilities), len(values)]) == len(states)), \
+            "Inconsistent input sizes."
 
-    def push_adv_ret_to_buffer(self, advantages: arr, returns: arr):
-        """Push advantages and returns of a whole episode."""
+        for step in zip(states, actions, action_probabilities, values):
+            self.push(*step, slot=slot)
+        self.end_sequence(slot)
+
+    def push_adv_ret_to_buffer(self, advantages: arr, returns: arr, slot: int = 0):
+        """Push advantages and returns of a whole episode that was experienced in the given environment slot."""
         overhang = len(advantages) % self.seq_length
 
         # split advantages if necessary
@@ -168,11 +246,12 @@ class TimeSequenceExperienceBuffer(ExperienceBuffer):
         # fill in the subsequences one by on
         for adv_sub_seq, ret_sub_seq in zip(advantage_chunks, return_chunks):
             seq_length = len(adv_sub_seq)
-            self.advantages[self.last_advantage_stop, :seq_length] = adv_sub_seq
-            self.advantage_mask[self.last_advantage_stop, :seq_length] = np.zeros(adv_sub_seq.shape)
-            self.returns[self.last_advantage_stop, :seq_length] = ret_sub_seq
+            row = slot * self.slot_size + self.slot_advantage_stops[slot]
+            self.advantages[row, :seq_length] = adv_sub_seq
+            self.advantage_mask[row, :seq_length] = np.zeros(adv_sub_seq.shape)
+            self.returns[row, :seq_length] = ret_sub_seq
 
-            self.last_advantage_stop += 1
+            self.slot_advantage_stops[slot] += 1
 
     def normalize_advantages(self):
         """Normalize the buffered advantages using z-scores. This requires the sequences to be of equal lengths,
@@ -184,28 +263,56 @@ class TimeSequenceExperienceBuffer(ExperienceBuffer):
         masked_advantages = np.ma.masked_array(self.advantages, self.advantage_mask)
         mean = masked_advantages.mean()
         std = np.maximum(masked_advantages.std(), 1e-6)
-        self.advantages = (self.advantages - mean) / std
+        self.advantages[...] = (self.advantages - mean) / std
+
+    def inject_batch_dimension(self):
+        """Add a batch dimension to the buffered experience, separating the subsequences of the environment slots."""
+        split = lambda a: np.reshape(a, (self.n_slots, self.slot_size) + a.shape[1:])
+
+        self.states = split(self.states) if not isinstance(self.states, tuple) else tuple(map(split, self.states))
+        self.actions = split(self.actions)
+        self.action_probabilities = split(self.action_probabilities)
+        self.returns = split(self.returns)
+        self.values = split(self.values)
+        self.advantages = split(self.advantages)
+        self.dones = split(self.dones)
 
     @staticmethod
-    def new(env: gym.Env, size: int, seq_len: int, is_continuous, is_multi_feature):
-        """Return an empty buffer for sequences."""
+    def new(env: gym.Env, size: int, seq_len: int, is_continuous, is_multi_feature, n_slots: int = 1,
+            allocate: Callable[[str, tuple, type], arr] = None):
+        """Return an empty buffer for sequences. The size needs to be divisible by the number of environment slots.
+
+        Arrays are allocated as in ExperienceBuffer.new, but already in the shape that inject_batch_dimension gives
+        them, i.e. with a leading dimension for the environment slots, and viewed without it while filling."""
+        assert size % n_slots == 0, "Cannot split the buffer evenly between the environment slots."
+        allocate = _allocate_zeros if allocate is None else allocate
+
+        def allocate_slotted(name, shape, dtype):
+            return allocate(name, (n_slots, size // n_slots) + shape[1:], dtype).reshape(shape)
+
         state_dim, action_dim = env_extract_dims(env)
+        state_dtype = env_extract_state_dtypes(env)
 
         if isinstance(state_dim, int):
-            state_buffer = np.zeros((size, seq_len, state_dim), dtype=np.float32)
+            state_buffer = allocate_slotted("state", (size, seq_len, state_dim), state_dtype)
         else:
-            state_buffer = tuple(np.zeros((size, seq_len) + shape, dtype=np.float32) for shape in state_dim)
+            state_buffer = tuple(allocate_slotted(f"state_{i}", (size, seq_len) + shape, dtype)
+                                 for i, (shape, dtype) in enumerate(zip(state_dim, state_dtype)))
+        action_buffer = allocate_slotted("action", (size, seq_len) + ((action_dim,) if is_continuous else ()),
+                                         np.float32 if is_continuous else np.int32)
         return TimeSequenceExperienceBuffer(states=state_buffer,
-                                            actions=np.zeros((size, seq_len) + ((action_dim,) if is_continuous else ()),
-                                                             dtype=np.float32 if is_continuous else np.int32),
-                                            action_probabilities=np.zeros((size, seq_len,), dtype=np.float32),
-                                            returns=np.zeros((size, seq_len), dtype=np.float32),
-                                            advantages=np.zeros((size, seq_len), dtype=np.float32),
-                                            values=np.zeros((size, seq_len), dtype=np.float32),
+                                            actions=action_buffer,
+                                            action_probabilities=allocate_slotted("action_prob", (size, seq_len),
+                                                                                  np.float32),
+                                            returns=allocate_slotted("return", (size, seq_len), np.float32),
+                                            advantages=allocate_slotted("advantage", (size, seq_len), np.float32),
+                                            values=allocate_slotted("value", (size, seq_len), np.float32),
                                             episodes_completed=0, episode_rewards=[],
                                             capacity=size * seq_len, seq_length=seq_len,
                                             episode_lengths=[],
-                                            is_continuous=is_continuous, is_multi_feature=is_multi_feature)
+                                            is_continuous=is_continuous, is_multi_feature=is_multi_feature,
+                                            n_slots=n_slots,
+                                            dones=allocate_slotted("done", (size, seq_len), np.float32))
 
 
 def condense_stats(stat_bundles: List[StatBundle]) -> StatBundle:
@@ -216,10 +323,39 @@ def condense_stats(stat_bundles: List[StatBundle]) -> StatBundle:
         episode_rewards=list(itertools.chain(*[s.episode_rewards for s in stat_bundles])),
         episode_lengths=list(itertools.chain(*[s.episode_lengths for s in stat_bundles])),
         tbptt_underflow=round(statistics.mean(map(lambda x: x.tbptt_underflow, stat_bundles)), 2) if (
-                stat_bundles[0].tbptt_underflow is not None) else None
+                stat_bundles[0].tbptt_underflow is not None) else None,
+        worker_telemetry=merge_worker_telemetry([s.worker_telemetry for s in stat_bundles])
     )
 
 
+def merge_worker_telemetry(telemetries: List[dict]) -> dict:
+    """Merge the telemetry dictionaries of several StatBundles, mapping worker IDs to the frames they processed, the
+    seconds they needed for it and their memory usage. Frames and seconds of the same worker are summed up, for any
+    other entry the latest value is kept."""
+    merged = {}
+    for telemetry in telemetries:
+        for worker_id, entry in (telemetry or {}).items():
+            if worker_id not in merged:
+                merged[worker_id] = {"frames": 0, "seconds": 0}
+
+            merged[worker_id].update({k: v for k, v in entry.items() if k not in ["frames", "seconds"]})
+            merged[worker_id]["frames"] += entry["frames"]
+            merged[worker_id]["seconds"] += entry["seconds"]
+
+    return merged
+
+
+def worker_memory_usages(telemetry: dict) -> dict:
+    """Get the resident memory in MB of every worker in a telemetry dictionary that reported it."""
+    return {worker_id: entry["rss"] for worker_id, entry in telemetry.items() if entry.get("rss") is not None}
+
+
+def worker_throughputs(telemetry: dict) -> dict:
+    """Get the frames per second of every worker in a telemetry dictionary."""
+    return {worker_id: entry["frames"] / entry["seconds"] for worker_id, entry in telemetry.items()
+            if entry["seconds"] > 0}
+
+
 if __name__ == '__main__':
     from environments import *
 
@@ -1,4 +1,5 @@
-from typing import List, Union
+from contextlib import contextmanager
+from typing import List, Tuple, Union
 
 import numpy
 import numpy as np
@@ -141,13 +142,83 @@ def reset_states_masked(model: tf.keras.Model, mask: List):
         initial_states = 0
         new_states = []
         for current_state in current_states:
-            expanded_mask = numpy.tile(numpy.rot90(numpy.expand_dims(mask, axis=0)), (1, current_state.shape[-1]))
-            masked_reset_state = np.where(expanded_mask, initial_states, current_state)
+            masked_reset_state = np.where(np.reshape(mask, (-1, 1)), initial_states, current_state)
             new_states.append(masked_reset_state)
 
         layer.reset_states(new_states)
 
 
+def get_recurrent_states(model: tf.keras.Model) -> List[tf.Variable]:
+    """Get the state variables of all recurrent layers of a stateful model."""
+    return [state for layer in extract_layers(model) if isinstance(layer, tf.keras.layers.RNN)
+            for state in layer.states]
+
+
+def reset_states_masked_in_graph(model: tf.keras.Model, mask: tf.Tensor):
+    """Reset a stateful model's states only at the samples in the batch that are specified by the boolean mask, by
+    assigning to the state variables directly. Other than reset_states_masked this runs inside a tf.function and never
+    copies the states to the host."""
+    reset_variables_masked_in_graph(get_recurrent_states(model), mask)
+
+
+def reset_variables_masked_in_graph(variables: List[tf.Variable], mask: tf.Tensor):
+    """Zero the rows of batched variables, e.g. copies of recurrent states, that are specified by the boolean mask."""
+    for variable in variables:
+        variable.assign(tf.where(tf.expand_dims(mask, axis=-1), tf.zeros_like(variable), variable))
+
+
+@contextmanager
+def compute_precision(precision: str = "float32"):
+    """Build the Keras layers created inside this context with the given compute precision.
+
+    With 'bfloat16' the layers compute in bfloat16 but keep float32 variables, s.t. their weights stay interchangeable
+    with those of float32 models. Since bfloat16 has the exponent range of float32, gradients do not underflow and no
+    loss scaling is needed. Outputs are bfloat16 too and should be cast to float32 before computing losses."""
+    assert precision in ["float32", "bfloat16"], "Unknown precision. Choose one of (float32, bfloat16)."
+    if precision == "float32":
+        yield
+        return
+
+    if tensorflow_version() < (2, 1):
+        raise ValueError(f"bfloat16 mixed precision requires tensorflow 2.1 or newer, found {tf.__version__}.")
+
+    # the experimental api of tensorflow 2.1 to 2.3 became the stable one in 2.4
+    mixed_precision = tf.keras.mixed_precision
+    if hasattr(mixed_precision, "set_global_policy"):
+        get_policy, set_policy = mixed_precision.global_policy, mixed_precision.set_global_policy
+    else:
+        get_policy, set_policy = mixed_precision.experimental.global_policy, mixed_precision.experimental.set_policy
+
+    previous_policy = get_policy()
+    set_policy("mixed_bfloat16")
+    try:
+        yield
+    finally:
+        set_policy(previous_policy)
+
+
+def tensorflow_version() -> Tuple[int, int]:
+    """Get the major and minor version of the installed tensorflow."""
+    return tuple(int(part) for part in tf.__version__.split(".")[:2])
+
+
+def create_optimizer_slots(optimizer: tf.keras.optimizers.Optimizer, variables: List[tf.Variable]):
+    """Create the slots, hyperparameters and step counter of an optimizer for the given variables, unless they exist,
+    as its first update would. Compiled update steps then never create variables, which tf.function answers with a
+    second trace."""
+    if hasattr(optimizer, "build"):
+        # optimizers of keras >= 2.11
+        optimizer.build(variables)
+    elif hasattr(optimizer, "_create_all_weights"):
+        # OptimizerV2 of tensorflow >= 2.2
+        optimizer._create_all_weights(variables)
+    else:
+        with tf.init_scope():
+            _ = optimizer.iterations
+            optimizer._create_hypers()
+            optimizer._create_slots(variables)
+
+
 def calc_max_memory_usage(model: tf.keras.Model):
     """Calculate memory requirement of a model per sample in bits."""
     layers = extract_layers(model)
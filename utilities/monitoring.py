@@ -6,7 +6,6 @@ import socket
 import simplejson as json
 import os
 import time
-from inspect import getfullargspec as fargs
 
 import gym
 import matplotlib
@@ -16,11 +15,13 @@ import tensorflow as tf
 from gym.spaces import Box
 from matplotlib import animation
 
+from agent.acting import ActStep
 from agent.ppo import PPOAgent
 from models import get_model_type
 from utilities import const
 from utilities.const import PATH_TO_EXPERIMENTS
-from utilities.util import parse_state, add_state_dims, flatten
+from utilities.model_utils import requires_batch_size
+from utilities.util import parse_state, add_state_dims
 from utilities.wrappers import RewardNormalizationWrapper, StateNormalizationWrapper
 
 matplotlib.use('Agg')
@@ -66,9 +67,10 @@ class Monitor:
         """Make n GIFs with the current policy."""
 
         # rebuild model with batch size of 1
-        pi, _, _ = self.agent.model_builder(self.env,
-                                            **({"bs": 1} if "bs" in fargs(self.agent.model_builder).args else {}))
+        pi, _, _ = self.agent.model_builder(self.env, self.agent.distribution,
+                                            **({"bs": 1} if requires_batch_size(self.agent.model_builder) else {}))
         pi.set_weights(self.agent.policy.get_weights())
+        act_step = ActStep(pi, self.agent.distribution, with_value=False)
 
         for j in range(n):
             episode_letter = chr(97 + j)
@@ -76,12 +78,12 @@ class Monitor:
             # collect an episode
             done = False
             frames = []
+            act_step.reset_states()
             state = parse_state(self.env.reset())
             while not done:
                 frames.append(self.env.render(mode="rgb_array"))
 
-                probabilities = flatten(pi.predict(add_state_dims(state, dims=2 if self.agent.is_recurrent else 1)))
-                action, _ = self.agent.distribution.act(*probabilities)
+                action = act_step(add_state_dims(state, dims=1))[0][0]
                 observation, reward, done, _ = self.env.step(
                     numpy.atleast_1d(action) if self.continuous_control else action)
                 state = parse_state(observation)
@@ -133,6 +135,7 @@ class Monitor:
                 GAE_lambda=str(self.agent.lam),
                 gradient_clipping=str(self.agent.gradient_clipping),
                 clip_values=str(self.agent.clip_values),
+                target_kl=str(self.agent.target_kl),
                 reward_norming=str(RewardNormalizationWrapper in self.agent.preprocessor),
                 state_norming=str(StateNormalizationWrapper in self.agent.preprocessor),
                 TBPTT_sequence_length=str(self.agent.tbptt_length),
@@ -157,7 +160,11 @@ class Monitor:
             entropies=[round(v, 4) if v is not None else v for v in self.agent.entropy_history],
             vloss=[round(v, 4) if v is not None else v for v in self.agent.value_loss_history],
             ploss=[round(v, 4) if v is not None else v for v in self.agent.policy_loss_history],
-            preprocessors=self.agent.preprocessor_stat_history
+            kl=[round(v, 6) if v is not None else v for v in self.agent.kl_history],
+            epochs=self.agent.epochs_history,
+            preprocessors=self.agent.preprocessor_stat_history,
+            worker_memory=self.agent.worker_memory_history,
+            recycled_workers=self.agent.recycled_workers_history
         )
 
         with open(f"{self.story_directory}/progress.json", "w") as f:
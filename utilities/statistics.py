@@ -1,4 +1,8 @@
+from typing import List
+
+import numpy as np
 from numpy import ndarray as arr
+from scipy.stats import t
 
 
 def increment_mean_var(old_mean: arr, old_var: arr, new_mean: arr, new_var: arr, n: int, other_n: int = 1):
@@ -16,3 +20,16 @@ def increment_mean_var(old_mean: arr, old_var: arr, new_mean: arr, new_var: arr,
     variance = m2 / (n + other_n - 1)
 
     return mean, variance
+
+
+def mean_confidence_interval_width(samples: List[float], confidence: float = 0.95) -> float:
+    """Width of the confidence interval of the mean of the given samples, based on Student's t-distribution.
+
+    Infinite for less than two samples."""
+    n = len(samples)
+    if n < 2:
+        return float("inf")
+
+    standard_error = np.std(samples, ddof=1) / np.sqrt(n)
+
+    return 2 * t.ppf((1 + confidence) / 2, n - 1) * standard_error
@@ -61,6 +61,16 @@ def env_extract_dims(env: gym.Env) -> Tuple[Union[int, Tuple[int]], int]:
     return obs_dim, act_dim
 
 
+def env_extract_state_dtypes(env: gym.Env) -> Union[numpy.dtype, Tuple[numpy.dtype]]:
+    """Returns the dtype(s) in which the states of an environment are kept, as returned by parse_state. All inputs are
+    float32, except for images in multi input states, which stay uint8."""
+    if isinstance(env.observation_space, Dict) and isinstance(env.observation_space["observation"], gym.spaces.Tuple):
+        return tuple(numpy.dtype(numpy.uint8) if field.dtype == numpy.uint8 else numpy.dtype(numpy.float32)
+                     for field in env.observation_space["observation"])
+
+    return numpy.dtype(numpy.float32)
+
+
 def normalize(x, is_img=False) -> numpy.ndarray:
     """Normalize a numpy array to have all values in range (0, 1)."""
     x = tf.convert_to_tensor(x).numpy()
@@ -78,7 +88,8 @@ def is_array_collection(a: numpy.ndarray) -> bool:
 
 
 def parse_state(state: Union[numpy.ndarray, dict]) -> Union[numpy.ndarray, Tuple]:
-    """Parse a state (array or array of arrays) received from an environment to have type float32."""
+    """Parse a state (array or array of arrays) received from an environment to have type float32. Images (uint8) in
+    multi input states keep their type, they are only converted inside the model."""
     if not isinstance(state, dict):
         return state.astype(numpy.float32)
     else:
@@ -87,7 +98,8 @@ def parse_state(state: Union[numpy.ndarray, dict]) -> Union[numpy.ndarray, Tuple
             return observation
         else:
             # multi input state like shadowhand
-            return tuple(map(lambda x: x.astype(numpy.float32), state["observation"]))
+            return tuple(map(lambda x: x if x.dtype == numpy.uint8 else x.astype(numpy.float32),
+                             state["observation"]))
 
 
 def add_state_dims(state: Union[numpy.ndarray, Tuple], dims: int = 1, axis: int = 0) -> Union[numpy.ndarray, Tuple]:
@@ -116,19 +128,6 @@ def insert_unknown_shape_dimensions(shape, none_replacer: int = 1):
     return tuple(map(lambda s: none_replacer if s is None else s, shape))
 
 
-def detect_finished_episodes(action_log_probabilities: tf.Tensor):
-    """Detect which samples in the batch connect to a episode that finished during the subsequence, based on the action
-    log probabilities and return a 1D boolean tensor.
-
-    Input Shape:
-        action_probabilities: (B, S)
-    """
-    # TODO wont work for episodes that finish exactly at end of sequence
-    # need to check only last one, as checking any might catch (albeit unlikely) true 0 in the sequence
-    finished = action_log_probabilities[:, -1] == 0
-    return finished
-
-
 if __name__ == "__main__":
     import os
 
@@ -90,6 +90,28 @@ class BaseWrapper(abc.ABC):
         """Deduce the given number from the sample counter."""
         self.n = self.n - deduction
 
+    def carry_episode_state(self, previous: "BaseWrapper"):
+        """Take over the state of a running episode, but not the statistics, from a previous wrapper of the same type,
+        s.t. the episode can be continued by this wrapper."""
+        pass
+
+    @staticmethod
+    def from_branches(branches: List["BaseWrapper"], origin: "BaseWrapper"):
+        """Merge wrappers that were all branched off from the same origin wrapper into one new wrapper.
+
+        Every branch carries the samples of the origin, hence they are deducted from the merged wrapper for all but one
+        branch to not overcount them."""
+        old_ns = [w.n for w in origin]
+        old_n = origin.n
+
+        merged = BaseWrapper.from_collection(branches)
+        for i, w in enumerate(merged):
+            w.correct_sample_size((len(branches) - 1) * old_ns[i])
+        if isinstance(merged, CombiWrapper):
+            merged.n = np.copy(merged.n) - (len(branches) - 1) * old_n
+
+        return merged
+
 
 class BaseRunningMeanWrapper(BaseWrapper, abc.ABC):
     """Abstract base class for wrappers implementing a running mean over some statistic."""
@@ -200,9 +222,14 @@ class StateNormalizationWrapper(BaseRunningMeanWrapper):
         if not isinstance(o, Tuple):
             o = (o,)
 
-        normed_o = []
-        for i, op in enumerate(filter(lambda a: len(a.shape) == 1, o)):
-            normed_o.append(np.clip((op - self.mean[i]) / (np.sqrt(self.variance[i] + EPSILON)), -10., 10.))
+        normed_o, i = [], 0
+        for op in o:
+            if len(op.shape) == 1:
+                normed_o.append(np.clip((op - self.mean[i]) / (np.sqrt(self.variance[i] + EPSILON)), -10., 10.))
+                i += 1
+            else:
+                # images are passed through in their original type, the model normalizes them itself
+                normed_o.append(op)
 
         normed_o = normed_o[0] if len(normed_o) == 1 else tuple(normed_o)
         return normed_o, r, done, info
@@ -252,6 +279,10 @@ class RewardNormalizationWrapper(BaseRunningMeanWrapper):
 
         return o, r, done, info
 
+    def carry_episode_state(self, previous: "RewardNormalizationWrapper"):
+        """Continue the discounted return of the running episode."""
+        self.ret = previous.ret
+
     def warmup(self, env: gym.Env, observations=10):
         """Warmup the wrapper by randomly stepping the environment through action space sampling."""
         env = gym.make(env.unwrapped.spec.id)  # make new to not interfere with original when stepping
@@ -323,6 +354,11 @@ class CombiWrapper(BaseWrapper, object):
         for wrapper in self.wrappers:
             wrapper.correct_sample_size(deduction)
 
+    def carry_episode_state(self, previous: "CombiWrapper"):
+        """Carry over the episode states of all wrappers in this combi."""
+        for wrapper, previous_wrapper in zip(self.wrappers, previous.wrappers):
+            wrapper.carry_episode_state(previous_wrapper)
+
     def warmup(self, env: gym.Env, observations=10):
         """Warm up all contained wrappers."""
         for w in self.wrappers: